@@ -1,9 +1,29 @@
-from django.contrib import admin
-from .models import Concepto, Cargo, Documento, Pago, PagoDetalle, DocumentoArchivo
+from django.contrib import admin, messages
+from .models import Concepto, Cargo, Documento, Pago, PagoDetalle, DocumentoArchivo, WebhookEvento
+from .recibos import programar_recibos_lote
 
 admin.site.register(Concepto)
 admin.site.register(Cargo)
-admin.site.register(Documento)
 admin.site.register(Pago)
 admin.site.register(PagoDetalle)
 admin.site.register(DocumentoArchivo)
+admin.site.register(WebhookEvento)
+
+
+@admin.register(Documento)
+class DocumentoAdmin(admin.ModelAdmin):
+    list_display = ("id", "numero", "fecha", "tipo", "total", "condominio")
+    search_fields = ("numero",)
+    list_filter = ("condominio", "tipo", "fecha")
+    actions = ["generar_recibos_pdf"]
+
+    @admin.action(description="Generar PDF de recibos seleccionados (en segundo plano)")
+    def generar_recibos_pdf(self, request, queryset):
+        # El lote corre fuera del request; un periodo completo: manage.py generar_recibos_periodo
+        n = programar_recibos_lote(queryset.values_list("id", flat=True))
+        self.message_user(
+            request,
+            f"{n} recibos encolados; los PDF se generan en segundo plano (ver el log). "
+            "Para el cierre de un periodo completo use 'manage.py generar_recibos_periodo'.",
+            messages.INFO,
+        )
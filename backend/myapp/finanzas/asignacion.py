@@ -0,0 +1,177 @@
+# myapp/finanzas/asignacion.py
+"""
+Asignación automática FIFO de pagos a los cargos abiertos de una unidad.
+
+El cliente manda unidad y monto; el servidor reparte el monto entre los
+cargos con saldo, del periodo más antiguo al más nuevo. Los saldos (monto
++ recargo - pagado) salen de estado_cuenta (0008), que los mantiene por
+trigger: una consulta sobre ix_ec_unidad_periodo para todas las unidades
+del lote, sin armar el estado de cuenta en Python. Antes de leerlos se
+bloquean esos cargos (FOR UPDATE, en orden de id): dos cajeros que cobran
+a la misma unidad se serializan y el segundo ve el saldo ya descontado.
+
+Documentos, pagos y detalles se insertan en bloque; el trigger por
+sentencia de pagos_detalle recalcula una vez los cargos afectados.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Documento, Pago, PagoDetalle
+from .recibos import programar_recibo
+from .services import formato_numero, reservar_numeros
+
+CERO = Decimal("0.00")
+
+SQL_BLOQUEAR = """
+SELECT c.id
+  FROM public.estado_cuenta ec
+  JOIN public.cargos c ON c.id = ec.cargo_id
+ WHERE ec.unidad_id = ANY(%s) AND ec.saldo > 0 AND ec.estado_registrado <> 'ANULADO'
+ ORDER BY c.id
+   FOR UPDATE OF c
+"""
+
+SQL_ABIERTOS = """
+SELECT unidad_id, cargo_id, periodo, saldo
+  FROM public.estado_cuenta
+ WHERE unidad_id = ANY(%s) AND saldo > 0 AND estado_registrado <> 'ANULADO'
+ ORDER BY unidad_id, periodo, cargo_id
+"""
+
+
+class AsignacionError(Exception):
+    """Alguna solicitud no se pudo asignar; 'errores' va alineado con las solicitudes ({} si estaba bien)."""
+
+    def __init__(self, errores):
+        super().__init__("No se pudieron asignar los pagos")
+        self.errores = errores
+
+
+def saldos_abiertos(unidad_ids, bloquear=True):
+    """
+    {unidad_id: [[cargo_id, periodo, saldo], ...]} de cargos con saldo, el
+    más antiguo primero. Con bloquear=True (dentro de una transacción) los
+    cargos quedan bloqueados hasta el commit y el saldo se lee después.
+    """
+    ids = sorted({int(u) for u in unidad_ids})
+    abiertos = defaultdict(list)
+    if not ids:
+        return abiertos
+    with connection.cursor() as cur:
+        if bloquear:
+            cur.execute(SQL_BLOQUEAR, [ids])
+        cur.execute(SQL_ABIERTOS, [ids])
+        for unidad_id, cargo_id, periodo, saldo in cur.fetchall():
+            abiertos[unidad_id].append([cargo_id, periodo, saldo])
+    return abiertos
+
+
+def repartir(monto, abiertos):
+    """
+    Reparte 'monto' FIFO sobre 'abiertos' (de saldos_abiertos) y descuenta
+    lo aplicado, así varios pagos de la misma unidad en un lote no cubren
+    dos veces el mismo saldo. Devuelve ([(cargo_id, periodo, aplicado)], resto).
+    """
+    detalles, resto = [], monto
+    for cargo in abiertos:
+        if resto <= 0:
+            break
+        aplicado = min(resto, cargo[2])
+        if aplicado <= 0:
+            continue
+        cargo[2] -= aplicado
+        resto -= aplicado
+        detalles.append((cargo[0], cargo[1], aplicado))
+    return detalles, resto
+
+
+def asignar_pagos(solicitudes, medio, generar_documento=True, tipo_documento="RECIBO", moneda="BOB",
+                  simular=False):
+    """
+    solicitudes: [{"unidad_id", "monto", "medio"?}]. Crea un Pago por
+    solicitud con sus PagoDetalle repartidos FIFO. Si alguna no se puede
+    asignar (unidad inexistente, sin deuda o monto mayor que la deuda)
+    levanta AsignacionError y no se crea nada. Con simular=True solo
+    calcula el reparto, sin bloquear ni escribir.
+    Devuelve una lista (en el orden de 'solicitudes') de
+    {pago, documento, unidad_id, unidad, monto, medio, estado, detalles}.
+    """
+    from myapp.propiedades.models import Unidad
+
+    unidades = {
+        u[0]: u for u in
+        Unidad.objects.filter(id__in={s["unidad_id"] for s in solicitudes}).values_list("id", "condominio_id", "codigo")
+    }
+    with transaction.atomic():
+        abiertos = saldos_abiertos(unidades, bloquear=not simular)
+        repartos, errores = [], []
+        for s in solicitudes:
+            unidad = unidades.get(s["unidad_id"])
+            if unidad is None:
+                errores.append({"unidad_id": [f"La unidad {s['unidad_id']} no existe."]})
+                repartos.append(None)
+                continue
+            deuda = sum((c[2] for c in abiertos[unidad[0]]), CERO)
+            detalles, resto = repartir(s["monto"], abiertos[unidad[0]])
+            if not detalles:
+                errores.append({"monto": ["La unidad no tiene cargos con saldo."]})
+            elif resto > 0:
+                errores.append({"monto": [f"El monto excede la deuda de la unidad ({deuda})."]})
+            else:
+                errores.append({})
+            repartos.append((s, unidad, detalles))
+        if any(errores):
+            raise AsignacionError(errores)
+
+        resultado = [
+            {
+                "pago": None, "documento": None, "unidad_id": unidad[0], "unidad": unidad[2],
+                "monto": s["monto"], "medio": s.get("medio") or medio,
+                # EFECTIVO => APROBADO inmediato; otros => PENDIENTE (como pagos/registrar/)
+                "estado": "APROBADO" if (s.get("medio") or medio) == "EFECTIVO" else "PENDIENTE",
+                "detalles": [{"cargo": c, "periodo": p, "monto_aplicado": m} for c, p, m in detalles],
+            }
+            for s, unidad, detalles in repartos
+        ]
+        if simular:
+            return resultado
+
+        documentos = [None] * len(resultado)
+        if generar_documento:
+            documentos = _crear_documentos(resultado, [u for _, u, _ in repartos], tipo_documento, moneda)
+        pagos = Pago.objects.bulk_create([
+            Pago(documento=doc, monto=r["monto"], medio=r["medio"], estado=r["estado"])
+            for doc, r in zip(documentos, resultado)
+        ])
+        # Un INSERT: el trigger por sentencia recalcula los cargos una vez
+        PagoDetalle.objects.bulk_create([
+            PagoDetalle(pago=pago, cargo_id=d["cargo"], monto_aplicado=d["monto_aplicado"])
+            for pago, r in zip(pagos, resultado) for d in r["detalles"]
+        ], batch_size=5000)
+
+        for pago, doc, r in zip(pagos, documentos, resultado):
+            r["pago"] = pago.id
+            r["documento"] = doc.numero if doc else None
+            if doc and r["estado"] == "APROBADO":
+                programar_recibo(doc.id)
+    return resultado
+
+
+def _crear_documentos(resultado, unidades, tipo, moneda):
+    """Un rango de numeración por condominio (un UPSERT cada uno) y un bulk_create."""
+    anio = timezone.localdate().year
+    por_condominio = defaultdict(list)
+    for i, unidad in enumerate(unidades):
+        por_condominio[unidad[1]].append(i)
+    numeros = {}
+    for condominio_id, indices in sorted(por_condominio.items()):
+        ultimo = reservar_numeros(condominio_id, anio, "R", len(indices))
+        for k, i in enumerate(indices):
+            numeros[i] = formato_numero("R", anio, ultimo - len(indices) + 1 + k)
+    return Documento.objects.bulk_create([
+        Documento(numero=numeros[i], total=r["monto"], tipo=tipo, moneda=moneda, condominio_id=unidades[i][1])
+        for i, r in enumerate(resultado)
+    ])
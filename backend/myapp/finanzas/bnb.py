@@ -0,0 +1,286 @@
+# myapp/finanzas/bnb.py
+"""
+Cliente de la API del BNB (QR Simple) configurado desde settings.BNB_CFG.
+
+Todo lo costoso se comparte por proceso entre las instancias de BNBClient:
+- una requests.Session con pool keep-alive (no se abre conexión por llamada);
+- el token de autenticación, que se renueva antes de vencer (un solo hilo
+  lo pide, el resto espera);
+- un circuit breaker: tras N fallas seguidas deja de llamar al banco durante
+  un enfriamiento y responde BNBNoDisponible de inmediato, en vez de tener
+  el worker bloqueado hasta el timeout.
+Los reintentos son acotados, con backoff exponencial y jitter completo, y
+solo se reintenta lo que es seguro repetir.
+"""
+import base64
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RUTA_TOKEN = "/ClientAuthentication.API/api/v1/auth/token"
+RUTA_QR_CREAR = "/QRSimple.API/api/v1/main/getQRWithImageAsync"
+RUTA_QR_ESTADO = "/QRSimple.API/api/v1/main/getQRStatusAsync"
+
+# Margen para renovar el token antes de su vencimiento
+MARGEN_TOKEN = 60
+# Vigencia asumida si el token no trae 'exp'
+VIGENCIA_TOKEN = 50 * 60
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+class BNBClientError(Exception):
+    """Error al hablar con el BNB (red, HTTP o respuesta inválida)."""
+
+
+class BNBNoDisponible(BNBClientError):
+    """El circuit breaker está abierto: no se intenta la llamada."""
+
+
+def _cfg(clave, defecto=None):
+    valor = (getattr(settings, "BNB_CFG", None) or {}).get(clave)
+    return defecto if valor in (None, "") else valor
+
+
+# -------------------------------
+# Circuit breaker
+# -------------------------------
+class CircuitBreaker:
+    """
+    cerrado -> abierto tras 'umbral' fallas seguidas; abierto -> semiabierto
+    pasado 'enfriamiento' (deja pasar una sola llamada de prueba); la prueba
+    exitosa lo cierra y una fallida lo vuelve a abrir.
+    """
+
+    def __init__(self, umbral, enfriamiento):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.fallas = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.abierto_desde is None:
+            return "cerrado"
+        if time.monotonic() - self.abierto_desde >= self.enfriamiento:
+            return "semiabierto"
+        return "abierto"
+
+    def permitir(self):
+        with self._lock:
+            estado = self.estado
+            if estado == "cerrado":
+                return True
+            if estado == "semiabierto" and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self.fallas = 0
+            self.abierto_desde = None
+            self._prueba_en_curso = False
+
+    def falla(self):
+        with self._lock:
+            self.fallas += 1
+            if self._prueba_en_curso or self.fallas >= self.umbral:
+                if self.abierto_desde is None or self._prueba_en_curso:
+                    logger.warning("BNB: circuit breaker abierto tras %s fallas", self.fallas)
+                self.abierto_desde = time.monotonic()
+            self._prueba_en_curso = False
+
+
+# -------------------------------
+# Estado compartido por proceso
+# -------------------------------
+_lock = threading.Lock()
+_sesion = None
+_breaker = None
+_token = {"valor": None, "vence": 0.0}
+_token_lock = threading.Lock()
+
+
+def _get_sesion():
+    global _sesion
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                pool = int(_cfg("POOL", 20))
+                s = requests.Session()
+                # Reintentos propios (con jitter) en _llamar: el adapter no reintenta
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool, max_retries=0)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+                _sesion = s
+    return _sesion
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    int(_cfg("BREAKER_FALLAS", 5)), float(_cfg("BREAKER_ENFRIAMIENTO", 30))
+                )
+    return _breaker
+
+
+def reiniciar_estado():
+    """Descarta sesión, token y breaker del proceso (tests, cambio de credenciales)."""
+    global _sesion, _breaker
+    with _lock:
+        if _sesion is not None:
+            _sesion.close()
+        _sesion = None
+        _breaker = None
+    with _token_lock:
+        _token.update(valor=None, vence=0.0)
+
+
+def _vencimiento_jwt(token):
+    """'exp' del JWT sin verificar firma (solo para saber cuándo renovarlo)."""
+    try:
+        cuerpo = token.split(".")[1]
+        cuerpo += "=" * (-len(cuerpo) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(cuerpo))["exp"])
+    except Exception:
+        return time.time() + VIGENCIA_TOKEN
+
+
+class BNBClient:
+    """
+    Operaciones QR Simple. Las instancias son livianas: sesión, token y
+    breaker viven a nivel de proceso.
+    """
+
+    def __init__(self):
+        self.auth_base = (_cfg("AUTH_BASE") or "").rstrip("/")
+        self.qr_base = (_cfg("QR_BASE") or "").rstrip("/")
+        self.timeout = (float(_cfg("CONNECT_TIMEOUT", 3)), float(_cfg("TIMEOUT", 15)))
+        self.reintentos = int(_cfg("RETRIES", 2))
+        self.backoff = float(_cfg("BACKOFF", 0.2))
+        if not self.auth_base or not self.qr_base:
+            raise BNBClientError("BNB_CFG incompleto: faltan AUTH_BASE/QR_BASE")
+
+    # --------- HTTP ----------
+    def _llamar(self, url, payload, token=None, idempotente=True):
+        """
+        POST JSON con breaker y reintentos. Sin 'idempotente' solo se reintenta
+        si la conexión no llegó a establecerse (el banco no recibió nada).
+        """
+        import requests
+
+        breaker = get_breaker()
+        if not breaker.permitir():
+            raise BNBNoDisponible("BNB no disponible (circuit breaker abierto)")
+
+        headers = {"Authorization": f"Bearer {token}"} if token else None
+        intento = 0
+        while True:
+            try:
+                r = _get_sesion().post(url, json=payload, headers=headers, timeout=self.timeout)
+                reintentable = r.status_code in ESTADOS_REINTENTABLES and idempotente
+                if not reintentable:
+                    if r.status_code >= 500:
+                        breaker.falla()
+                    else:
+                        breaker.exito()
+                    return r
+                error = BNBClientError(f"BNB HTTP {r.status_code}")
+            except requests.ConnectionError as e:
+                # ConnectTimeout hereda de ConnectionError: el pedido no salió
+                error = BNBClientError(f"BNB sin conexión: {e}")
+            except requests.Timeout as e:
+                error = BNBClientError(f"BNB no respondió a tiempo: {e}")
+                if not idempotente:
+                    breaker.falla()
+                    raise error
+            except requests.RequestException as e:
+                breaker.falla()
+                raise BNBClientError(f"BNB error de red: {e}")
+
+            if intento >= self.reintentos:
+                breaker.falla()
+                raise error
+            intento += 1
+            time.sleep(random.uniform(0, self.backoff * (2 ** intento)))
+
+    @staticmethod
+    def _json(r):
+        try:
+            data = r.json()
+        except ValueError:
+            raise BNBClientError(f"BNB respondió HTTP {r.status_code} sin JSON")
+        if r.status_code >= 400:
+            raise BNBClientError(f"BNB HTTP {r.status_code}: {data.get('message') or data}")
+        return data
+
+    # --------- Token ----------
+    def _token(self, forzar=False):
+        ahora = time.time()
+        if not forzar and _token["valor"] and ahora < _token["vence"] - MARGEN_TOKEN:
+            return _token["valor"]
+        with _token_lock:
+            # Otro hilo pudo renovarlo mientras esperábamos el lock
+            if not forzar and _token["valor"] and time.time() < _token["vence"] - MARGEN_TOKEN:
+                return _token["valor"]
+            r = self._llamar(
+                self.auth_base + RUTA_TOKEN,
+                {"accountId": _cfg("ACCOUNT_ID"), "authorizationId": _cfg("AUTHORIZATION_ID")},
+            )
+            data = self._json(r)
+            valor = data.get("message") if data.get("success", True) else None
+            if not valor:
+                raise BNBClientError(f"BNB no entregó token: {data}")
+            _token.update(valor=valor, vence=_vencimiento_jwt(valor))
+            return valor
+
+    def _llamar_autenticado(self, url, payload, idempotente=True):
+        r = self._llamar(url, payload, token=self._token(), idempotente=idempotente)
+        if r.status_code == 401:
+            # Token revocado antes de tiempo: se renueva una vez
+            r = self._llamar(url, payload, token=self._token(forzar=True), idempotente=idempotente)
+        return self._json(r)
+
+    # --------- QR Simple ----------
+    def qr_simple_create(self, currency, gloss, amount, single_use=True, expiration_date=None,
+                         additional_data=None):
+        payload = {
+            "currency": currency,
+            "gloss": gloss,
+            "amount": str(amount),
+            "singleUse": bool(single_use),
+            "expirationDate": expiration_date,
+            "additionalData": additional_data or gloss,
+            "destinationAccountId": "1",
+        }
+        data = self._llamar_autenticado(self.qr_base + RUTA_QR_CREAR, payload, idempotente=False)
+        if data.get("success") is False:
+            raise BNBClientError(data.get("message") or "BNB rechazó la creación del QR")
+        return data
+
+    def qr_simple_status(self, qr_id):
+        data = self._llamar_autenticado(self.qr_base + RUTA_QR_ESTADO, {"qrId": qr_id})
+        if data.get("success") is False:
+            raise BNBClientError(data.get("message") or "BNB no devolvió el estado del QR")
+        return data
+
+
+def codigo_estado_qr(data):
+    """Código de estado del QR (1=No usado, 2=Usado, 3=Expirado, 4=Con error) o None."""
+    code = data.get("statusQRCode") or data.get("qrId") or data.get("status") or data.get("qrIdStatus")
+    return int(code) if str(code).isdigit() else None
@@ -0,0 +1,156 @@
+# myapp/finanzas/bnb_fake.py
+"""
+Servidor HTTP local que imita las rutas de QR Simple del BNB que usa
+finanzas/bnb.py. Sirve para desarrollo, pruebas y benchmarks de carga sin
+tocar el banco: latencia y tasa de errores configurables, tokens con 'exp'
+y QRs que pasan a "usado" solos (pagar_tras) o con POST /fake/pagar.
+"""
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .bnb import RUTA_QR_CREAR, RUTA_QR_ESTADO, RUTA_TOKEN
+
+# 1x1 PNG para cuando no está 'qrcode'
+PNG_MINIMO = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR4nGNgAAAAAgAB4iG8MwAAAABJRU5ErkJggg=="
+)
+
+
+def _token_falso(ttl):
+    def b64(d):
+        return base64.urlsafe_b64encode(json.dumps(d).encode()).decode().rstrip("=")
+    return f"{b64({'alg': 'none'})}.{b64({'exp': int(time.time() + ttl), 'jti': uuid.uuid4().hex})}.x"
+
+
+class FakeBNBServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Los clientes de carga abren muchas conexiones a la vez
+    request_queue_size = 128
+
+    def __init__(self, direccion, latencia=0.0, tasa_error=0.0, token_ttl=3600, pagar_tras=None):
+        super().__init__(direccion, _Handler)
+        self.latencia = latencia
+        self.tasa_error = tasa_error
+        self.token_ttl = token_ttl
+        self.pagar_tras = pagar_tras
+        self.tokens = set()
+        self.qrs = {}
+        self.contador = {"token": 0, "crear": 0, "estado": 0, "errores": 0, "conexiones": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # Headers y cuerpo en un solo segmento: sin Nagle + ACK diferido (~40 ms por pedido)
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.contador["conexiones"] += 1
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _responder(self, status, data):
+        cuerpo = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_POST(self):
+        srv = self.server
+        largo = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(largo) or b"{}")
+        except ValueError:
+            return self._responder(400, {"success": False, "message": "JSON inválido"})
+
+        if srv.latencia:
+            time.sleep(srv.latencia)
+        if srv.tasa_error and random.random() < srv.tasa_error:
+            with srv._lock:
+                srv.contador["errores"] += 1
+            return self._responder(503, {"success": False, "message": "servicio no disponible"})
+
+        if self.path == RUTA_TOKEN:
+            if not data.get("accountId") or not data.get("authorizationId"):
+                return self._responder(401, {"success": False, "message": "credenciales inválidas"})
+            token = _token_falso(srv.token_ttl)
+            with srv._lock:
+                srv.tokens.add(token)
+                srv.contador["token"] += 1
+            return self._responder(200, {"success": True, "message": token})
+
+        if self.path == "/fake/pagar":
+            with srv._lock:
+                qr = srv.qrs.get(str(data.get("qrId")))
+                if qr:
+                    qr["estado"] = 2
+            return self._responder(200 if qr else 404, {"success": bool(qr)})
+
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or auth[7:] not in srv.tokens:
+            return self._responder(401, {"success": False, "message": "token inválido"})
+
+        if self.path == RUTA_QR_CREAR:
+            qr_id = str(uuid.uuid4().int % 10 ** 10)
+            try:
+                import qrcode
+                from io import BytesIO
+                buff = BytesIO()
+                qrcode.make(f"BNB-FAKE:{qr_id}:{data.get('amount')}").save(buff)
+                png = buff.getvalue()
+            except Exception:
+                png = PNG_MINIMO
+            with srv._lock:
+                srv.qrs[qr_id] = {"estado": 1, "creado": time.time(), "datos": data}
+                srv.contador["crear"] += 1
+            return self._responder(200, {
+                "id": qr_id, "qr": base64.b64encode(png).decode(), "success": True, "message": "",
+            })
+
+        if self.path == RUTA_QR_ESTADO:
+            qr_id = str(data.get("qrId"))
+            with srv._lock:
+                srv.contador["estado"] += 1
+                qr = srv.qrs.get(qr_id)
+                if qr and qr["estado"] == 1 and srv.pagar_tras is not None \
+                        and time.time() - qr["creado"] >= srv.pagar_tras:
+                    qr["estado"] = 2
+            if not qr:
+                return self._responder(200, {"success": False, "message": "QR no existe"})
+            return self._responder(200, {
+                "id": qr_id, "statusQRCode": qr["estado"], "success": True, "message": "",
+            })
+
+        return self._responder(404, {"success": False, "message": "ruta desconocida"})
+
+
+def iniciar_fake_bnb(host="127.0.0.1", puerto=0, **opciones):
+    """Levanta el servidor falso en un hilo daemon; devuelve el servidor (ver .base_url)."""
+    srv = FakeBNBServer((host, puerto), **opciones)
+    threading.Thread(target=srv.serve_forever, name="fake-bnb", daemon=True).start()
+    return srv
+
+
+def cfg_para(srv, **extra):
+    """BNB_CFG apuntando al servidor falso."""
+    return {
+        "ACCOUNT_ID": "fake", "AUTHORIZATION_ID": "fake",
+        "AUTH_BASE": srv.base_url, "QR_BASE": srv.base_url,
+        "TIMEOUT": 5, **extra,
+    }
@@ -0,0 +1,135 @@
+# myapp/finanzas/bnb_poller.py
+"""
+Consulta centralizada de QRs BNB pendientes.
+
+En vez de que cada cliente que hace polling dispare una llamada al banco,
+un proceso (comando poll_bnb) toma por ciclo todos los PagoIntento BNB en
+EN_PROCESO, consulta sus estados en paralelo (asyncio + semáforo, sobre el
+BNBClient compartido: mismo pool, token y breaker) y aplica los cambios en
+bloque. Las vistas solo leen la fila local. El tráfico al banco crece con
+los intentos pendientes, no con la frecuencia de refresco de los clientes.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import intento_blobs
+from .bnb import BNBClient, BNBClientError, BNBNoDisponible, codigo_estado_qr
+from .models import PagoIntento
+from .transiciones import transicionar_intentos, transicionar_pagos
+
+logger = logging.getLogger(__name__)
+
+ESTADO_POR_CODIGO = {2: "APROBADO", 3: "EXPIRO", 4: "RECHAZADO"}
+
+
+def intentos_pendientes(limite=None):
+    """Intentos BNB en curso, los consultados hace más tiempo primero."""
+    qs = (
+        PagoIntento.objects
+        .filter(pasarela="BNB", estado="EN_PROCESO", bnb_qr_id__isnull=False)
+        .exclude(bnb_qr_id="")
+        .only("id", "pago_id", "bnb_qr_id", "estado", "bnb_status_code", "actualizado_en")
+        .order_by("actualizado_en", "id")
+    )
+    return list(qs[:limite] if limite else qs)
+
+
+async def _consultar(intentos, concurrencia):
+    cliente = BNBClient()
+    semaforo = asyncio.Semaphore(concurrencia)
+    loop = asyncio.get_running_loop()
+    # Executor propio: el por defecto se limita a núcleos + 4 hilos
+    with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="poll-bnb") as executor:
+
+        async def uno(intento):
+            async with semaforo:
+                try:
+                    data = await loop.run_in_executor(executor, cliente.qr_simple_status, intento.bnb_qr_id)
+                    return intento, data
+                except BNBNoDisponible:
+                    raise
+                except BNBClientError as e:
+                    return intento, e
+
+        return await asyncio.gather(*(uno(i) for i in intentos))
+
+
+def consultar_estados(intentos, concurrencia=10):
+    """[(intento, status_data | BNBClientError)]; corta todo si el breaker se abre."""
+    if not intentos:
+        return []
+    return asyncio.run(_consultar(intentos, max(1, concurrencia)))
+
+
+def aplicar_resultados(resultados):
+    """
+    Persiste los estados consultados en bloque:
+    - un bulk_update de bnb_status_code de todos los intentos y un upsert
+      de sus bnb_payload en el side store (intento_blobs);
+    - un UPDATE condicional por estado final de intentos;
+    - los pagos aprobados en una sola transición (transiciones.py): solo
+      los que no lo estaban recalculan cargos y programan recibo.
+    Devuelve conteos por resultado (solo transiciones efectivas).
+    """
+    ahora = timezone.now()
+    consultados = []
+    payloads = []
+    por_estado = defaultdict(list)
+    errores = 0
+    for intento, data in resultados:
+        if isinstance(data, Exception):
+            errores += 1
+            continue
+        codigo = codigo_estado_qr(data)
+        intento.bnb_status_code = codigo
+        intento.actualizado_en = ahora
+        consultados.append(intento)
+        payloads.append((intento, "bnb_payload", data))
+        if codigo in ESTADO_POR_CODIGO:
+            por_estado[ESTADO_POR_CODIGO[codigo]].append(intento)
+
+    stats = {"consultados": len(consultados), "errores": errores, "aprobados": 0, "expirados": 0, "rechazados": 0}
+    if not consultados:
+        return stats
+
+    with transaction.atomic():
+        PagoIntento.objects.bulk_update(
+            consultados, ["bnb_status_code", "actualizado_en"], batch_size=500
+        )
+        intento_blobs.guardar_muchos(payloads)
+        cambiados = {}
+        for estado, intentos in por_estado.items():
+            ganados = set(transicionar_intentos([i.id for i in intentos], estado))
+            cambiados[estado] = len(ganados)
+            for i in intentos:
+                if i.id in ganados:
+                    i.estado = estado
+        # Idempotente: si el webhook o el cajero ya aprobaron el pago, no se repite nada
+        transicionar_pagos([i.pago_id for i in por_estado.get("APROBADO", [])], "APROBADO")
+
+    stats["aprobados"] = cambiados.get("APROBADO", 0)
+    stats["expirados"] = cambiados.get("EXPIRO", 0)
+    stats["rechazados"] = cambiados.get("RECHAZADO", 0)
+    return stats
+
+
+def ciclo(concurrencia=10, limite=None):
+    """Un barrido completo: carga pendientes, consulta en paralelo y aplica."""
+    t0 = time.perf_counter()
+    intentos = intentos_pendientes(limite)
+    try:
+        resultados = consultar_estados(intentos, concurrencia)
+    except BNBNoDisponible as e:
+        logger.warning("poll BNB: %s; se reintenta en el próximo ciclo", e)
+        return {"pendientes": len(intentos), "consultados": 0, "errores": len(intentos),
+                "aprobados": 0, "expirados": 0, "rechazados": 0, "segundos": time.perf_counter() - t0}
+    stats = aplicar_resultados(resultados)
+    stats["pendientes"] = len(intentos)
+    stats["segundos"] = time.perf_counter() - t0
+    return stats
@@ -0,0 +1,427 @@
+# myapp/finanzas/conciliacion.py
+"""
+Conciliación de extractos bancarios (CSV u OFX) contra pagos y cargos.
+
+El archivo se lee en streaming (una línea o un <STMTTRN> por vez) y se
+procesa por lotes: por lote hay un puñado de consultas indexadas, no una
+por línea. Cada abono se intenta, en orden:
+1. Pago PENDIENTE con la misma referencia (ref_externa / transaccion_id) o
+   con '#<id>' en la glosa (la de los QR BNB es 'Pago expensas #<id>'), y
+   el mismo monto;
+2. Pago PENDIENTE del mismo monto con fecha dentro de la ventana (solo si
+   hay un único candidato: si hay varios queda como ambiguo);
+3. con condominio: la unidad cuyo código aparece en la referencia/glosa y
+   un cargo abierto con ese saldo (el más antiguo), o la deuda completa de
+   la unidad si el abono la cubre exacto.
+Los pagos conciliados pasan a APROBADO (transiciones.py); los cargos se
+pagan con un Pago TRANSFERENCIA nuevo con documento. Todo lo de un lote se
+aplica en una transacción, con INSERT/UPDATE en bloque.
+"""
+import csv
+import io
+import re
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Cargo, Documento, Pago, PagoDetalle
+from .services import formato_numero, reservar_numeros
+from .transiciones import transicionar_pagos
+
+Movimiento = namedtuple("Movimiento", "linea fecha monto referencia descripcion error", defaults=(None,))
+
+CENTAVO = Decimal("0.01")
+RE_PAGO_ID = re.compile(r"#\s*(\d{1,18})\b")
+RE_TOKEN = re.compile(r"[0-9A-Z]+")
+
+
+# -------------------------------
+# Lectura
+# -------------------------------
+COLUMNAS = {
+    "fecha": ("fecha", "date", "fecha_valor", "fecha_operacion", "fecha_transaccion", "dtposted"),
+    "monto": ("monto", "importe", "amount", "abono", "credito", "haber", "trnamt"),
+    "debito": ("debito", "cargo", "debe", "retiro"),
+    "referencia": ("referencia", "ref", "nro_operacion", "numero_operacion", "transaccion", "fitid", "id"),
+    "descripcion": ("descripcion", "glosa", "concepto", "detalle", "memo", "name"),
+}
+
+
+def _normalizar(nombre):
+    nombre = (nombre or "").strip().lower()
+    for a, b in (("á", "a"), ("é", "e"), ("í", "i"), ("ó", "o"), ("ú", "u"), ("º", ""), ("°", "")):
+        nombre = nombre.replace(a, b)
+    return re.sub(r"[^a-z0-9]+", "_", nombre).strip("_")
+
+
+def parse_monto(texto):
+    """'1.234,56' / '1,234.56' / '1234.5' / '1.234' / '-50' -> Decimal con 2 decimales (o None)."""
+    t = re.sub(r"[^\d,.\-]", "", texto or "")
+    if not re.search(r"\d", t):
+        return None
+    seps = [i for i, c in enumerate(t) if c in ",."]
+    if seps:
+        ultimo = seps[-1]
+        decimales = len(t) - ultimo - 1
+        # Un solo tipo de separador seguido de 3 dígitos: es de miles (montos con 2 decimales)
+        de_miles = len({t[i] for i in seps}) == 1 and (len(seps) > 1 or decimales == 3)
+        entero = re.sub(r"[,.]", "", t[:ultimo])
+        t = entero + t[ultimo + 1:] if de_miles else f"{entero}.{t[ultimo + 1:]}"
+    try:
+        return Decimal(t).quantize(CENTAVO)
+    except InvalidOperation:
+        return None
+
+
+RE_FECHAS = (
+    (re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})"), ("a", "m", "d")),
+    (re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})"), ("d", "m", "a")),
+    (re.compile(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{2})(?!\d)"), ("d", "m", "a2")),
+    (re.compile(r"(\d{4})(\d{2})(\d{2})"), ("a", "m", "d")),
+)
+
+
+def parse_fecha(texto):
+    """aaaa-mm-dd, dd/mm/aaaa, dd-mm-aa o aaaammdd al inicio del texto (lo que sigue se ignora)."""
+    t = (texto or "").strip()
+    for regex, orden in RE_FECHAS:
+        m = regex.match(t)
+        if m:
+            partes = dict(zip(orden, (int(x) for x in m.groups())))
+            anio = partes.get("a") or 2000 + partes["a2"]
+            try:
+                return date(anio, partes["m"], partes["d"])
+            except ValueError:
+                return None
+    return None
+
+
+def _texto(archivo):
+    """Vista de texto sobre un archivo binario (UploadedFile, open(..., 'rb')) sin leerlo entero."""
+    if isinstance(archivo, io.TextIOBase):
+        return archivo
+    return io.TextIOWrapper(getattr(archivo, "file", archivo), encoding="utf-8-sig", errors="replace", newline="")
+
+
+def leer_csv(archivo):
+    """Movimientos de un CSV con encabezado (separador , ; o tab detectado en la primera línea)."""
+    texto = _texto(archivo)
+    primera = texto.readline()
+    delimitador = max((",", ";", "\t", "|"), key=primera.count)
+    encabezado = [_normalizar(c) for c in next(csv.reader([primera], delimiter=delimitador))]
+    indice = {}
+    for campo, alias in COLUMNAS.items():
+        for i, col in enumerate(encabezado):
+            if col in alias:
+                indice.setdefault(campo, i)
+    if "fecha" not in indice or ("monto" not in indice and "debito" not in indice):
+        raise ValueError(f"El CSV no tiene columnas de fecha y monto reconocibles: {encabezado}")
+
+    def col(fila, campo):
+        i = indice.get(campo)
+        return fila[i].strip() if i is not None and i < len(fila) else ""
+
+    for n, fila in enumerate(csv.reader(texto, delimiter=delimitador), start=2):
+        if not any(c.strip() for c in fila):
+            continue
+        fecha = parse_fecha(col(fila, "fecha"))
+        monto = parse_monto(col(fila, "monto"))
+        debito = parse_monto(col(fila, "debito"))
+        if debito:
+            monto = (monto or 0) - abs(debito)
+        error = None if fecha and monto is not None else "linea_invalida"
+        yield Movimiento(n, fecha, monto, col(fila, "referencia") or None, col(fila, "descripcion"), error)
+
+
+RE_OFX_TRN = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.S | re.I)
+RE_OFX_TAG = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+def leer_ofx(archivo, bloque=64 * 1024):
+    """Movimientos <STMTTRN> de un OFX (SGML 1.x o XML 2.x), leyendo de a 'bloque' caracteres."""
+    texto = _texto(archivo)
+    buffer = ""
+    n = 0
+    while True:
+        leido = texto.read(bloque)
+        buffer += leido
+        fin = 0
+        for m in RE_OFX_TRN.finditer(buffer):
+            n += 1
+            tags = {k.upper(): v.strip() for k, v in RE_OFX_TAG.findall(m.group(1))}
+            fecha = parse_fecha(tags.get("DTPOSTED", ""))
+            monto = parse_monto(tags.get("TRNAMT", ""))
+            error = None if fecha and monto is not None else "linea_invalida"
+            descripcion = " ".join(x for x in (tags.get("NAME"), tags.get("MEMO")) if x)
+            yield Movimiento(n, fecha, monto, tags.get("FITID") or tags.get("REFNUM") or None, descripcion, error)
+            fin = m.end()
+        # Solo queda en memoria el bloque <STMTTRN> incompleto
+        buffer = buffer[fin:]
+        inicio = buffer.upper().rfind("<STMTTRN>")
+        buffer = buffer[inicio:] if inicio >= 0 else buffer[-16:]
+        if not leido:
+            return
+
+
+def leer_extracto(archivo, formato=None):
+    """Iterador de Movimiento; 'formato' csv|ofx o se detecta por nombre / primeros bytes."""
+    if not formato:
+        nombre = (getattr(archivo, "name", "") or "").lower()
+        if nombre.endswith((".ofx", ".qfx")):
+            formato = "ofx"
+        elif nombre.endswith((".csv", ".txt")):
+            formato = "csv"
+        else:
+            crudo = getattr(archivo, "file", archivo)
+            inicio = crudo.read(256)
+            crudo.seek(0)
+            inicio = inicio.decode("latin-1") if isinstance(inicio, bytes) else inicio
+            formato = "ofx" if "OFX" in inicio.upper() else "csv"
+    return leer_ofx(archivo) if formato == "ofx" else leer_csv(archivo)
+
+
+# -------------------------------
+# Conciliación
+# -------------------------------
+def _claves_unidad(texto):
+    """Códigos candidatos en un texto: tokens alfanuméricos y pares contiguos ('A-101' -> 'A101')."""
+    tokens = RE_TOKEN.findall((texto or "").upper())
+    return set(tokens) | {a + b for a, b in zip(tokens, tokens[1:])}
+
+
+class Conciliador:
+    """
+    Concilia movimientos por lotes de 'lote' líneas. Con aplicar=False solo
+    informa. 'sin_match' recibe cada línea no conciliada (dict) a medida
+    que aparece, para no acumular el reporte en memoria.
+    """
+
+    def __init__(self, condominio_id=None, ventana_dias=3, aplicar=True, lote=2000, sin_match=None):
+        self.condominio_id = condominio_id
+        self.ventana = timedelta(days=max(0, ventana_dias))
+        self.aplicar = aplicar
+        self.lote = max(1, lote)
+        self.sin_match = sin_match or (lambda fila: None)
+        self.stats = Counter()
+        self._pagos_usados = set()
+        self._cargos_usados = set()
+        self._unidades = None
+
+    # --------- entrada ----------
+    def procesar(self, movimientos):
+        lote = []
+        for mov in movimientos:
+            lote.append(mov)
+            if len(lote) >= self.lote:
+                self._procesar_lote(lote)
+                lote = []
+        if lote:
+            self._procesar_lote(lote)
+        return dict(self.stats)
+
+    def _rechazar(self, mov, motivo):
+        self.stats["sin_match"] += 1
+        self.stats[f"sin_match_{motivo}"] += 1
+        self.sin_match({
+            "linea": mov.linea, "fecha": mov.fecha, "monto": mov.monto,
+            "referencia": mov.referencia, "descripcion": mov.descripcion, "motivo": motivo,
+        })
+
+    def _procesar_lote(self, movimientos):
+        self.stats["lineas"] += len(movimientos)
+        abonos = []
+        for mov in movimientos:
+            if mov.error:
+                self._rechazar(mov, mov.error)
+            elif mov.monto <= 0:
+                self.stats["debitos_ignorados"] += 1
+            else:
+                abonos.append(mov)
+        self.stats["abonos"] += len(abonos)
+
+        a_pagos, pendientes = self._por_referencia(abonos)
+        mas, pendientes = self._por_monto_y_fecha(pendientes)
+        a_pagos += mas
+        a_cargos, pendientes = self._por_unidad(pendientes) if self.condominio_id else ([], pendientes)
+        for mov, motivo in pendientes:
+            self._rechazar(mov, motivo)
+
+        self.stats["conciliados_pago"] += len(a_pagos)
+        self.stats["conciliados_cargo"] += len(a_cargos)
+        if self.aplicar and (a_pagos or a_cargos):
+            with transaction.atomic():
+                self._aprobar_pagos(a_pagos)
+                self._pagar_cargos(a_cargos)
+
+    # --------- regla 1: referencia ----------
+    def _por_referencia(self, abonos):
+        refs = {m.referencia for m in abonos if m.referencia}
+        ids = {int(i) for m in abonos for i in RE_PAGO_ID.findall(m.descripcion or "")}
+        if not refs and not ids:
+            return [], [(m, "sin_referencia") for m in abonos]
+
+        filtro = Q(id__in=ids, estado="PENDIENTE")
+        if refs:
+            filtro |= Q(ref_externa__in=refs) | Q(transaccion_id__in=refs)
+        por_ref, por_id = defaultdict(list), {}
+        for pago in Pago.objects.filter(filtro).values("id", "monto", "estado", "ref_externa", "transaccion_id"):
+            por_id[pago["id"]] = pago
+            for ref in {pago["ref_externa"], pago["transaccion_id"]} & refs:
+                por_ref[ref].append(pago)
+
+        matches, pendientes = [], []
+        for mov in abonos:
+            candidatos = list(por_ref.get(mov.referencia, ())) if mov.referencia else []
+            if any(p["estado"] != "PENDIENTE" and p["ref_externa"] == mov.referencia for p in candidatos):
+                self.stats["ya_conciliados"] += 1
+                continue
+            candidatos += [por_id[int(i)] for i in RE_PAGO_ID.findall(mov.descripcion or "") if int(i) in por_id]
+            abiertos = [p for p in candidatos if p["estado"] == "PENDIENTE" and p["id"] not in self._pagos_usados]
+            elegido = next((p for p in abiertos if p["monto"] == mov.monto), None)
+            if elegido:
+                self._pagos_usados.add(elegido["id"])
+                matches.append((mov, elegido["id"]))
+            else:
+                pendientes.append((mov, "monto_distinto" if abiertos else "sin_referencia"))
+        return matches, pendientes
+
+    # --------- regla 2: monto + ventana de fechas ----------
+    def _por_monto_y_fecha(self, pendientes):
+        if not pendientes:
+            return [], []
+        movs = [m for m, _ in pendientes]
+        desde = min(m.fecha for m in movs) - self.ventana
+        hasta = max(m.fecha for m in movs) + self.ventana + timedelta(days=1)
+        tz = timezone.get_current_timezone()
+        por_monto = defaultdict(list)
+        qs = (
+            Pago.objects.filter(
+                estado="PENDIENTE", monto__in={m.monto for m in movs},
+                fecha__gte=datetime.combine(desde, dt_time.min, tz),
+                fecha__lt=datetime.combine(hasta, dt_time.min, tz),
+            ).values_list("id", "monto", "fecha")
+        )
+        for pago_id, monto, fecha in qs:
+            if pago_id not in self._pagos_usados:
+                por_monto[monto].append((pago_id, timezone.localtime(fecha).date()))
+
+        matches, siguen = [], []
+        for mov, motivo in pendientes:
+            candidatos = [
+                pid for pid, f in por_monto.get(mov.monto, ())
+                if abs(f - mov.fecha) <= self.ventana and pid not in self._pagos_usados
+            ]
+            if len(candidatos) == 1:
+                self._pagos_usados.add(candidatos[0])
+                matches.append((mov, candidatos[0]))
+            else:
+                siguen.append((mov, "ambiguo" if candidatos else motivo))
+        return matches, siguen
+
+    # --------- regla 3: unidad + saldo de cargos ----------
+    def _mapa_unidades(self):
+        if self._unidades is None:
+            from myapp.propiedades.models import Unidad
+
+            self._unidades = defaultdict(set)
+            for uid, codigo in Unidad.objects.filter(condominio_id=self.condominio_id).values_list("id", "codigo"):
+                self._unidades["".join(RE_TOKEN.findall(codigo.upper()))].add(uid)
+        return self._unidades
+
+    def _por_unidad(self, pendientes):
+        if not pendientes:
+            return [], []
+        mapa = self._mapa_unidades()
+        unidad_de = {}
+        for mov, _ in pendientes:
+            uids = set().union(*(mapa.get(c, set()) for c in _claves_unidad(f"{mov.referencia or ''} {mov.descripcion}")))
+            if len(uids) == 1:
+                unidad_de[mov] = uids.pop()
+
+        abiertos = defaultdict(list)
+        if unidad_de:
+            qs = (
+                Cargo.objects
+                .filter(unidad_id__in=set(unidad_de.values()), estado__in=("PENDIENTE", "PARCIAL"))
+                .annotate(pagado=Coalesce(Sum("pagodetalle__monto_aplicado"), Value(Decimal("0")),
+                                         output_field=DecimalField(max_digits=14, decimal_places=2)))
+                .order_by("vencimiento", "periodo", "id")
+                .values_list("id", "unidad_id", "monto", "recargo", "pagado", "periodo")
+            )
+            for cid, uid, monto, recargo, pagado, periodo in qs:
+                saldo = (monto + (recargo or 0) - pagado).quantize(CENTAVO)
+                if saldo > 0:
+                    abiertos[uid].append((cid, saldo, periodo))
+
+        matches, siguen = [], []
+        for mov, motivo in pendientes:
+            uid = unidad_de.get(mov)
+            if uid is None:
+                siguen.append((mov, motivo))
+                continue
+            cargos = [c for c in abiertos[uid] if c[0] not in self._cargos_usados and c[2] <= mov.fecha]
+            exacto = next((c for c in cargos if c[1] == mov.monto), None)
+            if exacto:
+                elegidos = [exacto]
+            elif cargos and sum(c[1] for c in cargos) == mov.monto:
+                elegidos = cargos
+            else:
+                siguen.append((mov, "saldo_distinto" if cargos else "unidad_sin_deuda"))
+                continue
+            self._cargos_usados.update(c[0] for c in elegidos)
+            matches.append((mov, [(c[0], c[1]) for c in elegidos]))
+        return matches, siguen
+
+    # --------- aplicación ----------
+    def _aprobar_pagos(self, matches):
+        if not matches:
+            return
+        con_ref = [(pid, mov.referencia) for mov, pid in matches if mov.referencia]
+        if con_ref:
+            with connection.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE public.pagos p SET ref_externa = v.ref
+                      FROM unnest(%s::bigint[], %s::text[]) AS v(id, ref)
+                     WHERE p.id = v.id AND p.ref_externa IS NULL
+                    """,
+                    [[c[0] for c in con_ref], [c[1][:120] for c in con_ref]],
+                )
+        cambiados = transicionar_pagos([pid for _, pid in matches], "APROBADO", recibos=False)
+        self.stats["pagos_aprobados"] += len(cambiados)
+        # Aprobados por otro camino (cajero, webhook) entre la lectura y el UPDATE
+        self.stats["en_conflicto"] += len(matches) - len(cambiados)
+
+    def _pagar_cargos(self, matches):
+        if not matches:
+            return
+        anio = timezone.localdate().year
+        ultimo = reservar_numeros(self.condominio_id, anio, "R", len(matches))
+        documentos = Documento.objects.bulk_create([
+            Documento(numero=formato_numero("R", anio, ultimo - len(matches) + 1 + i), total=mov.monto,
+                      tipo="RECIBO", condominio_id=self.condominio_id)
+            for i, (mov, _) in enumerate(matches)
+        ])
+        pagos = Pago.objects.bulk_create([
+            Pago(documento=doc, monto=mov.monto, medio="TRANSFERENCIA", estado="APROBADO",
+                 pasarela="EXTRACTO", ref_externa=(mov.referencia or "")[:120] or None)
+            for doc, (mov, _) in zip(documentos, matches)
+        ])
+        # Un INSERT: el trigger por sentencia recalcula los cargos una vez
+        detalles = [
+            PagoDetalle(pago=pago, cargo_id=cid, monto_aplicado=saldo)
+            for pago, (_, cargos) in zip(pagos, matches) for cid, saldo in cargos
+        ]
+        PagoDetalle.objects.bulk_create(detalles, batch_size=5000)
+        self.stats["pagos_creados"] += len(pagos)
+        self.stats["cargos_pagados"] += len(detalles)
+
+
+def conciliar(archivo, formato=None, **opciones):
+    """Atajo: lee el extracto y lo concilia; devuelve las estadísticas."""
+    return Conciliador(**opciones).procesar(leer_extracto(archivo, formato))
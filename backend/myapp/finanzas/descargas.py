@@ -0,0 +1,353 @@
+# myapp/finanzas/descargas.py
+"""
+Entrega de archivos de documentos sin cargar el PDF entero en memoria.
+
+- Locales: Range/If-Range, ETag/Last-Modified y, si FINANZAS_DESCARGA_OFFLOAD
+  lo pide, delegación al servidor web (X-Accel-Redirect de nginx o X-Sendfile
+  de Apache/lighttpd) para que el worker de Python no copie bytes.
+- Remotos (url http/https): sesión HTTP con pool keep-alive, lectura por
+  bloques y copia local en MEDIA_ROOT/documentos/remotos/ con tope de tamaño
+  y desalojo LRU (por fecha de último uso).
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 64 * 1024
+RANGO_INVALIDO = object()
+
+
+# -------------------------------
+# Archivos locales
+# -------------------------------
+def _rango(request, size, etag, last_modified):
+    """
+    (inicio, fin) del header Range, None si hay que mandar el archivo completo
+    o RANGO_INVALIDO (416). Solo se atiende un rango; varios -> archivo completo.
+    """
+    header = request.headers.get("Range", "")
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range not in (etag, http_date(last_modified)):
+        return None
+    ini, _, fin = header[6:].strip().partition("-")
+    try:
+        if ini == "":
+            n = int(fin)
+            if n <= 0:
+                return RANGO_INVALIDO
+            ini, fin = max(size - n, 0), size - 1
+        else:
+            ini = int(ini)
+            fin = min(int(fin), size - 1) if fin else size - 1
+    except ValueError:
+        return None
+    if ini > fin or ini >= size:
+        return RANGO_INVALIDO
+    return ini, fin
+
+
+def _leer_rango(ruta, ini, fin):
+    with open(ruta, "rb") as f:
+        f.seek(ini)
+        restante = fin - ini + 1
+        while restante > 0:
+            bloque = f.read(min(CHUNK, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+def _respuesta_offload(ruta, content_type):
+    """HttpResponse vacía con el header de offload, o None si no aplica."""
+    modo = (getattr(settings, "FINANZAS_DESCARGA_OFFLOAD", "") or "").lower()
+    if modo == "x-sendfile":
+        resp = HttpResponse(content_type=content_type)
+        resp["X-Sendfile"] = ruta
+        return resp
+    if modo == "x-accel":
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        rel = os.path.relpath(os.path.realpath(ruta), media_root)
+        if rel.startswith(".."):
+            return None  # fuera de MEDIA_ROOT: nginx no lo conoce
+        prefijo = getattr(settings, "FINANZAS_DESCARGA_ACCEL_PREFIJO", "/protected-media/")
+        resp = HttpResponse(content_type=content_type)
+        resp["X-Accel-Redirect"] = prefijo.rstrip("/") + "/" + quote(rel.replace(os.sep, "/"))
+        return resp
+    return None
+
+
+def servir_archivo(request, ruta, filename, etag=None, content_type="application/pdf",
+                   cache_control="private, no-cache"):
+    """
+    Respuesta para un archivo local: 304 condicional, 206 con Range o el
+    archivo completo por bloques (FileResponse). Con offload configurado el
+    servidor web manda el cuerpo y resuelve él mismo los rangos.
+    """
+    st = os.stat(ruta)
+    last_modified = int(st.st_mtime)
+    etag = etag or quote_etag(f"{st.st_size:x}-{st.st_mtime_ns:x}")
+    no_modificado = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if no_modificado is not None:
+        return no_modificado
+
+    resp = _respuesta_offload(ruta, content_type)
+    if resp is None:
+        rango = _rango(request, st.st_size, etag, last_modified)
+        if rango is RANGO_INVALIDO:
+            resp = HttpResponse(status=416)
+            resp["Content-Range"] = f"bytes */{st.st_size}"
+            return resp
+        if rango:
+            ini, fin = rango
+            resp = StreamingHttpResponse(_leer_rango(ruta, ini, fin), status=206, content_type=content_type)
+            resp["Content-Range"] = f"bytes {ini}-{fin}/{st.st_size}"
+            resp["Content-Length"] = str(fin - ini + 1)
+        else:
+            resp = FileResponse(open(ruta, "rb"), content_type=content_type)
+            resp.block_size = CHUNK
+
+    resp["Content-Disposition"] = content_disposition_header(True, filename)
+    resp["Accept-Ranges"] = "bytes"
+    resp["ETag"] = etag
+    resp["Last-Modified"] = http_date(last_modified)
+    resp["Cache-Control"] = cache_control
+    return resp
+
+
+def servir_local(request, relpath):
+    """Archivo cargado a mano con url relativa a MEDIA_ROOT; None si no está en disco."""
+    ruta = os.path.join(getattr(settings, "MEDIA_ROOT", "") or "", relpath)
+    if not os.path.isfile(ruta):
+        return None
+    content_type = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    return servir_archivo(request, ruta, os.path.basename(ruta), content_type=content_type)
+
+
+# -------------------------------
+# Sesión HTTP compartida
+# -------------------------------
+_sesion = None
+_sesion_lock = threading.Lock()
+
+
+def sesion_http():
+    """requests.Session del proceso con pool de conexiones keep-alive."""
+    global _sesion
+    if _sesion is None:
+        with _sesion_lock:
+            if _sesion is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                pool = int(getattr(settings, "FINANZAS_HTTP_POOL", 10))
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=1)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _sesion = s
+    return _sesion
+
+
+# -------------------------------
+# Caché local de archivos remotos
+# -------------------------------
+class CacheRemotos:
+    """
+    Copia en disco de archivos remotos: <dir>/<h[:2]>/<h>.bin + <h>.json
+    (h = sha256 de la url). El mtime del .bin marca el último uso; al pasar
+    de max_bytes se borran los menos usados hasta quedar en el 90 %.
+    """
+
+    def __init__(self, directorio, max_bytes, ttl):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _base(self, url):
+        h = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directorio, h[:2], h)
+
+    def buscar(self, url):
+        """(ruta, meta) si la copia existe; marca el uso para el LRU."""
+        base = self._base(url)
+        try:
+            with open(base + ".json") as f:
+                meta = json.load(f)
+            os.utime(base + ".bin")
+        except (OSError, ValueError):
+            return None
+        return base + ".bin", meta
+
+    def vencida(self, meta):
+        return time.time() - meta.get("validado", 0) > self.ttl
+
+    def revalidada(self, url, meta):
+        meta["validado"] = time.time()
+        self._escribir_meta(self._base(url), meta)
+
+    def _escribir_meta(self, base, meta):
+        tmp = f"{base}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, base + ".json")
+
+    def guardar_stream(self, url, respuesta, meta):
+        """
+        Itera la respuesta upstream por bloques, los devuelve al cliente y a la
+        vez los escribe en un temporal; solo al terminar completo se publica
+        la copia. Si el cliente corta, el temporal se descarta.
+        """
+        base = self._base(url)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        tmp = f"{base}.bin.{os.getpid()}.{threading.get_ident()}.tmp"
+        sha = hashlib.sha256()
+        completo = False
+        try:
+            with open(tmp, "wb") as f:
+                for bloque in respuesta.iter_content(CHUNK):
+                    if not bloque:
+                        continue
+                    f.write(bloque)
+                    sha.update(bloque)
+                    yield bloque
+            completo = True
+        finally:
+            respuesta.close()
+            if completo:
+                meta.setdefault("etag", quote_etag(sha.hexdigest()))
+                meta["validado"] = time.time()
+                os.replace(tmp, base + ".bin")
+                self._escribir_meta(base, meta)
+                self.recortar()
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+
+    def recortar(self):
+        """Desalojo LRU hasta quedar bajo el 90 % de max_bytes."""
+        if not self._lock.acquire(blocking=False):
+            return  # otro hilo ya está recortando
+        try:
+            entradas = []
+            total = 0
+            for raiz, _, archivos in os.walk(self.directorio):
+                for nombre in archivos:
+                    if not nombre.endswith(".bin"):
+                        continue
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        st = os.stat(ruta)
+                    except OSError:
+                        continue
+                    entradas.append((st.st_mtime, st.st_size, ruta))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            objetivo = int(self.max_bytes * 0.9)
+            for _, size, ruta in sorted(entradas):
+                if total <= objetivo:
+                    break
+                for r in (ruta, ruta[:-4] + ".json"):
+                    try:
+                        os.remove(r)
+                    except OSError:
+                        pass
+                total -= size
+        finally:
+            self._lock.release()
+
+
+_cache_remotos = None
+
+
+def get_cache_remotos():
+    global _cache_remotos
+    if _cache_remotos is None:
+        _cache_remotos = CacheRemotos(
+            os.path.join(settings.MEDIA_ROOT, "documentos", "remotos"),
+            int(getattr(settings, "FINANZAS_REMOTOS_CACHE_MB", 512)) * 1024 * 1024,
+            int(getattr(settings, "FINANZAS_REMOTOS_TTL", 86400)),
+        )
+    return _cache_remotos
+
+
+def servir_remoto(request, url, filename):
+    """
+    Proxy de un archivo remoto. Con copia local vigente se sirve como archivo
+    local (Range, 304, offload); si está vencida se revalida con el ETag o
+    Last-Modified de origen. Sin copia, se hace streaming desde el origen
+    guardándolo de paso. Un Range sin copia local se reenvía al origen y la
+    respuesta parcial no se guarda.
+    """
+    cache = get_cache_remotos()
+    timeout = float(getattr(settings, "FINANZAS_HTTP_TIMEOUT", 15))
+    hit = cache.buscar(url)
+    headers = {}
+    if hit:
+        ruta, meta = hit
+        if not cache.vencida(meta):
+            return servir_archivo(request, ruta, filename, etag=meta["etag"], content_type=meta["content_type"])
+        if meta.get("origen_etag"):
+            headers["If-None-Match"] = meta["origen_etag"]
+        if meta.get("origen_last_modified"):
+            headers["If-Modified-Since"] = meta["origen_last_modified"]
+
+    rango = request.headers.get("Range")
+    if rango and not hit:
+        headers["Range"] = rango
+
+    r = sesion_http().get(url, headers=headers, stream=True, timeout=timeout)
+    if hit and r.status_code == 304:
+        r.close()
+        cache.revalidada(url, meta)
+        return servir_archivo(request, ruta, filename, etag=meta["etag"], content_type=meta["content_type"])
+    try:
+        r.raise_for_status()
+    except Exception:
+        r.close()
+        raise
+
+    content_type = r.headers.get("Content-Type", "application/octet-stream")
+    if r.status_code == 206:
+        cuerpo = _iterar_y_cerrar(r)
+    else:
+        meta = {
+            "url": url,
+            "content_type": content_type,
+            "origen_etag": r.headers.get("ETag"),
+            "origen_last_modified": r.headers.get("Last-Modified"),
+        }
+        cuerpo = cache.guardar_stream(url, r, meta)
+
+    resp = StreamingHttpResponse(cuerpo, status=r.status_code, content_type=content_type)
+    for h in ("Content-Length", "Content-Range", "Last-Modified"):
+        if r.headers.get(h):
+            resp[h] = r.headers[h]
+    if r.headers.get("Content-Encoding"):
+        del resp["Content-Length"]  # iter_content entrega el cuerpo ya descomprimido
+    resp["Content-Disposition"] = content_disposition_header(True, filename)
+    resp["Accept-Ranges"] = "bytes"
+    resp["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def _iterar_y_cerrar(respuesta):
+    try:
+        yield from respuesta.iter_content(CHUNK)
+    finally:
+        respuesta.close()
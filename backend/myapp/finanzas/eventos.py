@@ -0,0 +1,232 @@
+# myapp/finanzas/eventos.py
+"""
+Avisos de cambio de estado de pagos/intentos para clientes en espera.
+
+Bajo ASGI cada cliente esperando un QR es una corrutina con una cola en
+memoria, no un hilo ni una consulta periódica. Un solo LISTEN por proceso
+(canal finanzas_pagos, alimentado por los triggers de la migración 0010)
+reparte cada NOTIFY a las colas suscritas a 'pago:<id>' o 'intento:<id>'.
+Si la conexión LISTEN se corta, al reconectar se avisa a todos con un
+evento 'reconexion' para que relean su estado (NOTIFY no se reenvía).
+"""
+import asyncio
+import json
+import logging
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CANAL = "finanzas_pagos"
+INTENTO_FINALES = {"APROBADO", "RECHAZADO", "EXPIRO", "FALLIDO"}
+PAGO_FINALES = {"APROBADO", "RECHAZADO", "ANULADO"}
+
+
+def conninfo_default():
+    """conninfo de psycopg para la base 'default' de Django."""
+    from psycopg.conninfo import make_conninfo
+
+    db = settings.DATABASES["default"]
+    kwargs = {
+        "dbname": db.get("NAME"), "user": db.get("USER"), "password": db.get("PASSWORD"),
+        "host": db.get("HOST"), "port": db.get("PORT"),
+    }
+    kwargs.update(db.get("OPTIONS") or {})
+    return make_conninfo(**{k: v for k, v in kwargs.items() if v not in (None, "")})
+
+
+class Hub:
+    """Suscripciones en memoria por clave dentro de un event loop."""
+
+    def __init__(self, escuchar_pg=True):
+        self.escuchar_pg = escuchar_pg
+        self._subs = defaultdict(set)
+        self._tarea = None
+
+    @property
+    def esperando(self):
+        return sum(len(s) for s in self._subs.values())
+
+    def suscribir(self, claves, cola=None):
+        cola = asyncio.Queue() if cola is None else cola
+        for clave in claves:
+            self._subs[clave].add(cola)
+        if self.escuchar_pg and self._tarea is None:
+            self._tarea = asyncio.get_running_loop().create_task(self._escuchar())
+        return cola
+
+    def desuscribir(self, claves, cola):
+        for clave in claves:
+            subs = self._subs.get(clave)
+            if subs is not None:
+                subs.discard(cola)
+                if not subs:
+                    del self._subs[clave]
+
+    def publicar(self, evento):
+        """Entrega el evento a las colas de su clave ('pago:<id>' / 'intento:<id>')."""
+        if evento.get("tipo") == "reconexion":
+            colas = set().union(*self._subs.values()) if self._subs else set()
+        else:
+            colas = self._subs.get(f"{evento.get('tipo')}:{evento.get('id')}", ())
+        for cola in colas:
+            cola.put_nowait(evento)
+
+    async def _escuchar(self):
+        import psycopg
+
+        espera = 1.0
+        conectado_antes = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo_default(), autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CANAL}")
+                    espera = 1.0
+                    if conectado_antes:
+                        self.publicar({"tipo": "reconexion"})
+                    conectado_antes = True
+                    async for aviso in conn.notifies():
+                        try:
+                            self.publicar(json.loads(aviso.payload))
+                        except ValueError:
+                            logger.warning("NOTIFY %s con payload inválido: %r", CANAL, aviso.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("LISTEN %s caído; reintento en %.0f s", CANAL, espera)
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 30.0)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """Hub del event loop actual (uno por proceso bajo un servidor ASGI)."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = Hub(escuchar_pg=getattr(settings, "FINANZAS_EVENTOS_LISTEN", True))
+    return hub
+
+
+# -------------------------------
+# Estado de un intento
+# -------------------------------
+async def estado_intento(intento_id):
+    """Snapshot {intento_id, estado_intento, pago_id, estado_pago, documento_id} o None."""
+    from .models import PagoIntento
+
+    fila = await (
+        PagoIntento.objects.filter(pk=intento_id)
+        .values("id", "estado", "pago_id", "pago__estado", "pago__documento_id")
+        .afirst()
+    )
+    if fila is None:
+        return None
+    return {
+        "intento_id": fila["id"],
+        "estado_intento": fila["estado"],
+        "pago_id": fila["pago_id"],
+        "estado_pago": fila["pago__estado"],
+        "documento_id": fila["pago__documento_id"],
+    }
+
+
+def es_final(snapshot):
+    return snapshot["estado_intento"] in INTENTO_FINALES or snapshot["estado_pago"] in PAGO_FINALES
+
+
+def aplicar_evento(snapshot, evento):
+    """Actualiza el snapshot con un NOTIFY; False si hay que releer de la base."""
+    tipo = evento.get("tipo")
+    if tipo == "intento":
+        snapshot["estado_intento"] = evento.get("estado")
+    elif tipo == "pago":
+        snapshot["estado_pago"] = evento.get("estado")
+        if evento.get("documento_id"):
+            snapshot["documento_id"] = evento["documento_id"]
+    else:
+        return False
+    return True
+
+
+class Espera:
+    """
+    Suscripción de un cliente a un intento. Se suscribe a 'intento:<id>'
+    ANTES de leer el estado (así no se pierde un NOTIFY entre la lectura y
+    la espera) y, una vez conocido, también a 'pago:<pago_id>'.
+    """
+
+    def __init__(self, intento_id, hub=None, recargar=estado_intento):
+        self.intento_id = intento_id
+        self.hub = hub or get_hub()
+        self.recargar = recargar
+        self.claves = [f"intento:{intento_id}"]
+        self.cola = None
+        self.snapshot = None
+
+    async def abrir(self):
+        self.cola = self.hub.suscribir(self.claves)
+        try:
+            self.snapshot = await self.recargar(self.intento_id)
+        except BaseException:
+            self.cerrar()
+            raise
+        if self.snapshot and self.snapshot.get("pago_id"):
+            clave = f"pago:{self.snapshot['pago_id']}"
+            self.hub.suscribir([clave], self.cola)
+            self.claves.append(clave)
+        return self.snapshot
+
+    def cerrar(self):
+        if self.cola is not None:
+            self.hub.desuscribir(self.claves, self.cola)
+            self.cola = None
+
+    async def siguiente(self, timeout):
+        """Espera un evento hasta 'timeout' s; True si el snapshot cambió."""
+        try:
+            evento = await asyncio.wait_for(self.cola.get(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        if not aplicar_evento(self.snapshot, evento):
+            self.snapshot = await self.recargar(self.intento_id) or self.snapshot
+        return True
+
+
+async def esperar_cambio(espera, timeout):
+    """Long-poll: devuelve el snapshot al primer cambio o al vencer 'timeout'."""
+    try:
+        await espera.siguiente(timeout)
+        return espera.snapshot
+    finally:
+        espera.cerrar()
+
+
+def _sse(snapshot, evento="estado"):
+    return f"event: {evento}\ndata: {json.dumps(snapshot, separators=(',', ':'))}\n\n"
+
+
+async def flujo_sse(espera, duracion, latido):
+    """
+    Cuerpo text/event-stream: el estado actual, luego un evento por cambio y
+    un comentario de latido cada 'latido' s. Termina en un estado final o al
+    cumplir 'duracion' (el EventSource reconecta solo tras 'retry').
+    """
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + duracion
+    try:
+        yield "retry: 3000\n" + _sse(espera.snapshot)
+        while not es_final(espera.snapshot):
+            restante = fin - loop.time()
+            if restante <= 0:
+                return
+            if await espera.siguiente(min(latido, restante)):
+                yield _sse(espera.snapshot)
+            else:
+                yield ": ping\n\n"
+    finally:
+        espera.cerrar()
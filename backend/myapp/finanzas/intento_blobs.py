@@ -0,0 +1,190 @@
+# myapp/finanzas/intento_blobs.py
+"""
+Payloads pesados de PagoIntento fuera de la fila de pagos_intentos.
+
+La imagen QR del banco y las respuestas crudas de las pasarelas
+(PagoIntento.CAMPOS_BLOB) se guardan en pagos_intentos_blobs, una fila por
+(intento, campo): el PNG como bytes (sin la inflación del base64; ya viene
+comprimido) y los JSON con zlib. Listados y polling leen solo la fila
+liviana; el contenido se carga bajo demanda con leer()/cargar().
+
+Mientras haya filas sin migrar (comando mover_blobs_intentos) se lee la
+columna inline cuando el intento no tiene blob.
+"""
+import base64
+import binascii
+import json
+import zlib
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import PagoIntento, PagoIntentoBlob
+
+CAMPOS = PagoIntento.CAMPOS_BLOB
+NIVEL_ZLIB = 6
+
+
+# -------------------------------
+# Codificación
+# -------------------------------
+def codificar(campo, valor):
+    """(datos, formato, tamano_original) con que se guarda 'valor'."""
+    if campo == "bnb_qr_image_b64" and isinstance(valor, str):
+        try:
+            return base64.b64decode(valor, validate=True), "png", len(valor)
+        except (binascii.Error, ValueError):
+            crudo = valor.encode("utf-8")
+            return zlib.compress(crudo, NIVEL_ZLIB), "texto+zlib", len(crudo)
+    crudo = json.dumps(valor, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+    return zlib.compress(crudo, NIVEL_ZLIB), "json+zlib", len(crudo)
+
+
+def decodificar(formato, datos):
+    datos = bytes(datos)
+    if formato == "png":
+        return base64.b64encode(datos).decode("ascii")
+    crudo = zlib.decompress(datos).decode("utf-8")
+    return json.loads(crudo) if formato == "json+zlib" else crudo
+
+
+# -------------------------------
+# Escritura
+# -------------------------------
+SQL_INSERT = """
+INSERT INTO public.pagos_intentos_blobs
+       (intento_id, campo, formato, datos, tamano_original, actualizado_en)
+VALUES (%s, %s, %s, %s, %s, now())
+ON CONFLICT (intento_id, campo) DO
+"""
+SQL_UPSERT = SQL_INSERT + """UPDATE
+   SET formato = EXCLUDED.formato, datos = EXCLUDED.datos,
+       tamano_original = EXCLUDED.tamano_original, actualizado_en = EXCLUDED.actualizado_en
+"""
+
+
+def guardar_muchos(filas):
+    """
+    Upsert de [(intento, campo, valor)] en un solo executemany; valor None
+    borra el blob. Deja el valor en la caché del intento para no releerlo.
+    """
+    params = []
+    borrar = []
+    for intento, campo, valor in filas:
+        if campo not in CAMPOS:
+            raise ValueError(f"Campo sin side store: {campo}")
+        _cache(intento)[campo] = valor
+        if valor is None:
+            borrar.append((intento.pk, campo))
+            continue
+        datos, formato, tamano = codificar(campo, valor)
+        params.append((intento.pk, campo, formato, datos, tamano))
+    with connection.cursor() as cur:
+        if params:
+            cur.executemany(SQL_UPSERT, params)
+        if borrar:
+            cur.executemany(
+                "DELETE FROM public.pagos_intentos_blobs WHERE intento_id = %s AND campo = %s", borrar
+            )
+    return len(params)
+
+
+def guardar(intento, **valores):
+    """guardar(intento, bnb_payload=data, ...) para un solo intento."""
+    return guardar_muchos([(intento, campo, valor) for campo, valor in valores.items()])
+
+
+# -------------------------------
+# Lectura
+# -------------------------------
+def _cache(intento):
+    cache = getattr(intento, "_blobs", None)
+    if cache is None:
+        cache = intento._blobs = {}
+    return cache
+
+
+def cargar(intentos, campos=CAMPOS):
+    """Carga en una consulta los 'campos' de varios intentos que aún no los tengan."""
+    campos = list(campos)
+    faltan = {i.pk: i for i in intentos if any(c not in _cache(i) for c in campos)}
+    if not faltan:
+        return
+    for intento in faltan.values():
+        for campo in campos:
+            _cache(intento).setdefault(campo, None)
+    filas = (
+        PagoIntentoBlob.objects
+        .filter(intento_id__in=list(faltan), campo__in=campos)
+        .values_list("intento_id", "campo", "formato", "datos")
+    )
+    for intento_id, campo, formato, datos in filas:
+        _cache(faltan[intento_id])[campo] = decodificar(formato, datos)
+
+
+def leer(intento, campo):
+    """Valor del campo: el blob si existe, si no la columna inline (filas sin migrar)."""
+    if campo not in _cache(intento):
+        cargar([intento], [campo])
+    valor = _cache(intento)[campo]
+    return getattr(intento, campo, None) if valor is None else valor
+
+
+# -------------------------------
+# Migración de filas existentes
+# -------------------------------
+SQL_TAMANO_INLINE = """
+SELECT coalesce(sum(coalesce(pg_column_size(bnb_qr_image_b64), 0)
+                  + coalesce(pg_column_size(bnb_payload), 0)
+                  + coalesce(pg_column_size(raw_request), 0)
+                  + coalesce(pg_column_size(raw_response), 0)), 0)
+  FROM public.pagos_intentos
+ WHERE id = ANY(%s)
+"""
+
+
+def mover_inline(lote=500, dry_run=False, progreso=None):
+    """
+    Pasa al side store los payloads que siguen inline en pagos_intentos, por
+    lotes de 'lote' filas (keyset por id, una transacción por lote, filas
+    bloqueadas con SKIP LOCKED para no frenar a quien las esté usando). Si el
+    intento ya tiene blob se conserva el blob (es más nuevo). Devuelve
+    {filas, blobs, bytes_inline, bytes_original, bytes_blobs}: bytes_inline es
+    lo que ocupaban en la fila (pg_column_size, ya con la compresión TOAST).
+    """
+    filtro = Q()
+    for campo in CAMPOS:
+        filtro |= Q(**{f"{campo}__isnull": False})
+    stats = {"filas": 0, "blobs": 0, "bytes_inline": 0, "bytes_original": 0, "bytes_blobs": 0}
+    ultimo = 0
+    while True:
+        with transaction.atomic():
+            filas = list(
+                PagoIntento.objects.select_for_update(skip_locked=True)
+                .filter(filtro, id__gt=ultimo).order_by("id")
+                .values_list("id", *CAMPOS)[:lote]
+            )
+            if not filas:
+                break
+            ultimo = filas[-1][0]
+            ids = [f[0] for f in filas]
+            params = []
+            for fila in filas:
+                for campo, valor in zip(CAMPOS, fila[1:]):
+                    if valor is not None:
+                        datos, formato, tamano = codificar(campo, valor)
+                        params.append((fila[0], campo, formato, datos, tamano))
+            with connection.cursor() as cur:
+                cur.execute(SQL_TAMANO_INLINE, [ids])
+                stats["bytes_inline"] += int(cur.fetchone()[0])
+                if not dry_run:
+                    if params:
+                        cur.executemany(SQL_INSERT + "NOTHING", params)
+                    PagoIntento.objects.filter(id__in=ids).update(**{c: None for c in CAMPOS})
+            stats["filas"] += len(filas)
+            stats["blobs"] += len(params)
+            stats["bytes_original"] += sum(p[4] for p in params)
+            stats["bytes_blobs"] += sum(len(p[3]) for p in params)
+        if progreso:
+            progreso(stats)
+    return stats
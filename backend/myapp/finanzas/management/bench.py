@@ -0,0 +1,48 @@
+# myapp/finanzas/management/bench.py
+"""
+Datos sintéticos para los comandos bench_*.
+Pensado para usarse dentro de un transaction.atomic() que el comando revierte al final.
+"""
+import uuid
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+
+from myapp.propiedades.models import Condominio
+from myapp.finanzas.models import Concepto
+
+
+def crear_datos_bench(n_unidades, n_periodos=1, monto=Decimal("100.00"), desde=date(2020, 1, 1)):
+    """
+    Crea un condominio con n_unidades unidades y un cargo por unidad y periodo
+    (n_periodos meses consecutivos desde 'desde'), todo con INSERT ... SELECT.
+    Devuelve {"condominio": Condominio, "concepto": Concepto}.
+    """
+    tag = uuid.uuid4().hex[:8]
+    condominio = Condominio.objects.create(nombre=f"bench-{tag}")
+    concepto = Concepto.objects.create(nombre=f"BENCH-{tag}", codigo="BENCH")
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.unidades (condominio_id, codigo, area_m2, creado_en, actualizado_en)
+            SELECT %s, 'U' || lpad(g::text, 7, '0'), 40 + (g %% 120), now(), now()
+              FROM generate_series(1, %s) g
+            """,
+            [condominio.id, n_unidades],
+        )
+        cur.execute(
+            """
+            INSERT INTO public.cargos (unidad_id, concepto_id, periodo, monto, vencimiento, recargo, estado)
+            SELECT u.id, %s,
+                   (%s::date + make_interval(months => g))::date,
+                   %s,
+                   (%s::date + make_interval(months => g) + interval '10 days')::date,
+                   0, 'PENDIENTE'
+              FROM public.unidades u
+             CROSS JOIN generate_series(0, %s - 1) g
+             WHERE u.condominio_id = %s
+            """,
+            [concepto.id, desde, monto, desde, n_periodos, condominio.id],
+        )
+    return {"condominio": condominio, "concepto": concepto}
@@ -1,34 +1,104 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection, transaction
 from decimal import Decimal
 import os
 
-from myapp.finanzas.models import Cargo
+ESTADOS_MORA = ("PENDIENTE", "PARCIAL")
+
 
 class Command(BaseCommand):
-    help = "Aplica recargos de mora a Cargos vencidos. Controlado por FINANZAS_TASA_MORA_DIARIA (por defecto 0)."
+    help = (
+        "Aplica recargos de mora a Cargos vencidos. Controlado por FINANZAS_TASA_MORA_DIARIA (por defecto 0). "
+        "Procesa por bloques de ids con un UPDATE por bloque y commit por bloque; "
+        "solo escribe cargos cuyo recargo cambia y salta filas bloqueadas por otra transacción."
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument('--tasa', type=float, default=None, help="Tasa diaria de mora (por ejemplo 0.001 = 0.1%/día)")
+        parser.add_argument('--tasa', type=float, default=None, help="Tasa diaria de mora (por ejemplo 0.001 = 0.1%%/día)")
+        parser.add_argument('--condominio', type=int, default=None, help="Solo cargos de unidades de este condominio")
+        parser.add_argument('--chunk', type=int, default=2000, help="Cargos por bloque (default 2000)")
+        parser.add_argument('--dry-run', action='store_true', help="Calcula sin escribir")
+        parser.add_argument('--despues_de_id', type=int, default=0, help="Reanudar desde el id siguiente a este")
+        parser.add_argument('--checkpoint', type=str, default=None,
+                            help="Archivo donde se guarda el último id confirmado; si existe, se reanuda desde ahí")
 
-    @transaction.atomic
     def handle(self, *args, **opts):
         tasa_env = os.getenv("FINANZAS_TASA_MORA_DIARIA", "0")
         tasa = Decimal(str(opts['tasa'])) if opts['tasa'] is not None else Decimal(tasa_env)
         hoy = timezone.localdate()
+        chunk = max(1, opts['chunk'])
+        dry_run = opts['dry_run']
+        checkpoint = opts['checkpoint']
+
+        if tasa <= 0:
+            self.stdout.write(self.style.SUCCESS(f"Recargos aplicados a 0 cargos (tasa diaria {tasa})."))
+            return
+
+        ultimo_id = opts['despues_de_id'] or 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                ultimo_id = max(ultimo_id, int(f.read().strip() or 0))
+            self.stdout.write(f"Reanudando desde id > {ultimo_id}")
+
+        where = ["c.id > %s", "c.vencimiento < %s", "c.estado = ANY(%s)"]
+        params_base = [hoy, list(ESTADOS_MORA)]
+        if opts['condominio']:
+            where.append("c.unidad_id IN (SELECT id FROM public.unidades WHERE condominio_id = %s)")
+            params_base.append(opts['condominio'])
+        sql_ids = (
+            "SELECT c.id FROM public.cargos c WHERE " + " AND ".join(where) + " ORDER BY c.id LIMIT %s"
+        )
+
+        # recargo = monto * tasa * días de atraso; solo filas cuyo valor cambia
+        calc = """
+            SELECT c.id, round(c.monto * %s * (%s::date - c.vencimiento), 2) AS recargo
+              FROM public.cargos c
+             WHERE c.id = ANY(%s)
+               AND c.vencimiento < %s
+               AND c.estado = ANY(%s)
+        """
+        sql_dry = f"""
+            SELECT count(*) FROM ({calc}) n
+              JOIN public.cargos c ON c.id = n.id
+             WHERE n.recargo > 0 AND c.recargo IS DISTINCT FROM n.recargo
+        """
+        sql_update = f"""
+            UPDATE public.cargos c
+               SET recargo = n.recargo
+              FROM ({calc} FOR UPDATE SKIP LOCKED) n
+             WHERE c.id = n.id
+               AND n.recargo > 0
+               AND c.recargo IS DISTINCT FROM n.recargo
+        """
 
-        qs = Cargo.objects.select_for_update().filter(vencimiento__lt=hoy, estado__in=["PENDIENTE","PARCIAL"])
+        revisados = 0
         actualizados = 0
-        for c in qs:
-            dias = (hoy - c.vencimiento).days if c.vencimiento else 0
-            if dias <= 0 or tasa <= 0:
-                continue
-            recargo_calc = (Decimal(c.monto) * tasa * dias).quantize(Decimal("0.01"))
-            if recargo_calc <= 0:
-                continue
-            c.recargo = recargo_calc
-            c.save(update_fields=['recargo'])
-            actualizados += 1
-
-        self.stdout.write(self.style.SUCCESS(f"Recargos aplicados a {actualizados} cargos (tasa diaria {tasa})."))
+        while True:
+            with connection.cursor() as cur:
+                cur.execute(sql_ids, [ultimo_id] + params_base + [chunk])
+                ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                break
+
+            params = [tasa, hoy, ids, hoy, list(ESTADOS_MORA)]
+            with transaction.atomic(), connection.cursor() as cur:
+                if dry_run:
+                    cur.execute(sql_dry, params)
+                    actualizados += cur.fetchone()[0]
+                else:
+                    cur.execute(sql_update, params)
+                    actualizados += cur.rowcount
+
+            revisados += len(ids)
+            ultimo_id = ids[-1]
+            if checkpoint and not dry_run:
+                with open(checkpoint, "w") as f:
+                    f.write(str(ultimo_id))
+            self.stdout.write(f"  revisados {revisados} - con cambio {actualizados} - ultimo_id={ultimo_id}")
+
+        if checkpoint and not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        verbo = "Se aplicarían recargos a" if dry_run else "Recargos aplicados a"
+        self.stdout.write(self.style.SUCCESS(f"{verbo} {actualizados} cargos (tasa diaria {tasa})."))
@@ -0,0 +1,110 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.models import Cargo, Pago, PagoDetalle
+from myapp.finanzas.services import recalc_cargos
+from myapp.finanzas.views import PagoViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Anulación en lote (pagos/anular_lote/) contra la anulación detalle por detalle. Verifica "
+        "el trabajo de recálculo: un UPDATE de pagos_detalle, ningún recalc explícito, un cargo "
+        "recalculado por cargo distinto y los cargos de vuelta en PENDIENTE. Todo se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pagos", type=int, default=500)
+        parser.add_argument("--lineas", type=int, default=5, help="Detalles por pago (default 5)")
+        parser.add_argument("--cargos", type=int, default=300, help="Cargos compartidos entre los pagos")
+
+    def handle(self, *args, **opts):
+        n, lineas, n_cargos = max(1, opts["pagos"]), max(1, opts["lineas"]), max(1, opts["cargos"])
+        fallas = []
+
+        with transaction.atomic():
+            cargo_ids = self._crear(n_cargos)
+            tandas = {}
+            for estrategia in ("detalle", "lote"):
+                pago_ids = self._pagos(n, lineas, cargo_ids)
+                con_monto = set(
+                    PagoDetalle.objects.filter(pago_id__in=pago_ids).values_list("cargo_id", flat=True)
+                )
+                t0 = time.perf_counter()
+                with CaptureQueriesContext(connection) as q:
+                    resp = self._anular_detalle(pago_ids) if estrategia == "detalle" else self._anular_lote(pago_ids)
+                tandas[estrategia] = (time.perf_counter() - t0, q.captured_queries)
+
+                if estrategia == "lote":
+                    sql = [c["sql"] for c in q.captured_queries]
+                    upd_pd = sum(1 for s in sql if s.lstrip().upper().startswith("UPDATE") and "pagos_detalle" in s)
+                    recalc = sum(1 for s in sql if "recalc_estado_cargos" in s)
+                    if upd_pd != 1:
+                        fallas.append(f"UPDATEs de pagos_detalle: {upd_pd} (esperado 1)")
+                    if recalc:
+                        fallas.append(f"recalc explícitos: {recalc} (esperado 0, lo hace el trigger)")
+                    if resp["cargos_recalculados"] != len(con_monto):
+                        fallas.append(f"cargos recalculados {resp['cargos_recalculados']} != distintos {len(con_monto)}")
+                    if len(resp["anulados"]) != n:
+                        fallas.append(f"anulados {len(resp['anulados'])} de {n}")
+                    otra = self._anular_lote(pago_ids)
+                    if otra["anulados"] or otra["cargos_recalculados"] or len(otra["ya_anulados"]) != n:
+                        fallas.append(f"segunda anulación no fue no-op: {otra}")
+
+                if Pago.objects.filter(id__in=pago_ids).exclude(estado="ANULADO").exists():
+                    fallas.append(f"{estrategia}: quedaron pagos sin anular")
+                if Cargo.objects.filter(id__in=cargo_ids).exclude(estado="PENDIENTE").exists():
+                    fallas.append(f"{estrategia}: quedaron cargos sin volver a PENDIENTE")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{n} pagos x {lineas} detalles sobre {n_cargos} cargos")
+        for estrategia, (dt, queries) in tandas.items():
+            self.stdout.write(f"  {estrategia:8s} {dt * 1000:8.1f} ms  {len(queries):6d} consultas")
+        for f in fallas:
+            self.stdout.write(f"  FALLA: {f}")
+        if fallas:
+            raise CommandError("Falló la verificación de la anulación en lote")
+        self.stdout.write(self.style.SUCCESS("OK: anulación en lote con un recálculo por cargo"))
+
+    def _crear(self, n_cargos):
+        datos = crear_datos_bench(n_unidades=n_cargos)
+        return list(Cargo.objects.filter(unidad__condominio=datos["condominio"]).values_list("id", flat=True))
+
+    def _pagos(self, n, lineas, cargo_ids):
+        """Pagos APROBADO cuyos detalles se reparten (y repiten) entre los cargos."""
+        pagos = Pago.objects.bulk_create([
+            Pago(monto=Decimal(lineas), medio="TRANSFERENCIA", estado="APROBADO") for _ in range(n)
+        ])
+        PagoDetalle.objects.bulk_create([
+            PagoDetalle(pago=p, cargo_id=cargo_ids[(i * lineas + j) % len(cargo_ids)], monto_aplicado=Decimal("1.00"))
+            for i, p in enumerate(pagos) for j in range(lineas)
+        ])
+        return [p.id for p in pagos]
+
+    def _anular_detalle(self, pago_ids):
+        """Como lo hacía PagoViewSet.anular: un save por detalle y un recalc por pago."""
+        for pago in Pago.objects.filter(id__in=pago_ids):
+            for pd in pago.pagodetalle_set.all():
+                if pd.monto_aplicado != 0:
+                    pd.monto_aplicado = Decimal("0.00")
+                    pd.save(update_fields=["monto_aplicado"])
+            pago.estado = "ANULADO"
+            pago.save(update_fields=["estado"])
+            recalc_cargos(pago.pagodetalle_set.values_list("cargo_id", flat=True))
+        return None
+
+    def _anular_lote(self, pago_ids):
+        req = APIRequestFactory().post("/api/finanzas/pagos/anular_lote/", {"pago_ids": pago_ids}, format="json")
+        force_authenticate(req, user=User(username="bench"))
+        resp = PagoViewSet.as_view({"post": "anular_lote"})(req)
+        if resp.status_code != 200:
+            raise CommandError(f"anular_lote respondió {resp.status_code}: {resp.data}")
+        return resp.data
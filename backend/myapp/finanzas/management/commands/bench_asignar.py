@@ -0,0 +1,125 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.models import Cargo, EstadoCuentaUnidad, Pago
+from myapp.finanzas.views import PagoViewSet
+from myapp.propiedades.models import Unidad
+
+CIEN = Decimal("100.00")
+
+
+class Command(BaseCommand):
+    help = (
+        "Asignación FIFO (pagos/asignar/) contra el flujo del frontend (leer el estado de cuenta y llamar "
+        "a pagos/registrar/ por pago). Verifica el reparto del más antiguo al más nuevo, los estados de "
+        "los cargos, que el número de consultas del lote no crezca con los pagos y que un monto mayor "
+        "que la deuda no cree nada. Todo se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pagos", type=int, default=500, help="Pagos del lote (una unidad cada uno)")
+        parser.add_argument("--periodos", type=int, default=6, help="Cargos de 100.00 por unidad (default 6)")
+
+    def handle(self, *args, **opts):
+        n, periodos = max(1, opts["pagos"]), max(3, opts["periodos"])
+        self.factory = APIRequestFactory()
+        self.usuario = User(username="bench")
+        fallas = []
+
+        with transaction.atomic():
+            unidades = self._unidades(n, periodos)
+            t0 = time.perf_counter()
+            self._cliente(unidades, Decimal("250.00"))
+            t_cliente = time.perf_counter() - t0
+
+            unidades = self._unidades(n, periodos)
+            cuerpo = {"medio": "EFECTIVO", "pagos": [{"unidad_id": u, "monto": "250.00"} for u in unidades]}
+            t0 = time.perf_counter()
+            with CaptureQueriesContext(connection) as q:
+                resp = self._asignar(cuerpo)
+            t_lote = time.perf_counter() - t0
+            with CaptureQueriesContext(connection) as q1:
+                self._asignar({"medio": "EFECTIVO", "unidad_id": unidades[0], "monto": "1.00", "simular": True})
+
+            if resp.status_code != 201:
+                raise CommandError(f"asignar respondió {resp.status_code}: {resp.data}")
+            for r in resp.data["pagos"]:
+                aplicados = [d["monto_aplicado"] for d in r["detalles"]]
+                periodos_pago = [d["periodo"] for d in r["detalles"]]
+                if aplicados != [CIEN, CIEN, Decimal("50.00")] or periodos_pago != sorted(periodos_pago):
+                    fallas.append(f"reparto no FIFO en la unidad {r['unidad_id']}: {r['detalles']}")
+                    break
+            estados = {}
+            for unidad_id, estado in (
+                Cargo.objects.filter(unidad_id__in=unidades).order_by("unidad_id", "periodo")
+                .values_list("unidad_id", "estado")
+            ):
+                estados.setdefault(unidad_id, []).append(estado)
+            esperado = ["PAGADO", "PAGADO", "PARCIAL"] + ["PENDIENTE"] * (periodos - 3)
+            malos = [u for u, e in estados.items() if e != esperado]
+            if malos:
+                fallas.append(f"{len(malos)} unidades con estados {estados[malos[0]]} (esperado {esperado})")
+            # Un lote de N pagos cuesta lo mismo que uno: unidades, bloqueo, saldos y un INSERT por tabla
+            if len(q.captured_queries) > 15:
+                fallas.append(f"el lote usó {len(q.captured_queries)} consultas (esperado <= 15)")
+
+            pagos_antes = Pago.objects.count()
+            deuda = CIEN * periodos - Decimal("250.00")
+            excedido = self._asignar({"medio": "EFECTIVO", "pagos": [
+                {"unidad_id": unidades[0], "monto": "10.00"},
+                {"unidad_id": unidades[1], "monto": str(deuda + 1)},
+            ]})
+            if excedido.status_code != 400 or not excedido.data["pagos"][1] or excedido.data["pagos"][0]:
+                fallas.append(f"monto mayor que la deuda: {excedido.status_code} {excedido.data}")
+            if Pago.objects.count() != pagos_antes:
+                fallas.append("un lote con errores creó pagos")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{n} pagos de 250.00 sobre {periodos} cargos de 100.00 por unidad")
+        self.stdout.write(f"  cliente (estado de cuenta + registrar por pago) {t_cliente * 1000:8.1f} ms")
+        self.stdout.write(f"  asignar en lote                                 {t_lote * 1000:8.1f} ms  "
+                          f"{len(q.captured_queries)} consultas (simular uno: {len(q1.captured_queries)})")
+        for f in fallas:
+            self.stdout.write(f"  FALLA: {f}")
+        if fallas:
+            raise CommandError("Falló la verificación de la asignación FIFO")
+        self.stdout.write(self.style.SUCCESS("OK: asignación FIFO en lote"))
+
+    def _unidades(self, n, periodos):
+        datos = crear_datos_bench(n_unidades=n, n_periodos=periodos, monto=CIEN)
+        return list(Unidad.objects.filter(condominio=datos["condominio"]).order_by("id").values_list("id", flat=True))
+
+    def _asignar(self, cuerpo):
+        req = self.factory.post("/api/finanzas/pagos/asignar/", cuerpo, format="json")
+        force_authenticate(req, user=self.usuario)
+        return PagoViewSet.as_view({"post": "asignar"})(req)
+
+    def _cliente(self, unidades, monto):
+        """Lo que hace hoy el frontend: traer el estado de cuenta, repartir y registrar, pago por pago."""
+        vista = PagoViewSet.as_view({"post": "registrar"})
+        for unidad_id in unidades:
+            resto, detalles = monto, []
+            for cargo_id, saldo in (
+                EstadoCuentaUnidad.objects.filter(unidad_id=unidad_id, saldo__gt=0)
+                .order_by("periodo", "cargo_id").values_list("cargo_id", "saldo")
+            ):
+                if resto <= 0:
+                    break
+                aplicado = min(resto, saldo)
+                detalles.append({"cargo": cargo_id, "monto_aplicado": str(aplicado)})
+                resto -= aplicado
+            req = self.factory.post("/api/finanzas/pagos/registrar/",
+                                    {"unidad_id": unidad_id, "medio": "EFECTIVO", "detalles": detalles},
+                                    format="json")
+            force_authenticate(req, user=self.usuario)
+            resp = vista(req)
+            if resp.status_code != 201:
+                raise CommandError(f"registrar respondió {resp.status_code}: {resp.data}")
@@ -0,0 +1,102 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from myapp.finanzas import bnb
+from myapp.finanzas.bnb_fake import cfg_para, iniciar_fake_bnb
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga contra un BNB falso en proceso: latencias de qr_simple_status con el cliente "
+        "compartido (keep-alive + token cacheado) vs una conexión y un token nuevos por llamada, "
+        "y tiempo de respuesta con el circuit breaker abierto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=8)
+        parser.add_argument("--llamadas", type=int, default=200, help="Llamadas por hilo")
+        parser.add_argument("--latencia_ms", type=int, default=5, help="Latencia simulada del banco")
+
+    def _carga(self, hilos, llamadas, fn):
+        tiempos, errores = [], []
+        lock = threading.Lock()
+
+        def trabajar():
+            propios, fallas = [], 0
+            for _ in range(llamadas):
+                t0 = time.perf_counter()
+                try:
+                    fn()
+                except bnb.BNBClientError:
+                    fallas += 1
+                propios.append(time.perf_counter() - t0)
+            with lock:
+                tiempos.extend(propios)
+                errores.append(fallas)
+
+        t0 = time.perf_counter()
+        ts = [threading.Thread(target=trabajar) for _ in range(hilos)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        total = time.perf_counter() - t0
+        return tiempos, sum(errores), total
+
+    def _informe(self, nombre, tiempos, errores, total):
+        self.stdout.write(
+            f"{nombre:<28} {len(tiempos) / total:8.0f} llamadas/s  "
+            f"p50 {statistics.median(tiempos) * 1000:6.2f} ms  p95 {_percentil(tiempos, 0.95) * 1000:6.2f} ms  "
+            f"p99 {_percentil(tiempos, 0.99) * 1000:6.2f} ms  errores {errores}"
+        )
+
+    def handle(self, *args, **opts):
+        hilos, llamadas = max(1, opts["hilos"]), max(1, opts["llamadas"])
+        srv = iniciar_fake_bnb(latencia=opts["latencia_ms"] / 1000.0)
+        try:
+            with override_settings(BNB_CFG=cfg_para(srv, RETRIES=1, BREAKER_FALLAS=5, BREAKER_ENFRIAMIENTO=30)):
+                bnb.reiniciar_estado()
+                qr_id = bnb.BNBClient().qr_simple_create("BOB", "bench", "10.00")["id"]
+
+                # Sin pool ni caché de token: lo que costaba cada llamada antes
+                def sin_pool():
+                    import requests
+                    c = bnb.BNBClient()
+                    with requests.Session() as s:
+                        tok = s.post(c.auth_base + bnb.RUTA_TOKEN, timeout=c.timeout,
+                                     json={"accountId": "fake", "authorizationId": "fake"}).json()["message"]
+                        s.post(c.qr_base + bnb.RUTA_QR_ESTADO, json={"qrId": qr_id}, timeout=c.timeout,
+                               headers={"Authorization": f"Bearer {tok}"}).json()
+
+                conexiones0 = srv.contador["conexiones"]
+                self._informe("sin pool / token por llamada", *self._carga(hilos, llamadas, sin_pool))
+                self.stdout.write(f"  conexiones abiertas: {srv.contador['conexiones'] - conexiones0}")
+
+                conexiones0, tokens0 = srv.contador["conexiones"], srv.contador["token"]
+                cliente = bnb.BNBClient()
+                self._informe("cliente compartido", *self._carga(hilos, llamadas, lambda: cliente.qr_simple_status(qr_id)))
+                self.stdout.write(
+                    f"  conexiones abiertas: {srv.contador['conexiones'] - conexiones0}  "
+                    f"tokens pedidos: {srv.contador['token'] - tokens0}"
+                )
+
+                # Banco caído: tras BREAKER_FALLAS fallas el resto falla rápido
+                srv.tasa_error = 1.0
+                self._informe("banco caído (breaker)", *self._carga(hilos, llamadas, lambda: cliente.qr_simple_status(qr_id)))
+                self.stdout.write(f"  estado del breaker: {bnb.get_breaker().estado}  "
+                                  f"pedidos que llegaron al banco: {srv.contador['errores']}")
+        finally:
+            srv.shutdown()
+            srv.server_close()
+            bnb.reiniciar_estado()
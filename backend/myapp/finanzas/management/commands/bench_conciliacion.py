@@ -0,0 +1,113 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp.finanzas.conciliacion import Conciliador, leer_extracto
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.models import Cargo, Pago
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un extracto CSV sintético (por defecto 100k líneas: referencias a pagos, abonos solo por "
+        "monto, depósitos con código de unidad, ruido y débitos) y lo concilia contra pagos PENDIENTE y "
+        "cargos creados para la prueba. Verifica los conteos esperados. Todo se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lineas", type=int, default=100_000)
+        parser.add_argument("--lote", type=int, default=2000)
+        parser.add_argument("--tracemalloc", action="store_true",
+                            help="Medir el pico de memoria de Python (hace más lenta la corrida)")
+        parser.add_argument("--semilla", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        n = max(5, opts["lineas"])
+        # Un quinto de cada tipo; las de referencia se reparten entre ref_externa y '#<id>' en la glosa
+        n_ref = n_monto = n_unidad = n_ruido = n // 5
+        n_debito = n - 4 * (n // 5)
+        fallas = []
+
+        with transaction.atomic():
+            datos = crear_datos_bench(n_unidades=n_unidad)
+            condominio = datos["condominio"]
+            # Montos únicos desde 200.00 para que el match por monto no sea ambiguo
+            pagos = Pago.objects.bulk_create([
+                Pago(monto=Decimal(20000 + i) / 100, medio="TRANSFERENCIA", estado="PENDIENTE",
+                     ref_externa=f"BENCH-REF-{i}" if i < n_ref and i % 2 == 0 else None)
+                for i in range(n_ref + n_monto)
+            ], batch_size=5000)
+            unidades = list(
+                Cargo.objects.filter(unidad__condominio=condominio).values_list("unidad__codigo", "monto")
+            )
+
+            hoy = date.today()
+            filas = []
+            for p in pagos[:n_ref]:
+                if p.ref_externa:
+                    filas.append((p.monto, p.ref_externa, "TRANSFERENCIA RECIBIDA"))
+                else:
+                    filas.append((p.monto, "", f"Pago expensas #{p.id}"))
+            filas += [(p.monto, f"OP{i:08d}", "ABONO") for i, p in enumerate(pagos[n_ref:])]
+            filas += [(monto, "", f"DEPOSITO {codigo}") for codigo, monto in unidades]
+            filas += [(Decimal(100 + i % 99) / 100, f"ZZ{i}", "VARIOS") for i in range(n_ruido)]
+            filas += [(-Decimal(50), f"DB{i}", "COMISION") for i in range(n_debito)]
+            random.Random(opts["semilla"]).shuffle(filas)
+
+            fd, ruta = tempfile.mkstemp(suffix=".csv")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                    f.write("Fecha;Referencia;Glosa;Importe\n")
+                    for monto, ref, glosa in filas:
+                        f.write(f"{hoy:%d/%m/%Y};{ref};{glosa};{str(monto).replace('.', ',')}\n")
+                tamano = os.path.getsize(ruta)
+
+                conciliador = Conciliador(condominio_id=condominio.id, lote=opts["lote"])
+                if opts["tracemalloc"]:
+                    tracemalloc.start()
+                t0 = time.perf_counter()
+                with open(ruta, "rb") as f:
+                    stats = conciliador.procesar(leer_extracto(f))
+                dt = time.perf_counter() - t0
+                pico = tracemalloc.get_traced_memory()[1] if opts["tracemalloc"] else None
+                tracemalloc.stop()
+            finally:
+                os.unlink(ruta)
+
+            esperado = {
+                "lineas": n,
+                "conciliados_pago": n_ref + n_monto,
+                "pagos_aprobados": n_ref + n_monto,
+                "conciliados_cargo": n_unidad,
+                "pagos_creados": n_unidad,
+                "cargos_pagados": n_unidad,
+                "sin_match": n_ruido,
+                "debitos_ignorados": n_debito,
+            }
+            for clave, valor in esperado.items():
+                if stats.get(clave, 0) != valor:
+                    fallas.append(f"{clave}: {stats.get(clave, 0)} (esperado {valor})")
+            if Pago.objects.filter(id__in=[p.id for p in pagos]).exclude(estado="APROBADO").exists():
+                fallas.append("quedaron pagos PENDIENTE")
+            if Cargo.objects.filter(unidad__condominio=condominio).exclude(estado="PAGADO").exists():
+                fallas.append("quedaron cargos sin PAGADO")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{n} líneas ({tamano / 1024 / 1024:.1f} MB) conciliadas en {dt:.2f} s "
+                          f"({n / dt:,.0f} líneas/s)")
+        if pico is not None:
+            self.stdout.write(f"pico de memoria Python: {pico / 1024 / 1024:.1f} MB")
+        self.stdout.write("  " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items())))
+        for f in fallas:
+            self.stdout.write(f"  FALLA: {f}")
+        if fallas:
+            raise CommandError("Falló la verificación de la conciliación")
+        self.stdout.write(self.style.SUCCESS("OK: extracto conciliado con los conteos esperados"))
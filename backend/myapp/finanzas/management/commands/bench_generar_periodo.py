@@ -0,0 +1,40 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.services import generar_cargos_periodo
+
+
+class Command(BaseCommand):
+    help = "Mide generar_cargos_periodo sobre un condominio sintético (se revierte al final). Objetivo: < 1 s para 5k unidades."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--unidades", type=int, default=5000)
+        parser.add_argument("--regla", choices=["fija", "area_m2"], default="fija")
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            datos = crear_datos_bench(n_unidades=opts["unidades"], n_periodos=0)
+            kwargs = dict(
+                condominio_id=datos["condominio"].id,
+                concepto_id=datos["concepto"].id,
+                periodo=date(2030, 1, 1),
+                monto=Decimal("1.5") if opts["regla"] == "area_m2" else Decimal("350.00"),
+                regla=opts["regla"],
+                vencimiento=date(2030, 1, 10),
+            )
+            t0 = time.perf_counter()
+            primera = generar_cargos_periodo(**kwargs)
+            t1 = time.perf_counter()
+            segunda = generar_cargos_periodo(**kwargs)  # todo existe: solo conflictos
+            t2 = time.perf_counter()
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"generación:  {primera} en {(t1 - t0) * 1000:.1f} ms")
+        self.stdout.write(f"repetición:  {segunda} en {(t2 - t1) * 1000:.1f} ms")
+        estilo = self.style.SUCCESS if (t1 - t0) < 1 else self.style.WARNING
+        self.stdout.write(estilo(f"{opts['unidades'] / max(t1 - t0, 1e-9):.0f} cargos/s"))
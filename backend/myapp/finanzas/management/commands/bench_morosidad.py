@@ -0,0 +1,140 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.models import EstadoCuentaUnidad, Pago
+from myapp.finanzas.reportes import TRAMOS, morosidad, morosidad_unidades
+
+
+class Command(BaseCommand):
+    help = (
+        "Reporte de morosidad sobre ~1M cargos (por defecto 20000 unidades x 50 periodos): paga los "
+        "periodos viejos de casi todas las unidades, mide reportes/morosidad/ (todos los condominios y "
+        "uno solo) y el CSV, y compara los tramos con agregados independientes. Los datos se confirman "
+        "(para medir con VACUUM/visibilidad reales) y se borran al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--unidades", type=int, default=20_000)
+        parser.add_argument("--periodos", type=int, default=50)
+        parser.add_argument("--impagos", type=int, default=6, help="Periodos recientes sin pagar (default 6)")
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--limite-ms", type=float, default=1000.0, help="Falla si la mediana lo supera")
+        parser.add_argument("--conservar", action="store_true", help="No borrar los datos sintéticos")
+
+    def handle(self, *args, **opts):
+        n, periodos = max(1, opts["unidades"]), max(4, opts["periodos"])
+        impagos = min(max(0, opts["impagos"]), periodos)
+        desde = date(2020, 1, 1)
+        fallas = []
+
+        t0 = time.perf_counter()
+        with transaction.atomic():
+            datos = crear_datos_bench(n_unidades=n, n_periodos=periodos, desde=desde)
+            pago = Pago.objects.create(monto=Decimal("0.00"), medio="EFECTIVO", estado="APROBADO")
+            with connection.cursor() as cur:
+                # Una de cada diez unidades no paga nada (90+); el resto debe los últimos 'impagos' periodos
+                cur.execute(
+                    """
+                    INSERT INTO public.pagos_detalle (pago_id, cargo_id, monto_aplicado)
+                    SELECT %s, c.id, c.monto
+                      FROM public.cargos c
+                      JOIN public.unidades u ON u.id = c.unidad_id
+                     WHERE u.condominio_id = %s AND u.id %% 10 <> 0
+                       AND c.periodo < (%s::date + make_interval(months => %s))
+                    """,
+                    [pago.id, datos["condominio"].id, desde, periodos - impagos],
+                )
+        with connection.cursor() as cur:
+            cur.execute("VACUUM ANALYZE public.estado_cuenta")
+            cur.execute("ANALYZE public.unidades")
+        t_datos = time.perf_counter() - t0
+        condominio_id = datos["condominio"].id
+
+        try:
+            # Corte: 9 días después del último vencimiento (periodo + 10 días, ver crear_datos_bench)
+            # -> con 4+ periodos impagos hay filas en los cuatro tramos
+            anios, mes = divmod(desde.month - 1 + periodos - 1, 12)
+            fecha = date(desde.year + anios, mes + 1, 1) + timedelta(days=10 + 9)
+
+            tiempos = {}
+            for nombre, cond in (("todos", None), ("condominio", condominio_id)):
+                muestras = []
+                for _ in range(max(1, opts["repeticiones"])):
+                    t0 = time.perf_counter()
+                    res = morosidad(fecha, condominio_id=cond, top=20)
+                    muestras.append(time.perf_counter() - t0)
+                tiempos[nombre] = statistics.median(muestras)
+            t0 = time.perf_counter()
+            filas_csv = sum(1 for _ in morosidad_unidades(fecha, condominio_id))
+            t_csv = time.perf_counter() - t0
+
+            fallas += self._verificar(res, fecha, condominio_id, filas_csv)
+            for nombre, dt in tiempos.items():
+                if dt * 1000 > opts["limite_ms"]:
+                    fallas.append(f"{nombre}: {dt * 1000:.0f} ms > {opts['limite_ms']:.0f} ms")
+        finally:
+            if not opts["conservar"]:
+                self._borrar(datos, pago)
+
+        self.stdout.write(f"{n} unidades x {periodos} periodos ({n * periodos} cargos), "
+                          f"{impagos} impagos; datos en {t_datos:.1f} s; corte {fecha}")
+        for nombre, dt in tiempos.items():
+            self.stdout.write(f"  morosidad {nombre:10s} mediana {dt * 1000:8.1f} ms")
+        self.stdout.write(f"  CSV: {filas_csv} unidades en {t_csv * 1000:.1f} ms")
+        self.stdout.write("  tramos: " + ", ".join(f"{t[0]}={res['totales'][t[0]]}" for t in TRAMOS))
+        for f in fallas:
+            self.stdout.write(f"  FALLA: {f}")
+        if fallas:
+            raise CommandError("Falló la verificación del reporte de morosidad")
+        self.stdout.write(self.style.SUCCESS("OK: morosidad por tramos en una consulta"))
+
+    def _unidades(self, condominio_id):
+        from myapp.propiedades.models import Unidad
+
+        return Unidad.objects.filter(condominio_id=condominio_id).values("id")
+
+    def _verificar(self, res, fecha, condominio_id, filas_csv):
+        """Cada tramo contra un SUM independiente sobre estado_cuenta (por rango de vencimiento)."""
+        fallas = []
+        base = EstadoCuentaUnidad.objects.filter(
+            unidad_id__in=self._unidades(condominio_id), saldo__gt=0, vencimiento__lt=fecha,
+        ).exclude(estado_registrado="ANULADO")
+        for clave, d_desde, d_hasta in TRAMOS:
+            qs = base.filter(vencimiento__lte=fecha - timedelta(days=d_desde))
+            if d_hasta is not None:
+                qs = qs.filter(vencimiento__gte=fecha - timedelta(days=d_hasta))
+            esperado = qs.aggregate(s=Sum("saldo"))["s"] or Decimal("0.00")
+            if res["totales"][clave] != esperado:
+                fallas.append(f"{clave}: {res['totales'][clave]} (esperado {esperado})")
+        por_unidad = list(base.values("unidad_id").annotate(s=Sum("saldo")).order_by("-s", "unidad_id")[:20])
+        if [u["unidad_id"] for u in por_unidad] != [u["unidad_id"] for u in res["top"]]:
+            fallas.append("el top de unidades no coincide con el agregado por unidad")
+        cargos = [f["cargos"] for f in res["condominios"] + res["top"]] + [res["totales"]["cargos"]]
+        if not all(type(c) is int for c in cargos):
+            fallas.append(f"cargos no enteros: {sorted({type(c).__name__ for c in cargos})}")
+        if res["totales"]["cargos"] != base.count():
+            fallas.append(f"cargos: {res['totales']['cargos']} (esperado {base.count()})")
+        con_deuda = base.values("unidad_id").distinct().count()
+        if filas_csv != con_deuda or res["totales"]["unidades"] != con_deuda:
+            fallas.append(f"unidades: csv {filas_csv}, reporte {res['totales']['unidades']}, esperado {con_deuda}")
+        return fallas
+
+    def _borrar(self, datos, pago):
+        condominio_id = datos["condominio"].id
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute("DELETE FROM public.pagos_detalle WHERE pago_id = %s", [pago.id])
+            cur.execute("DELETE FROM public.pagos WHERE id = %s", [pago.id])
+            cur.execute(
+                "DELETE FROM public.cargos WHERE unidad_id IN (SELECT id FROM public.unidades WHERE condominio_id = %s)",
+                [condominio_id],
+            )
+            cur.execute("DELETE FROM public.unidades WHERE condominio_id = %s", [condominio_id])
+            cur.execute("DELETE FROM public.condominios WHERE id = %s", [condominio_id])
+            cur.execute("DELETE FROM public.conceptos WHERE id = %s", [datos["concepto"].id])
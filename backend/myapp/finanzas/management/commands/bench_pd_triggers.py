@@ -0,0 +1,110 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.models import Cargo, Pago, PagoDetalle
+
+TRIGGERS_SENTENCIA = ("trg_pd_recalc_cargos_ins", "trg_pd_recalc_cargos_upd", "trg_pd_recalc_cargos_del")
+
+# Filas de estado_cuenta (0008) que no coinciden con la vista de referencia
+SQL_DIFERENCIAS = """
+SELECT count(*)
+  FROM public.vw_estado_cuenta_unidad v
+  LEFT JOIN public.estado_cuenta ec ON ec.cargo_id = v.cargo_id
+ WHERE v.cargo_id = ANY(%s)
+   AND (ec.cargo_id IS NULL OR ec.pagado <> v.pagado OR ec.saldo <> v.saldo
+        OR ec.estado_registrado <> v.estado_registrado)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el trigger FOR EACH ROW (0002) contra los triggers FOR EACH STATEMENT (0007) "
+        "de pagos_detalle -> cargos. Las dos estrategias mantienen también estado_cuenta (0008): "
+        "la de sentencia llama a refresh_estado_cuenta con todos los cargos, la de fila lo hace por "
+        "el trigger de cargos que dispara cada UPDATE de recalc_estado_cargo (un refresco por línea); "
+        "tras cada paso se verifica estado_cuenta contra la vista. Todo corre en una transacción que "
+        "se revierte al final (ojo: toma un lock exclusivo sobre pagos_detalle mientras dura)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lineas", type=int, default=30, help="Detalles por pago (default 30)")
+        parser.add_argument("--repeticiones", type=int, default=20, help="Pagos por estrategia (default 20)")
+
+    def handle(self, *args, **opts):
+        lineas = max(1, opts["lineas"])
+        reps = max(1, opts["repeticiones"])
+
+        with transaction.atomic():
+            datos = crear_datos_bench(n_unidades=lineas)
+            cargo_ids = list(
+                Cargo.objects.filter(unidad__condominio=datos["condominio"]).values_list("id", flat=True)
+            )
+
+            resultados, diferencias = {}, {}
+            for estrategia in ("fila", "sentencia"):
+                self._configurar(estrategia)
+                resultados[estrategia], diferencias[estrategia] = self._medir(cargo_ids, reps)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{lineas} lineas x {reps} pagos por estrategia (ms promedio por sentencia, "
+                          f"incluye mantener estado_cuenta)")
+        self.stdout.write(f"{'estrategia':<10} {'insert':>9} {'update':>9} {'delete':>9} {'ms/linea':>9}")
+        for estrategia, (t_ins, t_upd, t_del) in resultados.items():
+            self.stdout.write(
+                f"{estrategia:<10} {t_ins:>9.2f} {t_upd:>9.2f} {t_del:>9.2f} {t_ins / lineas:>9.3f}"
+            )
+        malas = {e: n for e, n in diferencias.items() if n}
+        if malas:
+            raise CommandError(f"estado_cuenta quedó desfasado de la vista: {malas}")
+        fila, sent = resultados["fila"][0], resultados["sentencia"][0]
+        if sent > 0:
+            self.stdout.write(self.style.SUCCESS(f"insert: sentencia {fila / sent:.1f}x más rápido que fila"))
+
+    def _configurar(self, estrategia):
+        with connection.cursor() as cur:
+            if estrategia == "fila":
+                for t in TRIGGERS_SENTENCIA:
+                    cur.execute(f"ALTER TABLE public.pagos_detalle DISABLE TRIGGER {t}")
+                cur.execute(
+                    "CREATE TRIGGER trg_pd_recalc_cargo_bench "
+                    "AFTER INSERT OR UPDATE OR DELETE ON public.pagos_detalle "
+                    "FOR EACH ROW EXECUTE FUNCTION public.trg_recalc_cargo_from_pd()"
+                )
+            else:
+                cur.execute("DROP TRIGGER IF EXISTS trg_pd_recalc_cargo_bench ON public.pagos_detalle")
+                for t in TRIGGERS_SENTENCIA:
+                    cur.execute(f"ALTER TABLE public.pagos_detalle ENABLE TRIGGER {t}")
+
+    def _medir(self, cargo_ids, reps):
+        """Tiempos promedio (insert, update, delete) y filas de estado_cuenta desfasadas tras cada paso."""
+        t_ins = t_upd = t_del = 0.0
+        diferencias = 0
+        for _ in range(reps):
+            pago = Pago.objects.create(monto=Decimal("0.00"), medio="EFECTIVO")
+            dets = [PagoDetalle(pago=pago, cargo_id=cid, monto_aplicado=Decimal("10.00")) for cid in cargo_ids]
+
+            t0 = time.perf_counter()
+            PagoDetalle.objects.bulk_create(dets)
+            t_ins += time.perf_counter() - t0
+            diferencias += self._diferencias(cargo_ids)
+
+            t0 = time.perf_counter()
+            PagoDetalle.objects.filter(pago=pago).update(monto_aplicado=Decimal("0.00"))
+            t_upd += time.perf_counter() - t0
+            diferencias += self._diferencias(cargo_ids)
+
+            t0 = time.perf_counter()
+            PagoDetalle.objects.filter(pago=pago).delete()
+            t_del += time.perf_counter() - t0
+            diferencias += self._diferencias(cargo_ids)
+        return (t_ins * 1000 / reps, t_upd * 1000 / reps, t_del * 1000 / reps), diferencias
+
+    def _diferencias(self, cargo_ids):
+        with connection.cursor() as cur:
+            cur.execute(SQL_DIFERENCIAS, [cargo_ids])
+            return cur.fetchone()[0]
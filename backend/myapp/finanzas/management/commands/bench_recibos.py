@@ -0,0 +1,63 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.finanzas import recibos
+from myapp.finanzas.models import Cargo, Concepto, Documento, Pago, PagoDetalle
+from myapp.propiedades.models import Condominio, Unidad
+
+
+def contexto_sintetico(lineas):
+    """Contexto de recibo con instancias en memoria (no toca la base)."""
+    condominio = Condominio(id=1, nombre="Condominio Bench")
+    unidad = Unidad(id=1, condominio=condominio, codigo="A-101")
+    concepto = Concepto(id=1, nombre="CUOTA", codigo="CUO")
+    pago = Pago(id=1, monto=Decimal("0"), medio="EFECTIVO", fecha=timezone.now())
+    detalles = [
+        PagoDetalle(
+            id=i + 1, pago=pago, monto_aplicado=Decimal("350.00"),
+            cargo=Cargo(id=i + 1, unidad=unidad, concepto=concepto, periodo=date(2025, 1 + i % 12, 1),
+                        monto=Decimal("350.00")),
+        )
+        for i in range(lineas)
+    ]
+    doc = Documento(id=1, numero="R-2025-000001", tipo="RECIBO", moneda="BOB",
+                    total=Decimal("350.00") * lineas, condominio=condominio)
+    return {"documento": doc, "detalles": detalles, "unidad": unidad,
+            "hoy": timezone.now(), "SITE_NAME": "Condominio"}
+
+
+class Command(BaseCommand):
+    help = "PDFs por segundo: renderizador frío (uno nuevo por PDF) vs tibio (reutilizado)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pdfs", type=int, default=50)
+        parser.add_argument("--lineas", type=int, default=12, help="Detalles por recibo")
+
+    def handle(self, *args, **opts):
+        n = max(1, opts["pdfs"])
+        contexto = contexto_sintetico(opts["lineas"])
+
+        t0 = time.perf_counter()
+        recibos.RenderizadorRecibos().render(contexto)
+        primero = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(n):
+            recibos.RenderizadorRecibos().render(contexto)
+        frio = time.perf_counter() - t0
+
+        r = recibos.RenderizadorRecibos()
+        t0 = time.perf_counter()
+        for _ in range(n):
+            r.render(contexto)
+        tibio = time.perf_counter() - t0
+
+        motor = "WeasyPrint" if r.HTML is not None else "ReportLab"
+        self.stdout.write(f"motor: {motor}  primer PDF (imports incluidos): {primero * 1000:.0f} ms")
+        self.stdout.write(f"frío:  {n / frio:7.1f} PDF/s")
+        self.stdout.write(f"tibio: {n / tibio:7.1f} PDF/s")
+        self.stdout.write(self.style.SUCCESS(f"tibio {frio / tibio:.1f}x"))
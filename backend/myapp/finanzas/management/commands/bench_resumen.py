@@ -0,0 +1,108 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from myapp.finanzas.asignacion import asignar_pagos
+from myapp.finanzas.management.bench import crear_datos_bench
+from myapp.finanzas.reportes import SQL_DIRECTO, diferencias_resumen
+from myapp.finanzas.transiciones import transicionar_pagos
+from myapp.finanzas.views import ReportesViewSet
+from myapp.propiedades.models import Unidad
+
+
+class Command(BaseCommand):
+    help = (
+        "Rollup resumen_finanzas: crea un condominio con varios años de cargos y pagos, mide "
+        "reportes/resumen/ (agrupado por año y por periodo) contra agregar estado_cuenta en cada consulta, "
+        "verifica que el rollup coincida y que una anulación se refleje con un refresco incremental. "
+        "Todo se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--unidades", type=int, default=500)
+        parser.add_argument("--anios", type=int, default=5)
+        parser.add_argument("--repeticiones", type=int, default=20)
+
+    def handle(self, *args, **opts):
+        n, meses, reps = max(1, opts["unidades"]), max(1, opts["anios"]) * 12, max(1, opts["repeticiones"])
+        vista = ReportesViewSet.as_view({"get": "resumen"})
+        factory, usuario = APIRequestFactory(), User(username="bench")
+        fallas = []
+
+        def consultar(**params):
+            req = factory.get("/api/finanzas/reportes/resumen/", params)
+            force_authenticate(req, user=usuario)
+            resp = vista(req)
+            if resp.status_code != 200:
+                raise CommandError(f"resumen respondió {resp.status_code}: {resp.data}")
+            return resp.data
+
+        with transaction.atomic():
+            datos = crear_datos_bench(n_unidades=n, n_periodos=meses)
+            condominio_id = datos["condominio"].id
+            unidades = list(Unidad.objects.filter(condominio_id=condominio_id).values_list("id", flat=True))
+            # La mitad de las unidades paga un año de cuotas (FIFO, los periodos más viejos)
+            pagos = asignar_pagos([{"unidad_id": u, "monto": Decimal("1200.00")} for u in unidades[::2]],
+                                  "EFECTIVO", generar_documento=False)
+
+            t0 = time.perf_counter()
+            consultar(condominio=condominio_id)
+            t_primero = time.perf_counter() - t0
+
+            tiempos = {}
+            for agrupar in ("anio", "periodo", "anio,concepto"):
+                t0 = time.perf_counter()
+                for _ in range(reps):
+                    consultar(condominio=condominio_id, agrupar=agrupar)
+                tiempos[agrupar] = (time.perf_counter() - t0) / reps
+            t0 = time.perf_counter()
+            for _ in range(reps):
+                with connection.cursor() as cur:
+                    cur.execute(f"SELECT * FROM ({SQL_DIRECTO}) d WHERE d.condominio_id = %s", [condominio_id])
+                    cur.fetchall()
+            t_directo = (time.perf_counter() - t0) / reps
+
+            totales = consultar(condominio=condominio_id, agrupar="anio")["totales"]
+            esperado_facturado = Decimal("100.00") * n * meses
+            esperado_recaudado = Decimal("1200.00") * len(pagos)
+            if totales["cargos"] != n * meses or totales["facturado"] != esperado_facturado:
+                fallas.append(f"facturado {totales['facturado']} en {totales['cargos']} cargos "
+                              f"(esperado {esperado_facturado} en {n * meses})")
+            if totales["recaudado"] != esperado_recaudado:
+                fallas.append(f"recaudado {totales['recaudado']} (esperado {esperado_recaudado})")
+            difs = diferencias_resumen(limite=5)
+            if difs:
+                fallas.append(f"el rollup difiere de estado_cuenta: {difs}")
+
+            # Incremental: anular un pago toca solo los grupos de sus cargos
+            transicionar_pagos([pagos[0]["pago"]], "ANULADO")
+            with connection.cursor() as cur:
+                cur.execute("SELECT count(DISTINCT (condominio_id, periodo, concepto_id)) "
+                            "FROM public.resumen_finanzas_pendientes")
+                pendientes = cur.fetchone()[0]
+            t0 = time.perf_counter()
+            despues = consultar(condominio=condominio_id, agrupar="anio")["totales"]
+            t_incremental = time.perf_counter() - t0
+            if despues["recaudado"] != esperado_recaudado - Decimal("1200.00"):
+                fallas.append(f"tras anular, recaudado {despues['recaudado']}")
+            if pendientes != len(pagos[0]["detalles"]):
+                fallas.append(f"anular un pago dejó {pendientes} grupos pendientes "
+                              f"(esperado {len(pagos[0]['detalles'])})")
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{n} unidades x {meses} periodos ({n * meses} cargos), {len(pagos)} pagos")
+        self.stdout.write(f"  primera consulta (refresca todo el condominio) {t_primero * 1000:8.1f} ms")
+        for agrupar, dt in tiempos.items():
+            self.stdout.write(f"  resumen agrupar={agrupar:14s} {dt * 1000:8.2f} ms")
+        self.stdout.write(f"  agregando estado_cuenta en cada consulta  {t_directo * 1000:8.2f} ms")
+        self.stdout.write(f"  tras anular un pago ({pendientes} grupos)      {t_incremental * 1000:8.2f} ms")
+        for f in fallas:
+            self.stdout.write(f"  FALLA: {f}")
+        if fallas:
+            raise CommandError("Falló la verificación del rollup")
+        self.stdout.write(self.style.SUCCESS("OK: rollup consistente y refresco incremental"))
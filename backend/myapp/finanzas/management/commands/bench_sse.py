@@ -0,0 +1,89 @@
+import asyncio
+import json
+import resource
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from myapp.finanzas.eventos import CANAL, Espera, Hub, conninfo_default, flujo_sse
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga de clientes en espera en un solo proceso: N flujos SSE suscritos al hub, "
+        "memoria por cliente y latencia desde el aviso hasta el evento entregado. "
+        "Con --pg los avisos van por pg_notify y el LISTEN real (requiere Postgres)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clientes", type=int, default=5000)
+        parser.add_argument("--intentos", type=int, default=2000, help="Intentos distintos (varios clientes por intento)")
+        parser.add_argument("--latido", type=float, default=15.0)
+        parser.add_argument("--pg", action="store_true", help="Publicar con pg_notify en vez de en memoria")
+
+    def handle(self, *args, **opts):
+        asyncio.run(self._bench(max(1, opts["clientes"]), max(1, opts["intentos"]), opts["latido"], opts["pg"]))
+
+    async def _bench(self, n_clientes, n_intentos, latido, usar_pg):
+        hub = Hub(escuchar_pg=usar_pg)
+
+        async def estado_inicial(intento_id):
+            return {"intento_id": intento_id, "estado_intento": "EN_PROCESO",
+                    "pago_id": intento_id, "estado_pago": "PENDIENTE", "documento_id": None}
+
+        recibido = {}
+
+        async def cliente(i):
+            espera = Espera(1 + i % n_intentos, hub=hub, recargar=estado_inicial)
+            await espera.abrir()
+            async for chunk in flujo_sse(espera, duracion=3600, latido=latido):
+                if '"APROBADO"' in chunk:
+                    recibido[i] = time.perf_counter()
+
+        tracemalloc.start()
+        mem0 = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        tareas = [asyncio.create_task(cliente(i)) for i in range(n_clientes)]
+        while hub.esperando < n_clientes * 2:  # cada cliente: clave intento + clave pago
+            await asyncio.sleep(0.01)
+        conexion_s = time.perf_counter() - t0
+        mem = tracemalloc.get_traced_memory()[0] - mem0
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{n_clientes} clientes en espera sobre {n_intentos} intentos en {conexion_s:.2f} s; "
+            f"~{mem / n_clientes / 1024:.1f} KiB por cliente; RSS máx "
+            f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB"
+        )
+
+        publicado = {}
+        if usar_pg:
+            import psycopg
+
+            while hub._tarea is None or not hub._subs:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.5)  # LISTEN activo
+            async with await psycopg.AsyncConnection.connect(conninfo_default(), autocommit=True) as conn:
+                for intento_id in range(1, n_intentos + 1):
+                    publicado[intento_id] = time.perf_counter()
+                    await conn.execute("SELECT pg_notify(%s, %s)", [CANAL, json.dumps(
+                        {"tipo": "intento", "id": intento_id, "pago_id": intento_id, "estado": "APROBADO"})])
+        else:
+            for intento_id in range(1, n_intentos + 1):
+                publicado[intento_id] = time.perf_counter()
+                hub.publicar({"tipo": "intento", "id": intento_id, "pago_id": intento_id, "estado": "APROBADO"})
+                await asyncio.sleep(0)  # como el LISTEN real: un aviso por vuelta del loop
+
+        await asyncio.wait_for(asyncio.gather(*tareas), timeout=120)
+        latencias = [recibido[i] - publicado[1 + i % n_intentos] for i in range(n_clientes) if i in recibido]
+        self.stdout.write(
+            f"avisos {n_intentos} ({'pg_notify' if usar_pg else 'en memoria'}) -> eventos entregados "
+            f"{len(latencias)}/{n_clientes}; latencia p50 {statistics.median(latencias) * 1000:.2f} ms, "
+            f"p99 {_percentil(latencias, 0.99) * 1000:.2f} ms; suscripciones restantes {hub.esperando}"
+        )
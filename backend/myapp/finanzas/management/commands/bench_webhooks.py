@@ -0,0 +1,109 @@
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+
+from myapp.finanzas.models import PagoIntento, WebhookEvento
+from myapp.finanzas.views import fake_webhook
+from myapp.finanzas.webhooks import procesar_pendientes
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay de callbacks grabados contra fake_webhook: acuses por segundo (ingreso), duplicados "
+        "descartados y eventos por segundo del procesador. --grabar arma una grabación sintética con "
+        "intentos existentes. ¡Aprueba pagos de verdad: usar sobre una base de pruebas!"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--archivo", type=str, required=True, help="JSONL de callbacks {intento_id, status, event_id}")
+        parser.add_argument("--grabar", type=int, default=0, help="Generar N callbacks en --archivo en vez de reproducir")
+        parser.add_argument("--duplicados", type=float, default=0.3, help="Fracción de reintentos al grabar")
+        parser.add_argument("--hilos", type=int, default=8, help="Clientes simultáneos en el replay")
+
+    def handle(self, *args, **opts):
+        if opts["grabar"]:
+            return self._grabar(opts["archivo"], opts["grabar"], opts["duplicados"])
+
+        with open(opts["archivo"]) as f:
+            callbacks = [json.loads(linea) for linea in f if linea.strip()]
+        if not callbacks:
+            raise CommandError("Grabación vacía")
+
+        antes = WebhookEvento.objects.count()
+        rf = RequestFactory()
+        tiempos, lock = [], threading.Lock()
+        cola = list(callbacks)
+
+        def cliente():
+            propios = []
+            while True:
+                with lock:
+                    if not cola:
+                        break
+                    cb = cola.pop(0)
+                req = rf.post("/api/pasarelas/fake/webhook/", {k: str(v) for k, v in cb.items()})
+                t0 = time.perf_counter()
+                resp = fake_webhook(req)
+                propios.append(time.perf_counter() - t0)
+                if resp.status_code != 200:
+                    self.stderr.write(f"HTTP {resp.status_code} para {cb}")
+            with lock:
+                tiempos.extend(propios)
+
+        # Solo ingreso: el procesamiento se mide aparte
+        with override_settings(FINANZAS_WEBHOOKS_EN_PROCESO=False, FINANZAS_PDF_PRERENDER=False):
+            t0 = time.perf_counter()
+            hilos = [threading.Thread(target=cliente) for _ in range(max(1, opts["hilos"]))]
+            for h in hilos:
+                h.start()
+            for h in hilos:
+                h.join()
+            ingreso = time.perf_counter() - t0
+            nuevos = WebhookEvento.objects.count() - antes
+            self.stdout.write(
+                f"ingreso: {len(callbacks)} callbacks en {ingreso:.2f} s ({len(callbacks) / ingreso:.0f} acuses/s), "
+                f"p50 {statistics.median(tiempos) * 1000:.2f} ms, p99 {_percentil(tiempos, 0.99) * 1000:.2f} ms; "
+                f"guardados {nuevos}, duplicados descartados {len(callbacks) - nuevos}"
+            )
+
+            t0 = time.perf_counter()
+            total = fallidos = 0
+            while True:
+                p, f = procesar_pendientes(500)
+                total, fallidos = total + p, fallidos + f
+                if not p:
+                    break
+            proceso = time.perf_counter() - t0
+            self.stdout.write(
+                f"procesamiento: {total} eventos en {proceso:.2f} s ({total / max(proceso, 1e-9):.0f} eventos/s), "
+                f"fallidos {fallidos}"
+            )
+
+    def _grabar(self, archivo, n, duplicados):
+        intentos = list(
+            PagoIntento.objects.filter(pago__isnull=False).exclude(estado="APROBADO")
+            .order_by("id").values_list("id", flat=True)[:n]
+        )
+        if not intentos:
+            raise CommandError("No hay intentos con pago para grabar callbacks")
+        callbacks = []
+        for i in range(n):
+            intento_id = intentos[i % len(intentos)]
+            callbacks.append({"intento_id": intento_id, "status": "approved", "event_id": f"bench-{intento_id}-{i}"})
+            if random.random() < duplicados:
+                callbacks.append(dict(callbacks[-1]))  # reintento de la pasarela: mismo event_id
+        random.shuffle(callbacks)
+        with open(archivo, "w") as f:
+            for cb in callbacks:
+                f.write(json.dumps(cb) + "\n")
+        self.stdout.write(self.style.SUCCESS(f"Grabados {len(callbacks)} callbacks en {archivo}"))
@@ -0,0 +1,56 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.finanzas.conciliacion import Conciliador, leer_extracto
+
+COLUMNAS_REPORTE = ("linea", "fecha", "monto", "referencia", "descripcion", "motivo")
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia un extracto bancario (CSV u OFX) contra pagos PENDIENTE y, con --condominio, contra "
+        "los cargos abiertos de sus unidades. Lee el archivo en streaming y aplica por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del extracto")
+        parser.add_argument("--condominio", type=int, help="Habilita el match por unidad y saldo de cargos")
+        parser.add_argument("--ventana", type=int, default=3, help="Días de tolerancia en la fecha (default 3)")
+        parser.add_argument("--formato", choices=("csv", "ofx"), help="Por defecto se detecta")
+        parser.add_argument("--lote", type=int, default=2000, help="Líneas por lote (default 2000)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo informar, sin aplicar")
+        parser.add_argument("--reporte", help="CSV donde escribir las líneas no conciliadas")
+
+    def handle(self, *args, **opts):
+        reporte = open(opts["reporte"], "w", newline="", encoding="utf-8") if opts["reporte"] else None
+        try:
+            if reporte:
+                escritor = csv.DictWriter(reporte, fieldnames=COLUMNAS_REPORTE)
+                escritor.writeheader()
+                sin_match = escritor.writerow
+            else:
+                sin_match = None
+            conciliador = Conciliador(
+                condominio_id=opts["condominio"], ventana_dias=opts["ventana"],
+                aplicar=not opts["dry_run"], lote=opts["lote"], sin_match=sin_match,
+            )
+            t0 = time.perf_counter()
+            with open(opts["archivo"], "rb") as f:
+                try:
+                    stats = conciliador.procesar(leer_extracto(f, opts["formato"]))
+                except ValueError as e:
+                    raise CommandError(str(e))
+            dt = time.perf_counter() - t0
+        finally:
+            if reporte:
+                reporte.close()
+
+        self.stdout.write(f"{stats.get('lineas', 0)} líneas en {dt:.2f} s")
+        for clave in sorted(stats):
+            self.stdout.write(f"  {clave}: {stats[clave]}")
+        if opts["dry_run"]:
+            self.stdout.write("dry-run: no se aplicó nada")
+        if reporte:
+            self.stdout.write(f"No conciliadas en {opts['reporte']}")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myapp.finanzas.services import expirar_intentos
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca EXPIRO los PagoIntento CREADO/EN_PROCESO con expires_at vencido, en UPDATEs por lotes "
+        "sobre el índice parcial de intentos activos. Sin --una_vez repite cada --intervalo s."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Filas por UPDATE (default 1000)")
+        parser.add_argument("--intervalo", type=float, default=60.0, help="Segundos entre barridos (default 60)")
+        parser.add_argument("--una_vez", action="store_true", help="Un solo barrido y salir")
+        parser.add_argument("--dry-run", action="store_true", help="Solo contar los vencidos")
+
+    def handle(self, *args, **opts):
+        lote = max(1, opts["lote"])
+        while True:
+            close_old_connections()
+            t0 = time.perf_counter()
+            n = expirar_intentos(lote=lote, dry_run=opts["dry_run"])
+            if n or opts["una_vez"]:
+                verbo = "Vencidos (sin cambios)" if opts["dry_run"] else "Expirados"
+                self.stdout.write(f"{verbo}: {n} intentos ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+            if opts["una_vez"] or opts["dry_run"]:
+                return
+            try:
+                time.sleep(opts["intervalo"])
+            except KeyboardInterrupt:
+                return
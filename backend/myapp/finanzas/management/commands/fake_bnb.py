@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from myapp.finanzas.bnb_fake import FakeBNBServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Levanta un BNB falso (token + QR Simple) para desarrollo y pruebas de carga. "
+        "Apunta BNB_AUTH_BASE y BNB_QR_BASE a la URL que imprime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", type=str, default="127.0.0.1")
+        parser.add_argument("--puerto", type=int, default=8099)
+        parser.add_argument("--latencia_ms", type=int, default=0, help="Demora por pedido")
+        parser.add_argument("--tasa_error", type=float, default=0.0, help="Fracción de pedidos que responden 503")
+        parser.add_argument("--token_ttl", type=int, default=3600, help="Vigencia de los tokens en segundos")
+        parser.add_argument("--pagar_tras", type=float, default=None,
+                            help="Segundos tras los que un QR pasa solo a 'usado' (2)")
+
+    def handle(self, *args, **opts):
+        srv = FakeBNBServer(
+            (opts["host"], opts["puerto"]),
+            latencia=opts["latencia_ms"] / 1000.0,
+            tasa_error=opts["tasa_error"],
+            token_ttl=opts["token_ttl"],
+            pagar_tras=opts["pagar_tras"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"BNB falso escuchando en {srv.base_url} (Ctrl+C para salir)"))
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.server_close()
+            self.stdout.write(f"Pedidos atendidos: {srv.contador}")
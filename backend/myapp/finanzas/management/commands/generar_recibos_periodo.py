@@ -0,0 +1,65 @@
+import os
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.finanzas.models import Documento
+from myapp.finanzas.recibos import empaquetar_zip, generar_recibos_lote, unir_pdfs
+
+
+class Command(BaseCommand):
+    help = (
+        "Cierre de mes: genera los PDF de todos los Documentos de un condominio y periodo "
+        "(YYYY-MM) en paralelo en MEDIA_ROOT/documentos, registra los DocumentoArchivo "
+        "en bloque y opcionalmente arma un ZIP o un PDF unido."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--condominio", type=int, required=True)
+        parser.add_argument("--periodo", type=str, required=True, help="YYYY-MM (por fecha del documento)")
+        parser.add_argument("--procesos", type=int, default=None, help="Workers (default: todos los núcleos)")
+        parser.add_argument("--chunk", type=int, default=200, help="Documentos por bloque (default 200)")
+        parser.add_argument("--forzar", action="store_true", help="Regenerar aunque el PDF vigente ya exista")
+        parser.add_argument("--zip", action="store_true", help="Empaquetar todo en un ZIP")
+        parser.add_argument("--unir", action="store_true", help="Unir todo en un solo PDF (requiere pypdf)")
+
+    def handle(self, *args, **opts):
+        try:
+            anio, mes = (int(x) for x in opts["periodo"].split("-")[:2])
+            desde = date(anio, mes, 1)
+        except Exception:
+            raise CommandError("--periodo debe ser YYYY-MM")
+        hasta = date(anio + (mes == 12), mes % 12 + 1, 1)
+
+        docs = Documento.objects.filter(
+            condominio_id=opts["condominio"], fecha__gte=desde, fecha__lt=hasta
+        )
+
+        def progreso(stats, segundos):
+            self.stdout.write(
+                f"  {stats['documentos']} docs - generados {stats['generados']} - "
+                f"reutilizados {stats['reutilizados']} - {stats['generados'] / max(segundos, 1e-9):.1f} PDF/s"
+            )
+
+        stats, rutas = generar_recibos_lote(
+            docs, procesos=opts["procesos"], chunk=max(1, opts["chunk"]),
+            forzar=opts["forzar"], progreso=progreso,
+        )
+
+        base = os.path.join(settings.MEDIA_ROOT, "documentos", "lotes",
+                            f"recibos_{opts['condominio']}_{desde:%Y-%m}")
+        if opts["zip"] and rutas:
+            self.stdout.write(f"ZIP: {empaquetar_zip(rutas, base + '.zip')}")
+        if opts["unir"] and rutas:
+            try:
+                self.stdout.write(f"PDF unido: {unir_pdfs(rutas, base + '.pdf')}")
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: {stats['documentos']} documentos, {stats['generados']} generados, "
+            f"{stats['reutilizados']} reutilizados, {stats['errores']} errores, "
+            f"{stats['bytes'] / 1048576:.1f} MB en {stats['segundos']:.1f} s "
+            f"({stats['pdf_por_segundo']:.1f} PDF/s)"
+        ))
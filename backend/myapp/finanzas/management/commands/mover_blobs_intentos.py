@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from myapp.finanzas.intento_blobs import mover_inline
+
+
+def _mb(n):
+    return f"{n / 1024 / 1024:.2f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve bnb_qr_image_b64/bnb_payload/raw_request/raw_response de pagos_intentos al side store "
+        "comprimido (pagos_intentos_blobs), por lotes, e informa los bytes recuperados en la tabla."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="Filas por transacción (default 500)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo medir, sin mover nada")
+
+    def _tamano_tabla(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT pg_total_relation_size('public.pagos_intentos')")
+            return cur.fetchone()[0]
+
+    def handle(self, *args, **opts):
+        antes = self._tamano_tabla()
+        t0 = time.perf_counter()
+
+        def progreso(st):
+            self.stdout.write(f"  {st['filas']} filas, {st['blobs']} blobs, inline {_mb(st['bytes_inline'])}")
+
+        st = mover_inline(lote=max(1, opts["lote"]), dry_run=opts["dry_run"], progreso=progreso)
+        verbo = "Se moverían" if opts["dry_run"] else "Movidos"
+        self.stdout.write(
+            f"{verbo}: {st['blobs']} payloads de {st['filas']} intentos en {time.perf_counter() - t0:.1f} s"
+        )
+        ratio = st["bytes_blobs"] / st["bytes_original"] if st["bytes_original"] else 0
+        self.stdout.write(
+            f"En la fila: {_mb(st['bytes_inline'])} | original: {_mb(st['bytes_original'])} | "
+            f"side store: {_mb(st['bytes_blobs'])} ({ratio:.0%} del original)"
+        )
+        if not opts["dry_run"] and st["filas"]:
+            self.stdout.write(
+                f"pagos_intentos: {_mb(antes)} -> {_mb(self._tamano_tabla())}. El espacio liberado se "
+                "reutiliza tras VACUUM; para devolverlo al sistema, VACUUM FULL (o pg_repack) en mantenimiento."
+            )
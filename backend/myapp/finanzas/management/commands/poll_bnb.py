@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myapp.finanzas.bnb_poller import ciclo
+
+
+class Command(BaseCommand):
+    help = (
+        "Consulta en el BNB, por ciclos, todos los intentos QR en EN_PROCESO (en paralelo, "
+        "con concurrencia acotada) y aplica aprobaciones/expiraciones en bloque. "
+        "Con FINANZAS_BNB_POLLER=true las vistas solo leen el estado local."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--intervalo", type=float, default=5.0, help="Segundos entre ciclos (default 5)")
+        parser.add_argument("--concurrencia", type=int, default=10, help="Consultas simultáneas al banco")
+        parser.add_argument("--limite", type=int, default=None, help="Máximo de intentos por ciclo")
+        parser.add_argument("--una_vez", action="store_true", help="Un solo ciclo y salir")
+
+    def handle(self, *args, **opts):
+        while True:
+            t0 = time.monotonic()
+            close_old_connections()
+            stats = ciclo(concurrencia=opts["concurrencia"], limite=opts["limite"])
+            if stats["pendientes"] or opts["una_vez"]:
+                self.stdout.write(
+                    f"pendientes {stats['pendientes']} - consultados {stats['consultados']} - "
+                    f"aprobados {stats['aprobados']} - expirados {stats['expirados']} - "
+                    f"rechazados {stats['rechazados']} - errores {stats['errores']} "
+                    f"({stats['segundos'] * 1000:.0f} ms)"
+                )
+            if opts["una_vez"]:
+                return
+            try:
+                time.sleep(max(0.0, opts["intervalo"] - (time.monotonic() - t0)))
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from myapp.finanzas.webhooks import CANAL, procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la bandeja de webhooks (webhooks_eventos) en orden por pago. Despierta con "
+        "NOTIFY finanzas_webhooks o cada --intervalo s. Se pueden correr varios a la vez: "
+        "cada pago lo toma uno solo (advisory lock). Usar con FINANZAS_WEBHOOKS_EN_PROCESO=false."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--intervalo", type=float, default=5.0, help="Espera máxima entre pasadas")
+        parser.add_argument("--pagos", type=int, default=100, help="Pagos por pasada")
+        parser.add_argument("--una_vez", action="store_true", help="Vaciar la bandeja y salir")
+
+    def handle(self, *args, **opts):
+        escucha = None if opts["una_vez"] else self._escuchar()
+        while True:
+            close_old_connections()
+            t0 = time.perf_counter()
+            total = fallidos = 0
+            while True:
+                procesados, f = procesar_pendientes(opts["pagos"])
+                total += procesados
+                fallidos += f
+                if not procesados:
+                    break  # vacía, o solo quedan eventos que fallaron (se reintentan en la próxima pasada)
+            if total or fallidos:
+                self.stdout.write(
+                    f"procesados {total} - fallidos {fallidos} "
+                    f"({total / max(time.perf_counter() - t0, 1e-9):.0f} eventos/s)"
+                )
+            if opts["una_vez"]:
+                return
+            try:
+                self._esperar(escucha, opts["intervalo"])
+            except KeyboardInterrupt:
+                return
+
+    def _escuchar(self):
+        try:
+            import psycopg
+
+            from myapp.finanzas.eventos import conninfo_default
+            conn = psycopg.connect(conninfo_default(), autocommit=True)
+            conn.execute(f"LISTEN {CANAL}")
+            return conn
+        except Exception as e:
+            self.stderr.write(f"Sin LISTEN ({e}); se usa solo --intervalo")
+            return None
+
+    def _esperar(self, escucha, intervalo):
+        if escucha is None:
+            time.sleep(intervalo)
+            return
+        # sale con el primer aviso (o al vencer el intervalo); los demás avisos de la ráfaga se descartan
+        for _ in escucha.notifies(timeout=intervalo, stop_after=1):
+            pass
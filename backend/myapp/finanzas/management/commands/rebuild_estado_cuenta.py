@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+COLUMNAS = (
+    "cargo_id, unidad_id, concepto_id, periodo, monto, recargo, vencimiento, "
+    "estado_registrado, pagado, saldo, estado_calculado"
+)
+# Al verificar, el estado de la tabla se deriva a hoy como en las lecturas
+# (VENCIDO no depende de que haya corrido --vencer)
+COLUMNAS_TABLA = COLUMNAS.replace(
+    "estado_calculado",
+    "CASE WHEN saldo <= 0 THEN 'PAGADO' WHEN vencimiento < CURRENT_DATE THEN 'VENCIDO' "
+    "ELSE 'PENDIENTE' END AS estado_calculado",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye la tabla estado_cuenta desde vw_estado_cuenta_unidad y verifica que coincidan. "
+        "Con --vencer solo pasa a VENCIDO la columna guardada de los saldos ya vencidos (opcional: la API, "
+        "los reportes y la verificación derivan VENCIDO a la fecha al leer)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--solo_verificar", action="store_true", help="No reconstruye; solo compara tabla vs vista")
+        parser.add_argument("--vencer", action="store_true", help="Solo marca VENCIDO lo pendiente con vencimiento < hoy")
+        parser.add_argument("--muestra", type=int, default=10, help="Diferencias a listar al verificar (default 10)")
+
+    def handle(self, *args, **opts):
+        if opts["vencer"]:
+            with connection.cursor() as cur:
+                cur.execute("SELECT public.vencer_estado_cuenta()")
+                n = cur.fetchone()[0]
+            self.stdout.write(self.style.SUCCESS(f"Marcados VENCIDO: {n}"))
+            return
+
+        if not opts["solo_verificar"]:
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute("TRUNCATE public.estado_cuenta")
+                cur.execute(
+                    f"INSERT INTO public.estado_cuenta ({COLUMNAS}) "
+                    f"SELECT {COLUMNAS} FROM public.vw_estado_cuenta_unidad"
+                )
+                filas = cur.rowcount
+            with connection.cursor() as cur:
+                cur.execute("ANALYZE public.estado_cuenta")
+            self.stdout.write(f"Reconstruida: {filas} filas")
+
+        self._verificar(opts["muestra"])
+
+    def _verificar(self, muestra):
+        sql = f"""
+            SELECT 'solo_vista' AS lado, d.* FROM (
+              SELECT {COLUMNAS} FROM public.vw_estado_cuenta_unidad
+              EXCEPT
+              SELECT {COLUMNAS_TABLA} FROM public.estado_cuenta
+            ) d
+            UNION ALL
+            SELECT 'solo_tabla' AS lado, d.* FROM (
+              SELECT {COLUMNAS_TABLA} FROM public.estado_cuenta
+              EXCEPT
+              SELECT {COLUMNAS} FROM public.vw_estado_cuenta_unidad
+            ) d
+            ORDER BY 2, 1
+        """
+        with connection.cursor() as cur:
+            cur.execute(sql)
+            difs = cur.fetchall()
+
+        if not difs:
+            self.stdout.write(self.style.SUCCESS("Verificación OK: estado_cuenta coincide con la vista"))
+            return
+
+        cargos = {d[1] for d in difs}
+        self.stdout.write(self.style.ERROR(f"Verificación: {len(cargos)} cargos difieren"))
+        for d in difs[: max(0, muestra) * 2]:
+            self.stdout.write(f"  {d[0]}: cargo={d[1]} pagado={d[9]} saldo={d[10]} estado={d[11]}")
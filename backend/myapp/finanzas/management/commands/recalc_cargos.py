@@ -1,44 +1,76 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
 
+from myapp.finanzas.services import recalc_cargos
+
+
 class Command(BaseCommand):
-    help = "Recalcula el estado de cargos (PENDIENTE|PARCIAL|PAGADO) usando pagos_detalle."
+    help = (
+        "Recalcula el estado de cargos (PENDIENTE|PARCIAL|PAGADO) usando pagos_detalle. "
+        "Procesa por bloques de ids (un UPDATE agregado por bloque); cada bloque se confirma "
+        "por separado y se puede reanudar con --despues_de_id."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("--unidad_id", type=int, help="Filtrar por unidad_id")
+        parser.add_argument("--condominio_id", type=int, help="Filtrar por condominio de la unidad")
         parser.add_argument("--desde", type=str, help="Periodo desde (YYYY-MM-DD)")
         parser.add_argument("--hasta", type=str, help="Periodo hasta (YYYY-MM-DD)")
+        parser.add_argument("--chunk", type=int, default=5000, help="Cargos por bloque (default 5000)")
+        parser.add_argument("--despues_de_id", type=int, default=0,
+                            help="Reanudar: procesa solo cargos con id mayor a este (último id informado)")
 
     def handle(self, *args, **opts):
         unidad_id = opts.get("unidad_id")
+        condominio_id = opts.get("condominio_id")
         desde = opts.get("desde")
         hasta = opts.get("hasta")
+        chunk = max(1, opts["chunk"])
+        ultimo_id = opts["despues_de_id"] or 0
 
         where = []
         params = []
 
         if unidad_id:
-            where.append("unidad_id = %s")
+            where.append("c.unidad_id = %s")
             params.append(unidad_id)
 
+        if condominio_id:
+            where.append("c.unidad_id IN (SELECT id FROM public.unidades WHERE condominio_id = %s)")
+            params.append(condominio_id)
+
         if desde:
-            where.append("periodo >= %s")
+            where.append("c.periodo >= %s")
             params.append(desde)
 
         if hasta:
-            where.append("periodo <= %s")
+            where.append("c.periodo <= %s")
             params.append(hasta)
 
-        sql_list = "SELECT id FROM public.cargos"
-        if where:
-            sql_list += " WHERE " + " AND ".join(where)
+        filtro = (" AND " + " AND ".join(where)) if where else ""
+        sql_count = "SELECT count(*) FROM public.cargos c WHERE c.id > %s" + filtro
+        sql_ids = "SELECT c.id FROM public.cargos c WHERE c.id > %s" + filtro + " ORDER BY c.id LIMIT %s"
 
-        total = 0
         with connection.cursor() as cur:
-            cur.execute(sql_list, params)
-            ids = [r[0] for r in cur.fetchall()]
-            for cid in ids:
-                cur.execute("SELECT public.recalc_estado_cargo(%s)", [cid])
-                total += 1
+            cur.execute(sql_count, [ultimo_id] + params)
+            pendientes = cur.fetchone()[0]
+
+        procesados = 0
+        cambiados = 0
+        while True:
+            with connection.cursor() as cur:
+                cur.execute(sql_ids, [ultimo_id] + params + [chunk])
+                ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                break
+
+            cambiados += recalc_cargos(ids)
+            procesados += len(ids)
+            ultimo_id = ids[-1]
+            self.stdout.write(
+                f"  {procesados}/{pendientes} cargos - cambiados {cambiados} - ultimo_id={ultimo_id}"
+            )
 
-        self.stdout.write(self.style.SUCCESS(f"Listo: recalculados {total} cargos"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Listo: recalculados {procesados} cargos ({cambiados} cambiaron de estado)"
+        ))
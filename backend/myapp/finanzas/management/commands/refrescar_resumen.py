@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.finanzas.reportes import diferencias_resumen, reconstruir_resumen, refrescar_resumen
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresca los grupos pendientes del rollup resumen_finanzas (correr por cron: el endpoint de "
+        "reportes solo refresca si nadie más lo está haciendo y su conexión puede escribir). --reconstruir lo recalcula completo; --verificar lo "
+        "compara con agregar estado_cuenta desde cero."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reconstruir", action="store_true", help="Recalcular todos los grupos")
+        parser.add_argument("--verificar", action="store_true", help="Comparar contra estado_cuenta")
+        parser.add_argument("--muestra", type=int, default=10, help="Diferencias a listar al verificar (default 10)")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        if opts["reconstruir"]:
+            with transaction.atomic():
+                grupos = reconstruir_resumen()
+            self.stdout.write(f"Reconstruido: {grupos} grupos en {time.perf_counter() - t0:.2f} s")
+        else:
+            grupos = refrescar_resumen()
+            self.stdout.write(f"Refrescados: {grupos} grupos en {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+        if not opts["verificar"]:
+            return
+        difs = diferencias_resumen()
+        if not difs:
+            self.stdout.write(self.style.SUCCESS("Verificación OK: resumen_finanzas coincide con estado_cuenta"))
+            return
+        self.stdout.write(self.style.ERROR(f"Verificación: {len(difs)} filas difieren"))
+        for d in difs[: max(0, opts["muestra"])]:
+            self.stdout.write(f"  {d[0]}: condominio={d[1]} periodo={d[2]} concepto={d[3]} "
+                              f"facturado={d[5]} recaudado={d[7]} pendiente={d[8]} morosos={d[9]}")
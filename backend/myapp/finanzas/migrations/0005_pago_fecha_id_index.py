@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0004_pagointento_bnb_payload_pagointento_bnb_qr_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['-fecha', '-id'], name='ix_pago_fecha_id'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+SQL = r"""
+-- Recalcula en bloque el estado (PENDIENTE|PARCIAL|PAGADO) de un conjunto de cargos
+-- con un único UPDATE agregado. Solo escribe filas cuyo estado cambia.
+-- Devuelve la cantidad de cargos actualizados.
+CREATE OR REPLACE FUNCTION public.recalc_estado_cargos(_cargo_ids bigint[])
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  WITH calc AS (
+    SELECT
+      c.id,
+      CASE
+        WHEN COALESCE(SUM(pd.monto_aplicado),0) <= 0 THEN 'PENDIENTE'
+        WHEN COALESCE(SUM(pd.monto_aplicado),0) < (c.monto + COALESCE(c.recargo,0)) THEN 'PARCIAL'
+        ELSE 'PAGADO'
+      END AS estado
+    FROM public.cargos c
+    LEFT JOIN public.pagos_detalle pd ON pd.cargo_id = c.id
+    WHERE c.id = ANY(_cargo_ids)
+    GROUP BY c.id
+  )
+  UPDATE public.cargos c
+     SET estado = calc.estado
+    FROM calc
+   WHERE c.id = calc.id
+     AND c.estado IS DISTINCT FROM calc.estado;
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+"""
+
+SQL_DOWN = r"""
+DROP FUNCTION IF EXISTS public.recalc_estado_cargos(bigint[]);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0005_pago_fecha_id_index"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+# Reemplaza el trigger FOR EACH ROW de 0002 (trg_pd_recalc_cargo) por triggers
+# FOR EACH STATEMENT con tablas de transición: cada sentencia sobre pagos_detalle
+# recalcula una sola vez cada cargo distinto afectado.
+# Postgres no admite tablas de transición en triggers de varios eventos,
+# por eso hay un trigger por evento que comparten la misma función.
+SQL = r"""
+CREATE OR REPLACE FUNCTION public.trg_recalc_cargos_from_pd_stmt()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM public.recalc_estado_cargos(ARRAY(SELECT DISTINCT cargo_id FROM pd_new));
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- solo filas donde cambió el monto o el cargo
+    PERFORM public.recalc_estado_cargos(ARRAY(
+      SELECT DISTINCT x.cargo_id
+        FROM pd_new n
+        JOIN pd_old o ON o.id = n.id
+       CROSS JOIN LATERAL (VALUES (n.cargo_id), (o.cargo_id)) AS x(cargo_id)
+       WHERE n.monto_aplicado IS DISTINCT FROM o.monto_aplicado
+          OR n.cargo_id IS DISTINCT FROM o.cargo_id
+    ));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM public.recalc_estado_cargos(ARRAY(SELECT DISTINCT cargo_id FROM pd_old));
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargo ON public.pagos_detalle;
+
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargos_ins ON public.pagos_detalle;
+CREATE TRIGGER trg_pd_recalc_cargos_ins
+AFTER INSERT ON public.pagos_detalle
+REFERENCING NEW TABLE AS pd_new
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_recalc_cargos_from_pd_stmt();
+
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargos_upd ON public.pagos_detalle;
+CREATE TRIGGER trg_pd_recalc_cargos_upd
+AFTER UPDATE ON public.pagos_detalle
+REFERENCING OLD TABLE AS pd_old NEW TABLE AS pd_new
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_recalc_cargos_from_pd_stmt();
+
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargos_del ON public.pagos_detalle;
+CREATE TRIGGER trg_pd_recalc_cargos_del
+AFTER DELETE ON public.pagos_detalle
+REFERENCING OLD TABLE AS pd_old
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_recalc_cargos_from_pd_stmt();
+"""
+
+SQL_DOWN = r"""
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargos_ins ON public.pagos_detalle;
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargos_upd ON public.pagos_detalle;
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargos_del ON public.pagos_detalle;
+DROP FUNCTION IF EXISTS public.trg_recalc_cargos_from_pd_stmt();
+
+DROP TRIGGER IF EXISTS trg_pd_recalc_cargo ON public.pagos_detalle;
+CREATE TRIGGER trg_pd_recalc_cargo
+AFTER INSERT OR UPDATE OR DELETE ON public.pagos_detalle
+FOR EACH ROW EXECUTE FUNCTION public.trg_recalc_cargo_from_pd();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0006_recalc_estado_cargos_set"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+    ]
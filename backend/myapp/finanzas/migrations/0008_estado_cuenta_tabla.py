@@ -0,0 +1,182 @@
+from django.db import migrations
+
+# Tabla física estado_cuenta (una fila por cargo) que reemplaza la lectura de
+# vw_estado_cuenta_unidad. Se mantiene incrementalmente por cargo afectado:
+#  - triggers por sentencia en cargos (INSERT/UPDATE)
+#  - la función de triggers de pagos_detalle (0007), tras recalcular estados
+# La vista se conserva como referencia para verificar (rebuild_estado_cuenta).
+SQL = r"""
+CREATE TABLE IF NOT EXISTS public.estado_cuenta (
+  cargo_id          bigint PRIMARY KEY REFERENCES public.cargos(id) ON DELETE CASCADE,
+  unidad_id         bigint        NOT NULL,
+  concepto_id       smallint      NOT NULL,
+  periodo           date          NOT NULL,
+  monto             numeric(12,2) NOT NULL,
+  recargo           numeric(12,2) NOT NULL DEFAULT 0,
+  vencimiento       date,
+  estado_registrado varchar(12)   NOT NULL,
+  pagado            numeric(12,2) NOT NULL DEFAULT 0,
+  saldo             numeric(12,2) NOT NULL,
+  estado_calculado  varchar(12)   NOT NULL
+);
+
+-- list_por_unidad: filtro por unidad, orden (periodo, cargo_id), index-only scan
+CREATE INDEX IF NOT EXISTS ix_ec_unidad_periodo ON public.estado_cuenta (unidad_id, periodo, cargo_id)
+  INCLUDE (concepto_id, monto, recargo, vencimiento, estado_registrado, pagado, saldo, estado_calculado);
+CREATE INDEX IF NOT EXISTS ix_ec_estado ON public.estado_cuenta (estado_calculado, unidad_id);
+CREATE INDEX IF NOT EXISTS ix_ec_saldo ON public.estado_cuenta (saldo) WHERE saldo > 0;
+CREATE INDEX IF NOT EXISTS ix_ec_pagado ON public.estado_cuenta (pagado);
+
+CREATE OR REPLACE FUNCTION public.refresh_estado_cuenta(_cargo_ids bigint[])
+RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO public.estado_cuenta AS ec (
+    cargo_id, unidad_id, concepto_id, periodo, monto, recargo, vencimiento,
+    estado_registrado, pagado, saldo, estado_calculado
+  )
+  SELECT
+    c.id, c.unidad_id, c.concepto_id, c.periodo, c.monto, COALESCE(c.recargo,0), c.vencimiento,
+    c.estado,
+    COALESCE(s.pagado,0),
+    (c.monto + COALESCE(c.recargo,0) - COALESCE(s.pagado,0))::numeric(12,2),
+    CASE
+      WHEN (c.monto + COALESCE(c.recargo,0) - COALESCE(s.pagado,0)) <= 0 THEN 'PAGADO'
+      WHEN c.vencimiento IS NOT NULL AND c.vencimiento < CURRENT_DATE THEN 'VENCIDO'
+      ELSE 'PENDIENTE'
+    END
+  FROM public.cargos c
+  LEFT JOIN LATERAL (
+    SELECT SUM(pd.monto_aplicado) AS pagado FROM public.pagos_detalle pd WHERE pd.cargo_id = c.id
+  ) s ON true
+  WHERE c.id = ANY(_cargo_ids)
+  ON CONFLICT (cargo_id) DO UPDATE SET
+    unidad_id = EXCLUDED.unidad_id,
+    concepto_id = EXCLUDED.concepto_id,
+    periodo = EXCLUDED.periodo,
+    monto = EXCLUDED.monto,
+    recargo = EXCLUDED.recargo,
+    vencimiento = EXCLUDED.vencimiento,
+    estado_registrado = EXCLUDED.estado_registrado,
+    pagado = EXCLUDED.pagado,
+    saldo = EXCLUDED.saldo,
+    estado_calculado = EXCLUDED.estado_calculado
+  WHERE (ec.*) IS DISTINCT FROM (EXCLUDED.*);
+END;
+$$;
+
+-- VENCIDO depende de CURRENT_DATE: este barrido diario pasa a VENCIDO lo que venció
+CREATE OR REPLACE FUNCTION public.vencer_estado_cuenta()
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  UPDATE public.estado_cuenta
+     SET estado_calculado = 'VENCIDO'
+   WHERE estado_calculado = 'PENDIENTE'
+     AND vencimiento < CURRENT_DATE;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.trg_estado_cuenta_from_cargos()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM public.refresh_estado_cuenta(ARRAY(SELECT id FROM cargos_new));
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_cargos_estado_cuenta_ins ON public.cargos;
+CREATE TRIGGER trg_cargos_estado_cuenta_ins
+AFTER INSERT ON public.cargos
+REFERENCING NEW TABLE AS cargos_new
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_estado_cuenta_from_cargos();
+
+DROP TRIGGER IF EXISTS trg_cargos_estado_cuenta_upd ON public.cargos;
+CREATE TRIGGER trg_cargos_estado_cuenta_upd
+AFTER UPDATE ON public.cargos
+REFERENCING NEW TABLE AS cargos_new
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_estado_cuenta_from_cargos();
+
+CREATE OR REPLACE FUNCTION public.trg_recalc_cargos_from_pd_stmt()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+  v_ids bigint[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    v_ids := ARRAY(SELECT DISTINCT cargo_id FROM pd_new);
+  ELSIF TG_OP = 'UPDATE' THEN
+    -- solo filas donde cambió el monto o el cargo
+    v_ids := ARRAY(
+      SELECT DISTINCT x.cargo_id
+        FROM pd_new n
+        JOIN pd_old o ON o.id = n.id
+       CROSS JOIN LATERAL (VALUES (n.cargo_id), (o.cargo_id)) AS x(cargo_id)
+       WHERE n.monto_aplicado IS DISTINCT FROM o.monto_aplicado
+          OR n.cargo_id IS DISTINCT FROM o.cargo_id
+    );
+  ELSIF TG_OP = 'DELETE' THEN
+    v_ids := ARRAY(SELECT DISTINCT cargo_id FROM pd_old);
+  END IF;
+  IF cardinality(v_ids) > 0 THEN
+    PERFORM public.recalc_estado_cargos(v_ids);
+    PERFORM public.refresh_estado_cuenta(v_ids);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+INSERT INTO public.estado_cuenta (
+  cargo_id, unidad_id, concepto_id, periodo, monto, recargo, vencimiento,
+  estado_registrado, pagado, saldo, estado_calculado
+)
+SELECT cargo_id, unidad_id, concepto_id, periodo, monto, recargo, vencimiento,
+       estado_registrado, pagado, saldo, estado_calculado
+  FROM public.vw_estado_cuenta_unidad
+ON CONFLICT (cargo_id) DO NOTHING;
+
+ANALYZE public.estado_cuenta;
+"""
+
+SQL_DOWN = r"""
+CREATE OR REPLACE FUNCTION public.trg_recalc_cargos_from_pd_stmt()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM public.recalc_estado_cargos(ARRAY(SELECT DISTINCT cargo_id FROM pd_new));
+  ELSIF TG_OP = 'UPDATE' THEN
+    PERFORM public.recalc_estado_cargos(ARRAY(
+      SELECT DISTINCT x.cargo_id
+        FROM pd_new n
+        JOIN pd_old o ON o.id = n.id
+       CROSS JOIN LATERAL (VALUES (n.cargo_id), (o.cargo_id)) AS x(cargo_id)
+       WHERE n.monto_aplicado IS DISTINCT FROM o.monto_aplicado
+          OR n.cargo_id IS DISTINCT FROM o.cargo_id
+    ));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM public.recalc_estado_cargos(ARRAY(SELECT DISTINCT cargo_id FROM pd_old));
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_cargos_estado_cuenta_ins ON public.cargos;
+DROP TRIGGER IF EXISTS trg_cargos_estado_cuenta_upd ON public.cargos;
+DROP FUNCTION IF EXISTS public.trg_estado_cuenta_from_cargos();
+DROP FUNCTION IF EXISTS public.vencer_estado_cuenta();
+DROP FUNCTION IF EXISTS public.refresh_estado_cuenta(bigint[]);
+DROP TABLE IF EXISTS public.estado_cuenta;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0007_pd_statement_trigger"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+        migrations.AlterModelTable(name="estadocuentaunidad", table="estado_cuenta"),
+    ]
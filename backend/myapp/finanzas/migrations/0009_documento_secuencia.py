@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Inicializa los contadores con el máximo ya emitido (numeros tipo R-2025-000123)
+SEED_SQL = r"""
+INSERT INTO public.documentos_secuencias (condominio_id, anio, prefijo, ultimo)
+SELECT condominio_id,
+       split_part(numero, '-', 2)::smallint,
+       split_part(numero, '-', 1),
+       max(split_part(numero, '-', 3)::bigint)
+  FROM public.documentos
+ WHERE condominio_id IS NOT NULL
+   AND numero ~ '^[A-Za-z]{1,10}-[0-9]{4}-[0-9]{1,18}$'
+ GROUP BY 1, 2, 3
+ON CONFLICT (condominio_id, anio, prefijo) DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0008_estado_cuenta_tabla'),
+        ('propiedades', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoSecuencia',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('anio', models.SmallIntegerField()),
+                ('prefijo', models.CharField(max_length=10)),
+                ('ultimo', models.BigIntegerField(default=0)),
+                ('condominio', models.ForeignKey(db_column='condominio_id', on_delete=django.db.models.deletion.CASCADE, to='propiedades.condominio')),
+            ],
+            options={
+                'db_table': 'documentos_secuencias',
+                'constraints': [models.UniqueConstraint(fields=('condominio', 'anio', 'prefijo'), name='uq_documento_secuencia')],
+            },
+        ),
+        migrations.RunSQL(SEED_SQL, migrations.RunSQL.noop),
+    ]
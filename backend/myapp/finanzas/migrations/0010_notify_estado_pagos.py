@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# NOTIFY en el canal finanzas_pagos cuando cambia el estado de un pago o de un
+# intento. Los avisos salen recién al COMMIT (y nunca si hay ROLLBACK); los
+# consume finanzas/eventos.py para despertar a los clientes SSE/long-poll.
+SQL = r"""
+CREATE OR REPLACE FUNCTION public.notify_pago_estado()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM pg_notify('finanzas_pagos', json_build_object(
+    'tipo', 'pago', 'id', NEW.id, 'estado', NEW.estado, 'documento_id', NEW.documento_id
+  )::text);
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.notify_intento_estado()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM pg_notify('finanzas_pagos', json_build_object(
+    'tipo', 'intento', 'id', NEW.id, 'pago_id', NEW.pago_id, 'estado', NEW.estado
+  )::text);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pagos_notify_estado ON public.pagos;
+CREATE TRIGGER trg_pagos_notify_estado
+AFTER UPDATE OF estado ON public.pagos
+FOR EACH ROW WHEN (OLD.estado IS DISTINCT FROM NEW.estado)
+EXECUTE FUNCTION public.notify_pago_estado();
+
+DROP TRIGGER IF EXISTS trg_intentos_notify_estado ON public.pagos_intentos;
+CREATE TRIGGER trg_intentos_notify_estado
+AFTER UPDATE OF estado ON public.pagos_intentos
+FOR EACH ROW WHEN (OLD.estado IS DISTINCT FROM NEW.estado)
+EXECUTE FUNCTION public.notify_intento_estado();
+"""
+
+SQL_DOWN = r"""
+DROP TRIGGER IF EXISTS trg_pagos_notify_estado ON public.pagos;
+DROP TRIGGER IF EXISTS trg_intentos_notify_estado ON public.pagos_intentos;
+DROP FUNCTION IF EXISTS public.notify_pago_estado();
+DROP FUNCTION IF EXISTS public.notify_intento_estado();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0009_documento_secuencia"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0010_notify_estado_pagos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvento',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('proveedor', models.CharField(max_length=40)),
+                ('evento_id', models.CharField(max_length=120)),
+                ('payload', models.JSONField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'PENDIENTE'), ('PROCESADO', 'PROCESADO'), ('ERROR', 'ERROR'), ('IGNORADO', 'IGNORADO')], default='PENDIENTE', max_length=12)),
+                ('intentos', models.SmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('recibido_en', models.DateTimeField(auto_now_add=True)),
+                ('procesado_en', models.DateTimeField(blank=True, null=True)),
+                ('intento', models.ForeignKey(blank=True, db_column='intento_id', null=True, on_delete=django.db.models.deletion.SET_NULL, to='finanzas.pagointento')),
+                ('pago', models.ForeignKey(blank=True, db_column='pago_id', null=True, on_delete=django.db.models.deletion.SET_NULL, to='finanzas.pago')),
+            ],
+            options={
+                'db_table': 'webhooks_eventos',
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['pago', 'id'], name='ix_webhook_pendiente')],
+                'constraints': [models.UniqueConstraint(fields=('proveedor', 'evento_id'), name='uq_webhook_evento')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+# Intentos activos previos a la columna: QR interno vence a los 15 min de creado
+# (lo que ya fijaba iniciar_qr); BNB se creaba sin vencimiento en el banco, se le
+# da un día para que el barrido no expire un QR que todavía se puede pagar.
+BACKFILL = r"""
+UPDATE public.pagos_intentos
+   SET expires_at = CASE WHEN pasarela = 'BNB'
+                         THEN creado_en + interval '1 day'
+                         ELSE creado_en + interval '15 minutes' END
+ WHERE expires_at IS NULL
+   AND estado IN ('CREADO', 'EN_PROCESO');
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0011_webhook_evento'),
+        ('propiedades', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagointento',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='pagointento',
+            index=models.Index(condition=models.Q(('estado__in', ['CREADO', 'EN_PROCESO'])), fields=['expires_at'], name='ix_intento_activo_expira'),
+        ),
+        migrations.AddIndex(
+            model_name='pagointento',
+            index=models.Index(condition=models.Q(('estado', 'EN_PROCESO')), fields=['pasarela', 'actualizado_en'], name='ix_intento_en_proceso'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0012_pagointento_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PagoIntentoBlob',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('campo', models.CharField(choices=[('bnb_qr_image_b64', 'bnb_qr_image_b64'), ('bnb_payload', 'bnb_payload'), ('raw_request', 'raw_request'), ('raw_response', 'raw_response')], max_length=20)),
+                ('formato', models.CharField(max_length=12)),
+                ('datos', models.BinaryField()),
+                ('tamano_original', models.IntegerField()),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('intento', models.ForeignKey(db_column='intento_id', on_delete=django.db.models.deletion.CASCADE, related_name='blobs', to='finanzas.pagointento')),
+            ],
+            options={
+                'db_table': 'pagos_intentos_blobs',
+                'constraints': [models.UniqueConstraint(fields=('intento', 'campo'), name='uq_intento_blob')],
+            },
+        ),
+        # Los datos ya vienen comprimidos (PNG / zlib): sin reintento de pglz, directo a TOAST
+        migrations.RunSQL(
+            "ALTER TABLE public.pagos_intentos_blobs ALTER COLUMN datos SET STORAGE EXTERNAL",
+            migrations.RunSQL.noop,
+        ),
+    ]
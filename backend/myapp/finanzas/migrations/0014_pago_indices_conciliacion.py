@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0013_pagointento_blobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['monto', 'fecha'], name='ix_pago_pendiente_monto'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(condition=models.Q(('ref_externa__isnull', False)), fields=['ref_externa'], name='ix_pago_ref_externa'),
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(condition=models.Q(('transaccion_id__isnull', False)), fields=['transaccion_id'], name='ix_pago_transaccion'),
+        ),
+    ]
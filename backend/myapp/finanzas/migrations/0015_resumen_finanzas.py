@@ -0,0 +1,176 @@
+from django.db import migrations, models
+
+# Rollup resumen_finanzas: una fila por (condominio, periodo, concepto) con lo
+# facturado, recargos, recaudado, pendiente y unidades morosas, calculada desde
+# estado_cuenta (0008).
+#  - trigger por sentencia en estado_cuenta: anota las claves tocadas en
+#    resumen_finanzas_pendientes (solo INSERT: el cajero no espera por la fila
+#    del rollup, que comparten todos los pagos del condominio en el mes);
+#  - refrescar_resumen_finanzas(): consume las pendientes y recalcula solo esos
+#    grupos. La llaman el endpoint de reportes antes de leer y el comando
+#    refrescar_resumen (cron).
+SQL = r"""
+CREATE TABLE IF NOT EXISTS public.resumen_finanzas (
+  condominio_id  bigint        NOT NULL,
+  periodo        date          NOT NULL,
+  concepto_id    smallint      NOT NULL,
+  cargos         integer       NOT NULL DEFAULT 0,
+  facturado      numeric(14,2) NOT NULL DEFAULT 0,
+  recargo        numeric(14,2) NOT NULL DEFAULT 0,
+  recaudado      numeric(14,2) NOT NULL DEFAULT 0,
+  pendiente      numeric(14,2) NOT NULL DEFAULT 0,
+  morosos        integer       NOT NULL DEFAULT 0,
+  actualizado_en timestamptz   NOT NULL DEFAULT now(),
+  PRIMARY KEY (condominio_id, periodo, concepto_id)
+);
+
+CREATE TABLE IF NOT EXISTS public.resumen_finanzas_pendientes (
+  condominio_id bigint   NOT NULL,
+  periodo       date     NOT NULL,
+  concepto_id   smallint NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION public.trg_resumen_finanzas_pendientes()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO public.resumen_finanzas_pendientes (condominio_id, periodo, concepto_id)
+    SELECT DISTINCT u.condominio_id, n.periodo, n.concepto_id
+      FROM ec_new n
+      JOIN public.unidades u ON u.id = n.unidad_id;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO public.resumen_finanzas_pendientes (condominio_id, periodo, concepto_id)
+    SELECT DISTINCT u.condominio_id, o.periodo, o.concepto_id
+      FROM ec_old o
+      JOIN public.unidades u ON u.id = o.unidad_id;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_ec_resumen_ins ON public.estado_cuenta;
+CREATE TRIGGER trg_ec_resumen_ins
+AFTER INSERT ON public.estado_cuenta
+REFERENCING NEW TABLE AS ec_new
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_resumen_finanzas_pendientes();
+
+DROP TRIGGER IF EXISTS trg_ec_resumen_upd ON public.estado_cuenta;
+CREATE TRIGGER trg_ec_resumen_upd
+AFTER UPDATE ON public.estado_cuenta
+REFERENCING NEW TABLE AS ec_new OLD TABLE AS ec_old
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_resumen_finanzas_pendientes();
+
+DROP TRIGGER IF EXISTS trg_ec_resumen_del ON public.estado_cuenta;
+CREATE TRIGGER trg_ec_resumen_del
+AFTER DELETE ON public.estado_cuenta
+REFERENCING OLD TABLE AS ec_old
+FOR EACH STATEMENT EXECUTE FUNCTION public.trg_resumen_finanzas_pendientes();
+
+-- Un refresco a la vez: si dos se cruzaran, el de la foto más vieja podría
+-- escribir último. Devuelve los grupos recalculados.
+CREATE OR REPLACE FUNCTION public.refrescar_resumen_finanzas()
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.resumen_finanzas'));
+
+  WITH sucias AS (
+    DELETE FROM public.resumen_finanzas_pendientes
+    RETURNING condominio_id, periodo, concepto_id
+  ), claves AS (
+    SELECT DISTINCT condominio_id, periodo, concepto_id FROM sucias
+  ), calc AS (
+    SELECT k.condominio_id, k.periodo, k.concepto_id,
+           count(ec.cargo_id)                  AS cargos,
+           sum(ec.monto)                       AS facturado,
+           sum(ec.recargo)                     AS recargo,
+           sum(ec.pagado)                      AS recaudado,
+           sum(greatest(ec.saldo, 0))          AS pendiente,
+           count(DISTINCT ec.unidad_id) FILTER (WHERE ec.estado_calculado = 'VENCIDO') AS morosos
+      FROM claves k
+      LEFT JOIN (public.unidades u
+                 JOIN public.estado_cuenta ec
+                   ON ec.unidad_id = u.id AND ec.estado_registrado <> 'ANULADO')
+        ON u.condominio_id = k.condominio_id AND ec.periodo = k.periodo AND ec.concepto_id = k.concepto_id
+     GROUP BY k.condominio_id, k.periodo, k.concepto_id
+  ), vacios AS (
+    -- grupos que quedaron sin cargos (borrados/anulados)
+    DELETE FROM public.resumen_finanzas r
+     USING calc c
+     WHERE r.condominio_id = c.condominio_id AND r.periodo = c.periodo AND r.concepto_id = c.concepto_id
+       AND c.cargos = 0
+  ), escritos AS (
+    INSERT INTO public.resumen_finanzas AS r (
+      condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos, actualizado_en
+    )
+    SELECT condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos, now()
+      FROM calc
+     WHERE cargos > 0
+    ON CONFLICT (condominio_id, periodo, concepto_id) DO UPDATE SET
+      cargos = EXCLUDED.cargos,
+      facturado = EXCLUDED.facturado,
+      recargo = EXCLUDED.recargo,
+      recaudado = EXCLUDED.recaudado,
+      pendiente = EXCLUDED.pendiente,
+      morosos = EXCLUDED.morosos,
+      actualizado_en = EXCLUDED.actualizado_en
+  )
+  SELECT count(*) INTO v_count FROM claves;
+
+  RETURN v_count;
+END;
+$$;
+
+-- Carga inicial: todas las claves como pendientes
+INSERT INTO public.resumen_finanzas_pendientes (condominio_id, periodo, concepto_id)
+SELECT DISTINCT u.condominio_id, ec.periodo, ec.concepto_id
+  FROM public.estado_cuenta ec
+  JOIN public.unidades u ON u.id = ec.unidad_id;
+
+SELECT public.refrescar_resumen_finanzas();
+
+ANALYZE public.resumen_finanzas;
+"""
+
+SQL_DOWN = r"""
+DROP TRIGGER IF EXISTS trg_ec_resumen_ins ON public.estado_cuenta;
+DROP TRIGGER IF EXISTS trg_ec_resumen_upd ON public.estado_cuenta;
+DROP TRIGGER IF EXISTS trg_ec_resumen_del ON public.estado_cuenta;
+DROP FUNCTION IF EXISTS public.trg_resumen_finanzas_pendientes();
+DROP FUNCTION IF EXISTS public.refrescar_resumen_finanzas();
+DROP TABLE IF EXISTS public.resumen_finanzas_pendientes;
+DROP TABLE IF EXISTS public.resumen_finanzas;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finanzas', '0014_pago_indices_conciliacion'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+        migrations.CreateModel(
+            name='ResumenFinanzas',
+            fields=[
+                ('pk', models.CompositePrimaryKey('condominio_id', 'periodo', 'concepto_id', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('condominio_id', models.BigIntegerField()),
+                ('periodo', models.DateField()),
+                ('concepto_id', models.SmallIntegerField()),
+                ('cargos', models.IntegerField()),
+                ('facturado', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('recargo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('recaudado', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('pendiente', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('morosos', models.IntegerField()),
+                ('actualizado_en', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'resumen_finanzas',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# Reporte de morosidad (reportes.morosidad): solo se agrupan filas con saldo.
+# Índice parcial por unidad con lo que lee el reporte: index-only scan sobre
+# las filas abiertas (una fracción de estado_cuenta) y ya en orden de unidad
+# para agregar sin ordenar.
+SQL = r"""
+CREATE INDEX IF NOT EXISTS ix_ec_morosidad ON public.estado_cuenta (unidad_id)
+  INCLUDE (vencimiento, saldo, estado_registrado)
+  WHERE saldo > 0;
+"""
+
+SQL_DOWN = r"""
+DROP INDEX IF EXISTS public.ix_ec_morosidad;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0015_resumen_finanzas"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+    ]
@@ -0,0 +1,162 @@
+from django.db import migrations, models
+
+# VENCIDO depende del día, no de cuándo se escribió la fila: estado_cuenta
+# guarda el estado calculado al refrescar y, sin el barrido diario
+# (rebuild_estado_cuenta --vencer), quedaba PENDIENTE lo ya vencido. Las
+# lecturas derivan ahora "saldo > 0 AND vencimiento < hoy" y el rollup hace
+# lo mismo para 'morosos':
+#  - vence_en: el próximo vencimiento (>= hoy) con saldo del grupo;
+#  - refrescar_resumen_finanzas() marca pendientes los grupos cuyo vence_en
+#    ya pasó antes de recalcular, así 'morosos' está al día en cada lectura
+#    recalculando solo los grupos que cruzaron un vencimiento.
+SQL = r"""
+ALTER TABLE public.resumen_finanzas ADD COLUMN IF NOT EXISTS vence_en date;
+CREATE INDEX IF NOT EXISTS ix_resumen_vence_en ON public.resumen_finanzas (vence_en)
+  WHERE vence_en IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.refrescar_resumen_finanzas()
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.resumen_finanzas'));
+
+  -- grupos con algún saldo que venció desde el último refresco
+  INSERT INTO public.resumen_finanzas_pendientes (condominio_id, periodo, concepto_id)
+  SELECT condominio_id, periodo, concepto_id
+    FROM public.resumen_finanzas
+   WHERE vence_en < CURRENT_DATE;
+
+  WITH sucias AS (
+    DELETE FROM public.resumen_finanzas_pendientes
+    RETURNING condominio_id, periodo, concepto_id
+  ), claves AS (
+    SELECT DISTINCT condominio_id, periodo, concepto_id FROM sucias
+  ), calc AS (
+    SELECT k.condominio_id, k.periodo, k.concepto_id,
+           count(ec.cargo_id)                  AS cargos,
+           sum(ec.monto)                       AS facturado,
+           sum(ec.recargo)                     AS recargo,
+           sum(ec.pagado)                      AS recaudado,
+           sum(greatest(ec.saldo, 0))          AS pendiente,
+           count(DISTINCT ec.unidad_id)
+             FILTER (WHERE ec.saldo > 0 AND ec.vencimiento < CURRENT_DATE) AS morosos,
+           min(ec.vencimiento)
+             FILTER (WHERE ec.saldo > 0 AND ec.vencimiento >= CURRENT_DATE) AS vence_en
+      FROM claves k
+      LEFT JOIN (public.unidades u
+                 JOIN public.estado_cuenta ec
+                   ON ec.unidad_id = u.id AND ec.estado_registrado <> 'ANULADO')
+        ON u.condominio_id = k.condominio_id AND ec.periodo = k.periodo AND ec.concepto_id = k.concepto_id
+     GROUP BY k.condominio_id, k.periodo, k.concepto_id
+  ), vacios AS (
+    -- grupos que quedaron sin cargos (borrados/anulados)
+    DELETE FROM public.resumen_finanzas r
+     USING calc c
+     WHERE r.condominio_id = c.condominio_id AND r.periodo = c.periodo AND r.concepto_id = c.concepto_id
+       AND c.cargos = 0
+  ), escritos AS (
+    INSERT INTO public.resumen_finanzas AS r (
+      condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos,
+      vence_en, actualizado_en
+    )
+    SELECT condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos,
+           vence_en, now()
+      FROM calc
+     WHERE cargos > 0
+    ON CONFLICT (condominio_id, periodo, concepto_id) DO UPDATE SET
+      cargos = EXCLUDED.cargos,
+      facturado = EXCLUDED.facturado,
+      recargo = EXCLUDED.recargo,
+      recaudado = EXCLUDED.recaudado,
+      pendiente = EXCLUDED.pendiente,
+      morosos = EXCLUDED.morosos,
+      vence_en = EXCLUDED.vence_en,
+      actualizado_en = EXCLUDED.actualizado_en
+  )
+  SELECT count(*) INTO v_count FROM claves;
+
+  RETURN v_count;
+END;
+$$;
+
+-- Recalcular todo una vez para llenar vence_en y poner 'morosos' al día
+INSERT INTO public.resumen_finanzas_pendientes (condominio_id, periodo, concepto_id)
+SELECT condominio_id, periodo, concepto_id FROM public.resumen_finanzas;
+
+SELECT public.refrescar_resumen_finanzas();
+"""
+
+SQL_DOWN = r"""
+CREATE OR REPLACE FUNCTION public.refrescar_resumen_finanzas()
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('public.resumen_finanzas'));
+
+  WITH sucias AS (
+    DELETE FROM public.resumen_finanzas_pendientes
+    RETURNING condominio_id, periodo, concepto_id
+  ), claves AS (
+    SELECT DISTINCT condominio_id, periodo, concepto_id FROM sucias
+  ), calc AS (
+    SELECT k.condominio_id, k.periodo, k.concepto_id,
+           count(ec.cargo_id)                  AS cargos,
+           sum(ec.monto)                       AS facturado,
+           sum(ec.recargo)                     AS recargo,
+           sum(ec.pagado)                      AS recaudado,
+           sum(greatest(ec.saldo, 0))          AS pendiente,
+           count(DISTINCT ec.unidad_id) FILTER (WHERE ec.estado_calculado = 'VENCIDO') AS morosos
+      FROM claves k
+      LEFT JOIN (public.unidades u
+                 JOIN public.estado_cuenta ec
+                   ON ec.unidad_id = u.id AND ec.estado_registrado <> 'ANULADO')
+        ON u.condominio_id = k.condominio_id AND ec.periodo = k.periodo AND ec.concepto_id = k.concepto_id
+     GROUP BY k.condominio_id, k.periodo, k.concepto_id
+  ), vacios AS (
+    DELETE FROM public.resumen_finanzas r
+     USING calc c
+     WHERE r.condominio_id = c.condominio_id AND r.periodo = c.periodo AND r.concepto_id = c.concepto_id
+       AND c.cargos = 0
+  ), escritos AS (
+    INSERT INTO public.resumen_finanzas AS r (
+      condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos, actualizado_en
+    )
+    SELECT condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos, now()
+      FROM calc
+     WHERE cargos > 0
+    ON CONFLICT (condominio_id, periodo, concepto_id) DO UPDATE SET
+      cargos = EXCLUDED.cargos,
+      facturado = EXCLUDED.facturado,
+      recargo = EXCLUDED.recargo,
+      recaudado = EXCLUDED.recaudado,
+      pendiente = EXCLUDED.pendiente,
+      morosos = EXCLUDED.morosos,
+      actualizado_en = EXCLUDED.actualizado_en
+  )
+  SELECT count(*) INTO v_count FROM claves;
+
+  RETURN v_count;
+END;
+$$;
+
+DROP INDEX IF EXISTS public.ix_resumen_vence_en;
+ALTER TABLE public.resumen_finanzas DROP COLUMN IF EXISTS vence_en;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finanzas", "0016_estado_cuenta_morosidad"),
+    ]
+
+    operations = [
+        migrations.RunSQL(SQL, SQL_DOWN),
+        migrations.AddField(
+            model_name="resumenfinanzas",
+            name="vence_en",
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -36,6 +36,17 @@ class Documento(models.Model):
         db_table = "documentos"
         constraints = [models.UniqueConstraint(fields=["condominio","numero"], name="uq_documento_numero")]
 
+class DocumentoSecuencia(models.Model):
+    """Contador de numeración por condominio/año/prefijo (ver services.siguiente_numero_documento)."""
+    id = models.BigAutoField(primary_key=True)
+    condominio = models.ForeignKey("propiedades.Condominio", models.CASCADE, db_column="condominio_id")
+    anio = models.SmallIntegerField()
+    prefijo = models.CharField(max_length=10)
+    ultimo = models.BigIntegerField(default=0)
+    class Meta:
+        db_table = "documentos_secuencias"
+        constraints = [models.UniqueConstraint(fields=["condominio","anio","prefijo"], name="uq_documento_secuencia")]
+
 class Pago(models.Model):
     id = models.BigAutoField(primary_key=True)
     documento = models.ForeignKey(Documento, models.SET_NULL, db_column="documento_id", null=True, blank=True)
@@ -46,7 +57,18 @@ class Pago(models.Model):
     pasarela = models.CharField(max_length=40, blank=True, null=True)
     transaccion_id = models.CharField(max_length=80, blank=True, null=True)
     ref_externa = models.CharField(max_length=120, blank=True, null=True)
-    class Meta: db_table = "pagos"
+    class Meta:
+        db_table = "pagos"
+        # listado/paginación keyset ordenan por (-fecha, -id); el resto, búsquedas de la conciliación
+        indexes = [
+            models.Index(fields=["-fecha", "-id"], name="ix_pago_fecha_id"),
+            models.Index(fields=["monto", "fecha"], name="ix_pago_pendiente_monto",
+                         condition=models.Q(estado="PENDIENTE")),
+            models.Index(fields=["ref_externa"], name="ix_pago_ref_externa",
+                         condition=models.Q(ref_externa__isnull=False)),
+            models.Index(fields=["transaccion_id"], name="ix_pago_transaccion",
+                         condition=models.Q(transaccion_id__isnull=False)),
+        ]
 
 class PagoDetalle(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -65,6 +87,9 @@ class DocumentoArchivo(models.Model):
 class PagoIntento(models.Model):
     ESTADOS = (("CREADO","CREADO"),("EN_PROCESO","EN_PROCESO"),
                ("APROBADO","APROBADO"),("RECHAZADO","RECHAZADO"),("EXPIRO","EXPIRO"))
+    # Payloads pesados: viven en PagoIntentoBlob (ver intento_blobs.py); la columna solo
+    # conserva valores de filas aún no migradas
+    CAMPOS_BLOB = ("bnb_qr_image_b64", "bnb_payload", "raw_request", "raw_response")
     unidad = models.ForeignKey("propiedades.Unidad", models.CASCADE, db_column="unidad_id")
     total = models.DecimalField(max_digits=12, decimal_places=2)
     medio = models.CharField(max_length=15, choices=[("TARJETA","TARJETA"),("QR","QR"),("BILLETERA","BILLETERA"),("TRANSFERENCIA","TRANSFERENCIA")])
@@ -81,11 +106,56 @@ class PagoIntento(models.Model):
     bnb_qr_image_b64 = models.TextField(blank=True, null=True)
     bnb_status_code = models.IntegerField(blank=True, null=True)  # 1=No usado, 2=Usado, 3=Expirado, 4=Error
     bnb_payload = models.JSONField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        db_table = "pagos_intentos"
+        # Solo los intentos activos: el conjunto caliente no crece con el histórico
+        indexes = [
+            models.Index(fields=["expires_at"], name="ix_intento_activo_expira",
+                         condition=models.Q(estado__in=["CREADO", "EN_PROCESO"])),
+            models.Index(fields=["pasarela", "actualizado_en"], name="ix_intento_en_proceso",
+                         condition=models.Q(estado="EN_PROCESO")),
+        ]
 
+class PagoIntentoBlob(models.Model):
+    """Payload pesado de un intento, comprimido y fuera de pagos_intentos (ver intento_blobs.py)."""
+    id = models.BigAutoField(primary_key=True)
+    intento = models.ForeignKey("finanzas.PagoIntento", models.CASCADE, db_column="intento_id", related_name="blobs")
+    campo = models.CharField(max_length=20, choices=[(c, c) for c in PagoIntento.CAMPOS_BLOB])
+    formato = models.CharField(max_length=12)  # png | json+zlib | texto+zlib
+    datos = models.BinaryField()
+    tamano_original = models.IntegerField()
+    actualizado_en = models.DateTimeField(auto_now=True)
 
     class Meta:
-        db_table = "pagos_intentos"
+        db_table = "pagos_intentos_blobs"
+        constraints = [
+            models.UniqueConstraint(fields=["intento", "campo"], name="uq_intento_blob"),
+        ]
+
+class WebhookEvento(models.Model):
+    """Bandeja de callbacks de pasarelas: se guarda el evento crudo y se procesa aparte (ver webhooks.py)."""
+    ESTADOS = (("PENDIENTE","PENDIENTE"),("PROCESADO","PROCESADO"),("ERROR","ERROR"),("IGNORADO","IGNORADO"))
+    id = models.BigAutoField(primary_key=True)
+    proveedor = models.CharField(max_length=40)
+    evento_id = models.CharField(max_length=120)
+    pago = models.ForeignKey("finanzas.Pago", models.SET_NULL, blank=True, null=True, db_column="pago_id")
+    intento = models.ForeignKey("finanzas.PagoIntento", models.SET_NULL, blank=True, null=True, db_column="intento_id")
+    payload = models.JSONField()
+    estado = models.CharField(max_length=12, choices=ESTADOS, default="PENDIENTE")
+    intentos = models.SmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    recibido_en = models.DateTimeField(auto_now_add=True)
+    procesado_en = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "webhooks_eventos"
+        # un reintento de la pasarela trae el mismo id de evento: se descarta en el INSERT
+        constraints = [models.UniqueConstraint(fields=["proveedor","evento_id"], name="uq_webhook_evento")]
+        # cola del procesador: pendientes por pago en orden de llegada
+        indexes = [models.Index(fields=["pago","id"], name="ix_webhook_pendiente",
+                                condition=models.Q(estado="PENDIENTE"))]
 
 class Reembolso(models.Model):
     ESTADOS = (("SOLICITADO","SOLICITADO"),("APROBADO","APROBADO"),
@@ -116,5 +186,35 @@ class EstadoCuentaUnidad(models.Model):
     estado_calculado = models.CharField(max_length=12)
 
     class Meta:
-        managed = False               # <- importante: es una VIEW
-        db_table = "vw_estado_cuenta_unidad"
\ No newline at end of file
+        managed = False               # <- tabla creada por SQL (0008), mantenida por triggers
+        db_table = "estado_cuenta"    # vw_estado_cuenta_unidad queda solo para verificación
+
+    def estado_al(self, fecha):
+        """
+        estado_calculado a 'fecha'. El guardado es el del último refresco de
+        la fila: un cargo que venció después sigue como PENDIENTE.
+        """
+        if self.saldo <= 0:
+            return "PAGADO"
+        if self.vencimiento is not None and self.vencimiento < fecha:
+            return "VENCIDO"
+        return "PENDIENTE"
+
+class ResumenFinanzas(models.Model):
+    """Rollup por (condominio, periodo, concepto) para reportes; ver reportes.py."""
+    pk = models.CompositePrimaryKey("condominio_id", "periodo", "concepto_id")
+    condominio_id = models.BigIntegerField()
+    periodo = models.DateField()
+    concepto_id = models.SmallIntegerField()
+    cargos = models.IntegerField()
+    facturado = models.DecimalField(max_digits=14, decimal_places=2)
+    recargo = models.DecimalField(max_digits=14, decimal_places=2)
+    recaudado = models.DecimalField(max_digits=14, decimal_places=2)
+    pendiente = models.DecimalField(max_digits=14, decimal_places=2)
+    morosos = models.IntegerField()
+    vence_en = models.DateField(null=True, blank=True)  # próximo vencimiento con saldo (0017)
+    actualizado_en = models.DateTimeField()
+
+    class Meta:
+        managed = False               # <- tabla creada por SQL (0015), refrescada desde estado_cuenta
+        db_table = "resumen_finanzas"
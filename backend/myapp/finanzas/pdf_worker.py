@@ -0,0 +1,14 @@
+# myapp/finanzas/pdf_worker.py
+"""
+Initializer de los workers del pool de PDFs. Vive aparte de recibos.py porque
+con 'spawn' se importa antes de django.setup() y no puede arrastrar modelos.
+"""
+
+
+def inicializar():
+    """Deja Django listo y el renderizador tibio en el worker."""
+    import django
+    django.setup()
+
+    from .recibos import get_renderizador
+    get_renderizador()
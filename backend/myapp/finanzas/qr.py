@@ -0,0 +1,215 @@
+# myapp/finanzas/qr.py
+"""
+Imágenes QR de los intentos de pago con caché por contenido.
+
+La clave es el SHA-256 del contenido del QR (texto interno o imagen del
+banco) más el formato; la misma huella es el ETag. Primer nivel: LRU en
+memoria del proceso; segundo nivel: MEDIA_ROOT/qr/<h[:2]>/<h>.<ext>, que
+comparten todos los workers.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import qrcode
+except Exception:
+    qrcode = None
+
+FORMATOS = {"png": "image/png", "svg": "image/svg+xml"}
+# Vigencia por defecto del QR interno (la misma que fija iniciar_qr)
+VIGENCIA_QR = timedelta(minutes=15)
+
+
+class LRUBytes:
+    """LRU en memoria acotado por cantidad de entradas; seguro entre hilos."""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is not None:
+                self._datos.move_to_end(clave)
+            return valor
+
+    def put(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+
+_lru = None
+
+
+def _get_lru():
+    global _lru
+    if _lru is None:
+        _lru = LRUBytes(int(getattr(settings, "FINANZAS_QR_CACHE_ITEMS", 512)))
+    return _lru
+
+
+def _ruta_disco(huella, formato):
+    return os.path.join(settings.MEDIA_ROOT, "qr", huella[:2], f"{huella}.{formato}")
+
+
+def _leer_disco(ruta):
+    try:
+        with open(ruta, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _escribir_disco(ruta, data):
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, ruta)
+    except OSError:
+        pass  # el disco es solo un segundo nivel de caché
+
+
+# -------------------------------
+# Render
+# -------------------------------
+def _matriz(texto):
+    q = qrcode.QRCode(border=4)
+    q.add_data(texto)
+    q.make(fit=True)
+    return q
+
+
+def render_png(texto):
+    buff = BytesIO()
+    _matriz(texto).make_image().save(buff)
+    return buff.getvalue()
+
+
+def render_svg(texto):
+    """
+    SVG de un solo path con corridas horizontales de módulos (1 unidad = 1
+    módulo, escalable sin pérdida). No necesita PIL.
+    """
+    m = _matriz(texto).get_matrix()
+    n = len(m)
+    trazos = []
+    for y, fila in enumerate(m):
+        x = 0
+        while x < n:
+            if not fila[x]:
+                x += 1
+                continue
+            ini = x
+            while x < n and fila[x]:
+                x += 1
+            trazos.append(f"M{ini} {y}h{x - ini}v1h-{x - ini}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {n} {n}" shape-rendering="crispEdges">'
+        f'<path fill="#fff" d="M0 0h{n}v{n}H0z"/><path d="{"".join(trazos)}"/></svg>'
+    ).encode("ascii")
+
+
+def _cacheado(huella, formato, generar):
+    lru = _get_lru()
+    clave = f"{huella}.{formato}"
+    data = lru.get(clave)
+    if data is None:
+        ruta = _ruta_disco(huella, formato)
+        data = _leer_disco(ruta)
+        if data is None:
+            data = generar()
+            _escribir_disco(ruta, data)
+        lru.put(clave, data)
+    return data
+
+
+def imagen_desde_texto(texto, formato="png"):
+    """(bytes, huella) del QR de un texto, generado una sola vez por contenido."""
+    if qrcode is None:
+        raise RuntimeError("Servidor sin 'qrcode'.")
+    huella = hashlib.sha256(f"{formato}\n{texto}".encode("utf-8")).hexdigest()
+    generar = render_svg if formato == "svg" else render_png
+    return _cacheado(huella, formato, lambda: generar(texto)), huella
+
+
+def imagen_desde_b64(b64img):
+    """(bytes, huella) del PNG que entregó el banco en base64 (se decodifica una vez)."""
+    huella = hashlib.sha256(f"png\n{b64img}".encode("ascii", "ignore")).hexdigest()
+    return _cacheado(huella, "png", lambda: base64.b64decode(b64img, validate=True)), huella
+
+
+# -------------------------------
+# Datos del intento
+# -------------------------------
+def texto_qr_intento(intento):
+    """Texto del QR interno guardado en el intento (payload o raw_request.qr_text)."""
+    from .intento_blobs import leer
+
+    payload = getattr(intento, "payload", None)
+    if not payload:
+        raw = leer(intento, "raw_request")
+        if raw and isinstance(raw, dict) and raw.get("qr_text"):
+            payload = raw.get("qr_text")
+        elif raw and isinstance(raw, str):
+            try:
+                payload = json.loads(raw).get("qr_text")
+            except Exception:
+                payload = None
+    if not payload:
+        return None
+    return payload if isinstance(payload, str) else json.dumps(payload, separators=(",", ":"))
+
+
+def expiracion_intento(intento, texto=None):
+    """
+    Momento en que vence el QR: columna expires_at si existe, 'exp' del texto
+    interno, expirationDate del banco o, en último caso, creado_en + 15 min.
+    """
+    exp = getattr(intento, "expires_at", None)
+    if exp:
+        return exp
+    if texto and texto.startswith("SCONDO://PAY?d="):
+        try:
+            data = json.loads(texto[len("SCONDO://PAY?d="):].rsplit("&sig=", 1)[0])
+            return datetime.fromtimestamp(int(data["exp"]), tz=dt_timezone.utc)
+        except Exception:
+            pass
+    from .intento_blobs import leer
+
+    bnb = leer(intento, "bnb_payload")
+    if isinstance(bnb, dict) and bnb.get("expirationDate"):
+        try:
+            fecha = datetime.fromisoformat(str(bnb["expirationDate"]))
+            if timezone.is_naive(fecha):
+                fecha = timezone.make_aware(fecha)
+            return fecha
+        except ValueError:
+            pass
+    creado = getattr(intento, "creado_en", None)
+    return creado + VIGENCIA_QR if creado else None
+
+
+def cache_control_hasta(expira):
+    """Cache-Control para una imagen inmutable que deja de servir en 'expira'."""
+    if expira is None:
+        return "private, max-age=60"
+    segundos = int((expira - timezone.now()).total_seconds())
+    if segundos <= 0:
+        return "private, no-cache"
+    return f"private, max-age={segundos}, immutable"
@@ -0,0 +1,478 @@
+# myapp/finanzas/recibos.py
+"""
+Recibos PDF: armado del contexto, render (WeasyPrint con fallback ReportLab)
+y caché direccionada por contenido en MEDIA_ROOT/documentos/recibos/.
+
+El archivo se nombra con la huella SHA-256 de (versión de plantilla + datos
+del documento), así que cualquier cambio en el documento, sus detalles o la
+plantilla produce un archivo nuevo y la huella sirve como ETag.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from . import pdf_worker
+from .models import Documento, DocumentoArchivo, PagoDetalle
+
+logger = logging.getLogger(__name__)
+
+PLANTILLA_RECIBO = "finanzas/recibo.html"
+# Subir al cambiar el layout del fallback ReportLab (la plantilla HTML ya entra en la huella)
+RECIBO_LAYOUT = "1"
+
+
+# -------------------------------
+# Contexto / huella
+# -------------------------------
+def _armar_contexto(doc, detalles):
+    return {
+        "documento": doc,
+        "detalles": detalles,
+        "unidad": detalles[0].cargo.unidad if detalles else None,
+        "hoy": timezone.now(),
+        "SITE_NAME": getattr(settings, "SITE_NAME", "Condominio"),
+    }
+
+
+def _detalles_qs():
+    return PagoDetalle.objects.select_related("pago", "cargo__unidad__condominio", "cargo__concepto")
+
+
+def contexto_recibo(doc):
+    detalles = list(_detalles_qs().filter(pago__documento=doc).order_by("cargo_id"))
+    return _armar_contexto(doc, detalles)
+
+
+def contextos_recibos(docs):
+    """Contextos de varios documentos con una sola consulta de detalles."""
+    por_doc = {d.id: [] for d in docs}
+    for det in _detalles_qs().filter(pago__documento_id__in=list(por_doc)).order_by("pago__documento_id", "cargo_id"):
+        por_doc[det.pago.documento_id].append(det)
+    return [_armar_contexto(doc, por_doc[doc.id]) for doc in docs]
+
+
+def ruta_css_recibo():
+    return os.path.join(os.path.dirname(get_template(PLANTILLA_RECIBO).origin.name), "recibo.css")
+
+
+_version_plantilla = None
+
+
+def version_plantilla():
+    """Hash de recibo.html + recibo.css + RECIBO_LAYOUT (se calcula una vez por proceso)."""
+    global _version_plantilla
+    if _version_plantilla is None:
+        h = hashlib.sha256(RECIBO_LAYOUT.encode())
+        for ruta in (get_template(PLANTILLA_RECIBO).origin.name, ruta_css_recibo()):
+            with open(ruta, "rb") as f:
+                h.update(f.read())
+        _version_plantilla = h.hexdigest()[:16]
+    return _version_plantilla
+
+
+def huella_recibo(contexto):
+    """SHA-256 de los datos que se imprimen en el recibo ('hoy' no entra: solo se usa sin detalles)."""
+    doc = contexto["documento"]
+    data = {
+        "v": version_plantilla(),
+        "site": contexto.get("SITE_NAME"),
+        "doc": [doc.id, doc.numero, doc.tipo, doc.moneda, str(doc.total), str(doc.condominio_id)],
+        "unidad": str(contexto.get("unidad") or ""),
+        "det": [
+            [d.id, d.pago.fecha.isoformat(), d.pago.medio, d.cargo.concepto.codigo,
+             d.cargo.concepto.nombre, str(d.cargo.periodo), str(d.monto_aplicado)]
+            for d in contexto["detalles"]
+        ],
+    }
+    s = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(s.encode()).hexdigest()
+
+
+def ruta_recibo(huella):
+    """Ruta relativa a MEDIA_ROOT (lo que se guarda en DocumentoArchivo.url)."""
+    return os.path.join("documentos", "recibos", huella[:2], f"{huella}.pdf")
+
+
+# Rutas de recibos generados por el sistema: la caché actual y los
+# documentos/recibo_<id>.pdf que escribía la versión anterior de descargar.
+# Cualquier otro DocumentoArchivo lo cargó un usuario y no se toca.
+PREFIJOS_RECIBO = (os.path.join("documentos", "recibos", ""), os.path.join("documentos", "recibo_"))
+
+
+def filtro_recibo():
+    """Q de los DocumentoArchivo que son el recibo cacheado (ver PREFIJOS_RECIBO)."""
+    q = Q()
+    for prefijo in PREFIJOS_RECIBO:
+        q |= Q(url__startswith=prefijo)
+    return q
+
+
+def ruta_absoluta(relpath):
+    media_root = getattr(settings, "MEDIA_ROOT", None)
+    if not media_root:
+        raise RuntimeError("MEDIA_ROOT no está configurado en settings; no se puede guardar el PDF")
+    return os.path.join(media_root, relpath)
+
+
+# -------------------------------
+# Render
+# -------------------------------
+class RenderizadorRecibos:
+    """
+    Renderizador "tibio": importa WeasyPrint/ReportLab, compila la plantilla y
+    parsea recibo.css una sola vez; cada render solo procesa el HTML del recibo.
+    WeasyPrint no es thread-safe con una FontConfiguration compartida, así que
+    hay una instancia por hilo (get_renderizador).
+    """
+
+    def __init__(self):
+        self.plantilla = get_template(PLANTILLA_RECIBO)
+        self.HTML = None
+        try:
+            from weasyprint import CSS, HTML  # noqa
+            from weasyprint.text.fonts import FontConfiguration
+            self.font_config = FontConfiguration()
+            with open(ruta_css_recibo(), encoding="utf-8") as f:
+                self.css = CSS(string=f.read(), font_config=self.font_config)
+            self.HTML = HTML
+        except Exception as e:
+            # No está disponible (Windows sin GTK) -> se usará el fallback
+            logger.info("WeasyPrint no disponible, recibos con ReportLab: %s", e)
+        self._reportlab = None
+
+    def render(self, contexto, base_url=None):
+        """Intenta generar PDF con WeasyPrint. Si falla, usa ReportLab. Retorna bytes."""
+        if self.HTML is not None:
+            try:
+                html_str = self.plantilla.render(contexto)
+                return self.HTML(string=html_str, base_url=base_url).write_pdf(
+                    stylesheets=[self.css], font_config=self.font_config
+                )
+            except Exception:
+                logger.exception("Falló WeasyPrint; se usa ReportLab")
+        return self._render_reportlab(contexto)
+
+    def _cargar_reportlab(self):
+        if self._reportlab is None:
+            try:
+                from reportlab.lib.pagesizes import A4
+                from reportlab.lib.units import mm
+                from reportlab.pdfgen import canvas
+            except Exception as e:
+                raise RuntimeError(f"No se pudo generar PDF (WeasyPrint/ReportLab): {e}")
+            self._reportlab = (A4, mm, canvas)
+        return self._reportlab
+
+    def _render_reportlab(self, contexto):
+        A4, mm, canvas = self._cargar_reportlab()  # noqa: N806
+        buff = BytesIO()
+        c = canvas.Canvas(buff, pagesize=A4)
+        w, h = A4
+
+        # Encabezado simple
+        c.setFont("Helvetica-Bold", 14)
+        numero = contexto["documento"].numero or f"ID {contexto['documento'].id}"
+        c.drawString(20*mm, (h-20*mm), f"RECIBO {numero}")
+
+        c.setFont("Helvetica", 10)
+        c.drawString(20*mm, (h-28*mm), f"Fecha: {timezone.localtime(contexto['hoy']).strftime('%Y-%m-%d %H:%M')}")
+        c.drawString(20*mm, (h-34*mm), f"Moneda: {contexto['documento'].moneda}")
+        if contexto.get("unidad"):
+            c.drawString(20*mm, (h-40*mm), f"Unidad: {contexto['unidad']}")
+
+        y = h - 55*mm
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(20*mm, y, "Detalle")
+        y -= 6*mm
+        c.setFont("Helvetica", 10)
+
+        for d in contexto["detalles"]:
+            linea = f"- {d.cargo.concepto} ({getattr(d.cargo, 'periodo', '')}): {d.monto_aplicado}"
+            c.drawString(20*mm, y, linea)
+            y -= 6*mm
+            if y < 25*mm:
+                c.showPage()
+                y = h - 20*mm
+                c.setFont("Helvetica", 10)
+
+        y -= 4*mm
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(20*mm, y, f"TOTAL: {contexto['documento'].total}")
+
+        c.showPage()
+        c.save()
+        return buff.getvalue()
+
+
+_local = threading.local()
+
+
+def get_renderizador():
+    r = getattr(_local, "renderizador", None)
+    if r is None:
+        r = _local.renderizador = RenderizadorRecibos()
+    return r
+
+
+def _nuevo_pool_procesos(max_workers):
+    # 'spawn': los workers no heredan la conexión a la base del proceso padre
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=pdf_worker.inicializar,
+    )
+
+
+def _render_en_proceso(contexto):
+    return get_renderizador().render(contexto)
+
+
+def _render_y_guardar(contexto, relpath):
+    """Tarea del lote: el worker escribe el PDF y devuelve solo el tamaño."""
+    pdf_bytes = get_renderizador().render(contexto)
+    guardar_pdf(relpath, pdf_bytes)
+    return len(pdf_bytes)
+
+
+_pool_procesos = None
+
+
+def get_pool_procesos(max_workers=None):
+    """ProcessPoolExecutor de la app (workers con el renderizador ya cargado)."""
+    global _pool_procesos
+    if _pool_procesos is None:
+        _pool_procesos = _nuevo_pool_procesos(
+            max_workers or int(getattr(settings, "FINANZAS_PDF_PROCESOS", 0) or 0) or None
+        )
+    return _pool_procesos
+
+
+def render_recibo_pdf_bytes(request, contexto):
+    """
+    Genera el PDF del recibo con el renderizador tibio del hilo, o en el pool
+    de procesos si FINANZAS_PDF_PROCESOS > 0. 'request' es opcional.
+    """
+    if int(getattr(settings, "FINANZAS_PDF_PROCESOS", 0) or 0) > 0:
+        return get_pool_procesos().submit(_render_en_proceso, contexto).result()
+    base_url = request.build_absolute_uri("/") if request is not None else None
+    return get_renderizador().render(contexto, base_url=base_url)
+
+
+# -------------------------------
+# Caché en disco
+# -------------------------------
+def guardar_pdf(relpath, pdf_bytes):
+    """Escritura atómica (tmp + rename) para que un lector nunca vea un PDF a medias."""
+    destino = ruta_absoluta(relpath)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp, destino)
+    return destino
+
+
+def registrar_archivo(doc, relpath):
+    """Apunta la fila del recibo cacheado del documento a relpath (crea una si no hay)."""
+    with transaction.atomic():
+        actualizados = (
+            DocumentoArchivo.objects
+            .filter(filtro_recibo(), documento=doc, tipo="PDF")
+            .update(url=relpath)
+        )
+        if not actualizados:
+            DocumentoArchivo.objects.create(documento=doc, url=relpath, tipo="PDF")
+
+
+def obtener_recibo(doc, request=None):
+    """
+    Devuelve (ruta_absoluta, huella) del PDF vigente del documento;
+    lo genera y registra si la versión actual aún no está en disco.
+    """
+    contexto = contexto_recibo(doc)
+    huella = huella_recibo(contexto)
+    relpath = ruta_recibo(huella)
+    destino = ruta_absoluta(relpath)
+    if not os.path.exists(destino):
+        guardar_pdf(relpath, render_recibo_pdf_bytes(request, contexto))
+        registrar_archivo(doc, relpath)
+    return destino, huella
+
+
+def registrar_archivos(rutas_por_doc):
+    """Versión en bloque de registrar_archivo: {documento_id: relpath}."""
+    if not rutas_por_doc:
+        return
+    with transaction.atomic():
+        existentes = list(
+            DocumentoArchivo.objects
+            .filter(filtro_recibo(), documento_id__in=list(rutas_por_doc), tipo="PDF")
+        )
+        vistos = set()
+        for a in existentes:
+            a.url = rutas_por_doc[a.documento_id]
+            vistos.add(a.documento_id)
+        DocumentoArchivo.objects.bulk_update(existentes, ["url"], batch_size=1000)
+        DocumentoArchivo.objects.bulk_create(
+            [DocumentoArchivo(documento_id=d, url=r, tipo="PDF") for d, r in rutas_por_doc.items() if d not in vistos],
+            batch_size=1000,
+        )
+
+
+def generar_recibos_lote(documentos, procesos=None, chunk=200, forzar=False, progreso=None):
+    """
+    Genera los PDFs de un queryset de Documento en un ProcessPoolExecutor
+    (procesos=None -> todos los núcleos). Recorre el queryset con iterator(),
+    arma contextos por bloques (una consulta de detalles por bloque) y registra
+    los DocumentoArchivo en bloque. Los PDFs ya vigentes en disco se reutilizan
+    salvo forzar=True. Devuelve estadísticas y {documento_id: ruta_absoluta}.
+    """
+    t0 = time.perf_counter()
+    stats = {"documentos": 0, "generados": 0, "reutilizados": 0, "errores": 0, "bytes": 0}
+    rutas = {}
+
+    def bloques():
+        buf = []
+        for doc in documentos.select_related("condominio").order_by("id").iterator(chunk_size=chunk):
+            buf.append(doc)
+            if len(buf) >= chunk:
+                yield buf
+                buf = []
+        if buf:
+            yield buf
+
+    with _nuevo_pool_procesos(procesos or os.cpu_count()) as pool:
+        for docs in bloques():
+            nuevas = {}
+            futuros = {}
+            for ctx in contextos_recibos(docs):
+                doc = ctx["documento"]
+                relpath = ruta_recibo(huella_recibo(ctx))
+                rutas[doc.id] = ruta_absoluta(relpath)
+                nuevas[doc.id] = relpath
+                if not forzar and os.path.exists(rutas[doc.id]):
+                    stats["reutilizados"] += 1
+                    continue
+                futuros[pool.submit(_render_y_guardar, ctx, relpath)] = doc.id
+            for fut in as_completed(futuros):
+                try:
+                    stats["bytes"] += fut.result()
+                    stats["generados"] += 1
+                except Exception:
+                    logger.exception("No se pudo generar el recibo del documento %s", futuros[fut])
+                    stats["errores"] += 1
+                    nuevas.pop(futuros[fut], None)
+                    rutas.pop(futuros[fut], None)
+            registrar_archivos(nuevas)
+            stats["documentos"] += len(docs)
+            if progreso:
+                progreso(stats, time.perf_counter() - t0)
+
+    stats["segundos"] = time.perf_counter() - t0
+    stats["pdf_por_segundo"] = stats["generados"] / stats["segundos"] if stats["segundos"] else 0.0
+    return stats, rutas
+
+
+def empaquetar_zip(rutas, destino):
+    """ZIP con los PDFs (sin recomprimir: ya vienen comprimidos)."""
+    import zipfile
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_STORED) as z:
+        for doc_id, ruta in sorted(rutas.items()):
+            z.write(ruta, arcname=f"recibo_{doc_id}.pdf")
+    return destino
+
+
+def unir_pdfs(rutas, destino):
+    """Un solo PDF con todos los recibos (requiere 'pypdf')."""
+    try:
+        from pypdf import PdfWriter
+    except Exception as e:
+        raise RuntimeError(f"Para unir PDFs instala 'pypdf': {e}")
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    writer = PdfWriter()
+    for _, ruta in sorted(rutas.items()):
+        writer.append(ruta)
+    with open(destino, "wb") as f:
+        writer.write(f)
+    return destino
+
+
+# -------------------------------
+# Pre-render en segundo plano
+# -------------------------------
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(getattr(settings, "FINANZAS_PDF_WORKERS", 2) or 1),
+            thread_name_prefix="recibos",
+        )
+    return _executor
+
+
+def _prerender(documento_id):
+    close_old_connections()
+    try:
+        doc = Documento.objects.select_related("condominio").get(pk=documento_id)
+        obtener_recibo(doc)
+    except Exception:
+        logger.exception("No se pudo pre-generar el recibo del documento %s", documento_id)
+    finally:
+        close_old_connections()
+
+
+def programar_recibo(documento_id):
+    """Encola el render del recibo para después del commit (no bloquea el request)."""
+    if not documento_id or not getattr(settings, "FINANZAS_PDF_PRERENDER", True):
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_prerender, documento_id))
+
+
+# Lotes pedidos desde el admin: un hilo aparte, de a uno (cada lote ya usa
+# todos los núcleos) y fuera del request, que gunicorn corta a los 120 s
+_executor_lotes = None
+
+
+def _get_executor_lotes():
+    global _executor_lotes
+    if _executor_lotes is None:
+        _executor_lotes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recibos-lote")
+    return _executor_lotes
+
+
+def _generar_lote(documento_ids, forzar):
+    close_old_connections()
+    try:
+        stats, _ = generar_recibos_lote(Documento.objects.filter(id__in=documento_ids), forzar=forzar)
+        logger.info(
+            "Lote de recibos: %s generados, %s reutilizados, %s errores en %.1f s",
+            stats["generados"], stats["reutilizados"], stats["errores"], stats["segundos"],
+        )
+    except Exception:
+        logger.exception("Falló el lote de %s recibos", len(documento_ids))
+    finally:
+        close_old_connections()
+
+
+def programar_recibos_lote(documento_ids, forzar=False):
+    """Encola generar_recibos_lote para después del commit; devuelve cuántos documentos."""
+    ids = sorted(set(documento_ids))
+    if ids:
+        transaction.on_commit(lambda: _get_executor_lotes().submit(_generar_lote, ids, forzar))
+    return len(ids)
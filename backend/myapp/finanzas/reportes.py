@@ -0,0 +1,220 @@
+# myapp/finanzas/reportes.py
+"""
+Reportes agregados de finanzas sobre el rollup resumen_finanzas (0015).
+
+El rollup tiene una fila por (condominio, periodo, concepto) y se mantiene
+desde estado_cuenta: los triggers solo anotan las claves tocadas y
+refrescar_resumen() recalcula esos grupos. Cada consulta refresca primero
+(barato: solo lo pendiente; si otra sesión ya está refrescando, lee sin
+esperarla) y después agrega unas pocas filas por mes, así un rango de
+varios años no recorre cargos ni pagos. El cron refrescar_resumen deja el
+rollup al día aunque nadie consulte.
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Max, Sum
+from django.db.models.functions import ExtractYear
+
+from .models import ResumenFinanzas
+
+# grupo pedido -> (clave en la respuesta, expresión)
+AGRUPACIONES = {
+    "condominio": ("condominio_id", None),
+    "anio": ("anio", ExtractYear("periodo")),
+    "periodo": ("periodo", None),
+    "concepto": ("concepto_id", None),
+}
+MEDIDAS = ("cargos", "facturado", "recargo", "recaudado", "pendiente")
+
+
+# Lectura: refrescar solo si nadie más lo está haciendo (el lock es el mismo que
+# toma la función, reentrante en la sesión) y la transacción puede escribir
+SQL_REFRESCAR_SI_LIBRE = """
+SELECT CASE WHEN current_setting('transaction_read_only') = 'on' THEN NULL
+            WHEN pg_try_advisory_xact_lock(hashtext('public.resumen_finanzas'))
+            THEN public.refrescar_resumen_finanzas() END
+"""
+
+
+def refrescar_resumen(esperar=True):
+    """
+    Recalcula los grupos pendientes del rollup; devuelve cuántos. Con
+    esperar=False (lecturas del endpoint) no hace fila detrás de otro
+    refresco ni escribe en una conexión de solo lectura: lee el rollup como
+    está y deja lo pendiente al que refresca o al comando refrescar_resumen.
+    """
+    with connection.cursor() as cur:
+        cur.execute("SELECT public.refrescar_resumen_finanzas()" if esperar else SQL_REFRESCAR_SI_LIBRE)
+        return cur.fetchone()[0] or 0
+
+
+def reconstruir_resumen():
+    """Marca todas las claves de estado_cuenta como pendientes y refresca (rollup completo)."""
+    with connection.cursor() as cur:
+        cur.execute("TRUNCATE public.resumen_finanzas")
+        cur.execute(
+            """
+            INSERT INTO public.resumen_finanzas_pendientes (condominio_id, periodo, concepto_id)
+            SELECT DISTINCT u.condominio_id, ec.periodo, ec.concepto_id
+              FROM public.estado_cuenta ec
+              JOIN public.unidades u ON u.id = ec.unidad_id
+            """
+        )
+    return refrescar_resumen()
+
+
+COLUMNAS = "condominio_id, periodo, concepto_id, cargos, facturado, recargo, recaudado, pendiente, morosos"
+SQL_DIRECTO = """
+SELECT u.condominio_id, ec.periodo, ec.concepto_id, count(*), sum(ec.monto), sum(ec.recargo),
+       sum(ec.pagado), sum(greatest(ec.saldo, 0)),
+       count(DISTINCT ec.unidad_id) FILTER (WHERE ec.saldo > 0 AND ec.vencimiento < CURRENT_DATE)
+  FROM public.estado_cuenta ec
+  JOIN public.unidades u ON u.id = ec.unidad_id
+ WHERE ec.estado_registrado <> 'ANULADO'
+ GROUP BY u.condominio_id, ec.periodo, ec.concepto_id
+"""
+
+
+def diferencias_resumen(limite=None):
+    """Filas en que el rollup (ya refrescado) no coincide con agregar estado_cuenta desde cero."""
+    refrescar_resumen()
+    sql = f"""
+        SELECT 'solo_directo' AS lado, d.* FROM ({SQL_DIRECTO} EXCEPT SELECT {COLUMNAS} FROM public.resumen_finanzas) d
+        UNION ALL
+        SELECT 'solo_rollup' AS lado, d.* FROM (SELECT {COLUMNAS} FROM public.resumen_finanzas EXCEPT {SQL_DIRECTO}) d
+        ORDER BY 2, 3, 4, 1
+    """
+    if limite:
+        sql += f" LIMIT {int(limite)}"
+    with connection.cursor() as cur:
+        cur.execute(sql)
+        return cur.fetchall()
+
+
+def resumen(agrupar=("periodo",), condominio_id=None, concepto_id=None, desde=None, hasta=None):
+    """
+    {"filas": [...], "totales": {...}} agrupado por 'agrupar' (claves de
+    AGRUPACIONES). 'morosos' de una fila agregada es el máximo de las filas
+    del rollup que junta: una unidad morosa en dos meses o conceptos no se
+    puede sumar dos veces.
+    """
+    refrescar_resumen(esperar=False)
+    qs = ResumenFinanzas.objects.all()
+    if condominio_id:
+        qs = qs.filter(condominio_id=condominio_id)
+    if concepto_id:
+        qs = qs.filter(concepto_id=concepto_id)
+    if desde:
+        qs = qs.filter(periodo__gte=desde)
+    if hasta:
+        qs = qs.filter(periodo__lte=hasta)
+
+    campos, expresiones = [], {}
+    for grupo in agrupar:
+        clave, expresion = AGRUPACIONES[grupo]
+        campos.append(clave)
+        if expresion is not None:
+            expresiones[clave] = expresion
+    filas = list(
+        qs.values(*(c for c in campos if c not in expresiones), **expresiones)
+        .annotate(**{m: Sum(m) for m in MEDIDAS}, morosos=Max("morosos"))
+        .order_by(*campos)
+    )
+
+    totales = {m: sum((f[m] for f in filas), 0 if m == "cargos" else Decimal("0.00")) for m in MEDIDAS}
+    totales["morosos"] = max((f["morosos"] for f in filas), default=0)
+    for fila in filas + [totales]:
+        exigible = fila["facturado"] + fila["recargo"]
+        fila["cobranza"] = round(fila["recaudado"] / exigible, 4) if exigible else None
+    return {"filas": filas, "totales": totales}
+
+
+# -------------------------------
+# Morosidad por antigüedad
+# -------------------------------
+# (clave, días desde, días hasta) sobre fecha de corte - vencimiento
+TRAMOS = (("d0_30", 1, 30), ("d31_60", 31, 60), ("d61_90", 61, 90), ("d90_mas", 91, None))
+COLUMNAS_MOROSIDAD = ("cargos",) + tuple(t[0] for t in TRAMOS) + ("total", "dias_max")
+
+
+def _tramo(desde, hasta):
+    dias = "%(fecha)s::date - ec.vencimiento"
+    return f"{dias} >= {desde}" if hasta is None else f"{dias} BETWEEN {desde} AND {hasta}"
+
+
+def _sql_por_unidad(condominio_id):
+    tramos = ",\n               ".join(
+        f"coalesce(sum(ec.saldo) FILTER (WHERE {_tramo(desde, hasta)}), 0) AS {clave}"
+        for clave, desde, hasta in TRAMOS
+    )
+    filtro = "AND un.condominio_id = %(condominio)s" if condominio_id else ""
+    # ix_ec_morosidad (0016): solo filas con saldo, en orden de unidad
+    return f"""
+        SELECT un.condominio_id, ec.unidad_id, un.codigo,
+               count(*) AS cargos,
+               {tramos},
+               sum(ec.saldo) AS total,
+               max(%(fecha)s::date - ec.vencimiento) AS dias_max
+          FROM public.estado_cuenta ec
+          JOIN public.unidades un ON un.id = ec.unidad_id
+         WHERE ec.saldo > 0 AND ec.vencimiento < %(fecha)s::date AND ec.estado_registrado <> 'ANULADO'
+           {filtro}
+         GROUP BY un.condominio_id, ec.unidad_id, un.codigo
+    """
+
+
+def morosidad(fecha, condominio_id=None, top=20):
+    """
+    Saldos vencidos a 'fecha' por tramos de días desde el vencimiento
+    (1-30, 31-60, 61-90, más de 90), en una sola consulta agrupada sobre
+    estado_cuenta: subtotales por condominio y las 'top' unidades que más
+    deben. Los saldos son los actuales (estado_cuenta no guarda historia):
+    'fecha' mueve el corte de antigüedad, no reconstruye pagos pasados.
+    """
+    # sum() de un count(*) es numeric: cargos vuelve a entero, como en las filas de unidad
+    agregados = {"cargos": "sum(cargos)::bigint", "dias_max": "max(dias_max)"}
+    medidas = ", ".join(agregados.get(c, f"sum({c})") for c in COLUMNAS_MOROSIDAD)
+    sql = f"""
+        WITH u AS ({_sql_por_unidad(condominio_id)})
+        SELECT 'condominio', u.condominio_id, NULL::bigint, c.nombre, count(*), {medidas}
+          FROM u
+          JOIN public.condominios c ON c.id = u.condominio_id
+         GROUP BY u.condominio_id, c.nombre
+        UNION ALL
+        (SELECT 'unidad', condominio_id, unidad_id, codigo, 1, {", ".join(COLUMNAS_MOROSIDAD)}
+           FROM u
+          ORDER BY total DESC, unidad_id
+          LIMIT %(top)s)
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, {"fecha": fecha, "condominio": condominio_id, "top": top})
+        filas = cur.fetchall()
+
+    condominios, unidades = [], []
+    for tipo, cond_id, unidad_id, nombre, n_unidades, *valores in filas:
+        fila = dict(zip(COLUMNAS_MOROSIDAD, valores))
+        if tipo == "condominio":
+            condominios.append({"condominio_id": cond_id, "condominio": nombre, "unidades": n_unidades, **fila})
+        else:
+            unidades.append({"condominio_id": cond_id, "unidad_id": unidad_id, "unidad": nombre, **fila})
+    condominios.sort(key=lambda f: f["total"], reverse=True)
+
+    totales = {c: sum((f[c] for f in condominios), Decimal("0.00")) for c in COLUMNAS_MOROSIDAD[1:-1]}
+    totales["cargos"] = sum(f["cargos"] for f in condominios)
+    totales["unidades"] = sum(f["unidades"] for f in condominios)
+    totales["dias_max"] = max((f["dias_max"] for f in condominios), default=0)
+    return {"fecha": fecha, "tramos": [t[0] for t in TRAMOS], "condominios": condominios,
+            "top": unidades, "totales": totales}
+
+
+def morosidad_unidades(fecha, condominio_id=None, lote=2000):
+    """Todas las unidades con saldo vencido (para CSV), con cursor del lado del servidor."""
+    sql = _sql_por_unidad(condominio_id) + " ORDER BY 1, total DESC, 2"
+    with connection.chunked_cursor() as cur:
+        cur.execute(sql, {"fecha": fecha, "condominio": condominio_id})
+        while True:
+            filas = cur.fetchmany(lote)
+            if not filas:
+                return
+            yield from filas
@@ -1,11 +1,15 @@
 from decimal import Decimal
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from rest_framework import serializers
 
+from myapp.propiedades.models import Condominio
+from . import intento_blobs
 from .models import (
     Concepto, Cargo, Documento, Pago, PagoDetalle,
     DocumentoArchivo, PagoIntento, Reembolso, EstadoCuentaUnidad
 )
+from .reportes import AGRUPACIONES
 
 # -----------------------------
 # Conceptos
@@ -58,7 +62,7 @@ class CargoSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({"vencimiento": "Fecha de vencimiento inválida."})
             attrs["periodo"] = d.replace(day=1)
 
-        # unidad obligatoria (los masivos el front los crea uno por unidad)
+        # unidad obligatoria (los masivos van por cargos/generar_periodo/)
         if not attrs.get("unidad"):
             raise serializers.ValidationError({"unidad": "Debes seleccionar una unidad."})
 
@@ -68,6 +72,29 @@ class CargoSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class CargoGenerarPeriodoSerializer(serializers.Serializer):
+    """
+    Generación masiva de un periodo para todo un condominio.
+    - regla 'fija': 'monto' por unidad
+    - regla 'area_m2': 'monto' es tarifa por m2 (Unidad.area_m2)
+    """
+    condominio = serializers.PrimaryKeyRelatedField(queryset=Condominio.objects.all())
+    concepto = serializers.PrimaryKeyRelatedField(queryset=Concepto.objects.all())
+    periodo = serializers.DateField()
+    vencimiento = serializers.DateField(required=False, allow_null=True)
+    regla = serializers.ChoiceField(choices=["fija", "area_m2"], default="fija")
+    monto = serializers.DecimalField(max_digits=12, decimal_places=4)
+
+    def validate_monto(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("El monto debe ser mayor a 0.")
+        return value
+
+    def validate(self, attrs):
+        attrs["periodo"] = attrs["periodo"].replace(day=1)
+        return attrs
+
+
 # -----------------------------
 # Documentos / Archivos
 # -----------------------------
@@ -96,13 +123,17 @@ class PagoDetalleSerializer(serializers.ModelSerializer):
 
 
 class PagoRegistrarDetalleSerializer(serializers.Serializer):
-    cargo = serializers.PrimaryKeyRelatedField(queryset=Cargo.objects.all())
+    # id del cargo; PagoRegistrarSerializer.validate los resuelve todos en una consulta
+    cargo = serializers.IntegerField(min_value=1)
     monto_aplicado = serializers.DecimalField(max_digits=12, decimal_places=2)
 
 
+MEDIOS_PAGO = ["EFECTIVO", "TRANSFERENCIA", "QR", "TARJETA", "BILLETERA"]
+
+
 class PagoRegistrarSerializer(serializers.Serializer):
     unidad_id = serializers.IntegerField(required=True)
-    medio = serializers.ChoiceField(choices=["EFECTIVO", "TRANSFERENCIA", "QR", "TARJETA", "BILLETERA"])
+    medio = serializers.ChoiceField(choices=MEDIOS_PAGO)
     moneda = serializers.CharField(required=False, default="BOB")
     generar_documento = serializers.BooleanField(required=False, default=True)
     tipo_documento = serializers.CharField(required=False, default="RECIBO")
@@ -120,9 +151,79 @@ class PagoRegistrarSerializer(serializers.Serializer):
             total += Decimal(d["monto_aplicado"])
         if total <= 0:
             raise serializers.ValidationError({"detalles": "El total debe ser > 0."})
+
+        # Un solo id__in para todos los cargos (con unidad/condominio para el documento)
+        cargos = Cargo.objects.select_related("unidad__condominio").in_bulk({d["cargo"] for d in dets})
+        errores = [{} if d["cargo"] in cargos else {"cargo": [
+            serializers.PrimaryKeyRelatedField.default_error_messages["does_not_exist"].format(pk_value=d["cargo"])
+        ]} for d in dets]
+        if any(errores):
+            raise serializers.ValidationError({"detalles": errores})
+        for d in dets:
+            d["cargo"] = cargos[d["cargo"]]
+        return attrs
+
+
+class PagoAsignarItemSerializer(serializers.Serializer):
+    unidad_id = serializers.IntegerField(min_value=1)
+    monto = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal("0.01"))
+    medio = serializers.ChoiceField(choices=MEDIOS_PAGO, required=False)
+
+
+class PagoAsignarSerializer(serializers.Serializer):
+    """
+    Pago por unidad y monto, repartido FIFO en el servidor (asignacion.py).
+    Uno: { unidad_id, monto, medio }; lote: { medio, pagos: [{unidad_id, monto, medio?}] }.
+    """
+    MAX_PAGOS = 1000
+
+    unidad_id = serializers.IntegerField(min_value=1, required=False)
+    monto = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal("0.01"), required=False)
+    pagos = PagoAsignarItemSerializer(many=True, required=False)
+    medio = serializers.ChoiceField(choices=MEDIOS_PAGO)
+    moneda = serializers.CharField(required=False, default="BOB")
+    generar_documento = serializers.BooleanField(required=False, default=True)
+    tipo_documento = serializers.CharField(required=False, default="RECIBO")
+    simular = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        pagos = attrs.get("pagos")
+        if pagos is None:
+            if attrs.get("unidad_id") is None or attrs.get("monto") is None:
+                raise serializers.ValidationError("Envía unidad_id y monto, o la lista 'pagos'.")
+            attrs["pagos"] = [{"unidad_id": attrs.pop("unidad_id"), "monto": attrs.pop("monto")}]
+        elif not pagos:
+            raise serializers.ValidationError({"pagos": "Debes enviar por lo menos un pago."})
+        elif len(pagos) > self.MAX_PAGOS:
+            raise serializers.ValidationError({"pagos": f"Máximo {self.MAX_PAGOS} pagos por llamada."})
         return attrs
 
 
+class PagoAnularLoteSerializer(serializers.Serializer):
+    """
+    Anulación masiva (p.ej. un lote del banco revertido): por ids de pago o
+    por ref_externa. Se anulan todos en una transacción.
+    """
+    pago_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                     max_length=10000)
+    ref_externas = serializers.ListField(child=serializers.CharField(max_length=120), required=False,
+                                         max_length=10000)
+
+    def validate(self, attrs):
+        if not attrs.get("pago_ids") and not attrs.get("ref_externas"):
+            raise serializers.ValidationError("Envía pago_ids o ref_externas.")
+        return attrs
+
+
+class PagoConciliarSerializer(serializers.Serializer):
+    """Extracto bancario (multipart) a conciliar contra pagos PENDIENTE y cargos abiertos."""
+    archivo = serializers.FileField()
+    condominio = serializers.IntegerField(min_value=1, required=False)
+    ventana_dias = serializers.IntegerField(min_value=0, max_value=31, default=3)
+    aplicar = serializers.BooleanField(default=True)
+    formato = serializers.ChoiceField(choices=("csv", "ofx"), required=False)
+
+
 class PagoSerializer(serializers.ModelSerializer):
     unidad = serializers.SerializerMethodField(read_only=True)
 
@@ -131,10 +232,10 @@ class PagoSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_unidad(self, obj):
-        # Intentamos usar primer_detalle inyectado en queryset por el viewset
-        det = getattr(obj, "primer_detalle", None)
-        if det is None:
-            det = obj.pagodetalle_set.select_related("cargo__unidad").first()
+        # En listados el viewset anota 'unidad_label' (codigo o id de la unidad del primer detalle)
+        if hasattr(obj, "unidad_label"):
+            return obj.unidad_label
+        det = obj.pagodetalle_set.select_related("cargo__unidad").order_by("id").first()
         if not det or not getattr(det, 'cargo', None) or not getattr(det.cargo, 'unidad_id', None):
             return None
         unidad = det.cargo.unidad
@@ -146,10 +247,47 @@ class PagoSerializer(serializers.ModelSerializer):
 # PagoIntento
 # -----------------------------
 class PagoIntentoSerializer(serializers.ModelSerializer):
+    """
+    Detalle completo: los payloads pesados se leen/escriben en el side store
+    de blobs (intento_blobs), no en la fila.
+    """
     class Meta:
         model = PagoIntento
         fields = "__all__"
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        intento_blobs.cargar([instance])
+        for campo in PagoIntento.CAMPOS_BLOB:
+            if campo in data:
+                data[campo] = intento_blobs.leer(instance, campo)
+        return data
+
+    def _separar_blobs(self, validated_data):
+        return {c: validated_data.pop(c) for c in PagoIntento.CAMPOS_BLOB if c in validated_data}
+
+    def create(self, validated_data):
+        blobs = self._separar_blobs(validated_data)
+        instance = super().create(validated_data)
+        intento_blobs.guardar(instance, **{c: v for c, v in blobs.items() if v is not None})
+        return instance
+
+    def update(self, instance, validated_data):
+        blobs = self._separar_blobs(validated_data)
+        for campo, valor in blobs.items():
+            if valor is None:
+                setattr(instance, campo, None)  # que no reaparezca el valor inline sin migrar
+        instance = super().update(instance, validated_data)
+        intento_blobs.guardar(instance, **blobs)
+        return instance
+
+
+class PagoIntentoListaSerializer(serializers.ModelSerializer):
+    """Listado: sin los payloads pesados (se piden en el detalle)."""
+    class Meta:
+        model = PagoIntento
+        exclude = PagoIntento.CAMPOS_BLOB
+
 
 # -----------------------------
 # Reembolso
@@ -164,6 +302,38 @@ class ReembolsoSerializer(serializers.ModelSerializer):
 # EstadoCuentaUnidad (read-only)
 # -----------------------------
 class EstadoCuentaUnidadSerializer(serializers.ModelSerializer):
+    # VENCIDO se deriva al leer (saldo > 0 y vencimiento < hoy), no del valor guardado
+    estado_calculado = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = EstadoCuentaUnidad
         fields = "__all__"
+
+    def get_estado_calculado(self, obj):
+        return obj.estado_al(timezone.localdate())
+
+
+# -----------------------------
+# Reportes (query params)
+# -----------------------------
+class ReporteResumenSerializer(serializers.Serializer):
+    condominio = serializers.IntegerField(min_value=1, required=False)
+    concepto = serializers.IntegerField(min_value=1, required=False)
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+    # lista separada por comas: condominio, anio, periodo, concepto
+    agrupar = serializers.CharField(required=False, default="periodo")
+
+    def validate_agrupar(self, valor):
+        grupos = [g.strip() for g in valor.split(",") if g.strip()]
+        invalidos = [g for g in grupos if g not in AGRUPACIONES]
+        if invalidos or not grupos:
+            raise serializers.ValidationError(f"Usa una lista de: {', '.join(AGRUPACIONES)}.")
+        return list(dict.fromkeys(grupos))
+
+
+class ReporteMorosidadSerializer(serializers.Serializer):
+    condominio = serializers.IntegerField(min_value=1, required=False)
+    fecha = serializers.DateField(required=False)  # corte; por defecto hoy
+    top = serializers.IntegerField(min_value=0, max_value=500, default=20)
+    formato = serializers.ChoiceField(choices=("json", "csv"), default="json")
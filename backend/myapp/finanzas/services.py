@@ -0,0 +1,172 @@
+# myapp/finanzas/services.py
+"""Operaciones de base de datos compartidas por vistas y comandos de finanzas."""
+import threading
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+
+def recalc_cargos(cargo_ids) -> int:
+    """
+    Recalcula el estado de los cargos indicados en un solo round trip
+    (public.recalc_estado_cargos). Ignora ids vacíos/duplicados.
+    Devuelve cuántos cargos cambiaron de estado.
+    """
+    ids = sorted({int(c) for c in cargo_ids if c})
+    if not ids:
+        return 0
+    with connection.cursor() as cur:
+        cur.execute("SELECT public.recalc_estado_cargos(%s::bigint[])", [ids])
+        return cur.fetchone()[0] or 0
+
+
+def generar_cargos_periodo(condominio_id, concepto_id, periodo, monto, regla="fija", vencimiento=None) -> dict:
+    """
+    Crea en un solo INSERT ... SELECT un cargo por unidad del condominio para
+    (concepto, periodo). regla='fija' usa 'monto' tal cual; regla='area_m2'
+    usa monto * Unidad.area_m2 (unidades sin área se omiten).
+    Los que ya existen (uq_cargo) se saltan con ON CONFLICT DO NOTHING.
+    """
+    if regla == "area_m2":
+        monto_sql = "round(u.area_m2 * %s, 2)"
+    else:
+        monto_sql = "round(%s::numeric, 2)"
+    sql = f"""
+        WITH objetivo AS (
+          SELECT u.id AS unidad_id, {monto_sql} AS monto
+            FROM public.unidades u
+           WHERE u.condominio_id = %s
+        ), ins AS (
+          INSERT INTO public.cargos (unidad_id, concepto_id, periodo, monto, vencimiento, recargo, estado)
+          SELECT o.unidad_id, %s, %s, o.monto, %s, 0, 'PENDIENTE'
+            FROM objetivo o
+           WHERE o.monto > 0
+          ON CONFLICT (unidad_id, concepto_id, periodo) DO NOTHING
+          RETURNING 1
+        )
+        SELECT (SELECT count(*) FROM objetivo),
+               (SELECT count(*) FROM objetivo WHERE monto IS NULL OR monto <= 0),
+               (SELECT count(*) FROM ins)
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [monto, condominio_id, concepto_id, periodo, vencimiento])
+        unidades, sin_monto, creados = cur.fetchone()
+    return {
+        "unidades": unidades,
+        "creados": creados,
+        "omitidos": unidades - sin_monto - creados,  # ya existían
+        "sin_monto": sin_monto,
+    }
+
+
+def reservar_numeros(condominio_id, anio, prefijo, cantidad=1) -> int:
+    """
+    Reserva 'cantidad' números consecutivos con un único UPSERT ... RETURNING
+    sobre documentos_secuencias. Devuelve el último número del rango.
+    Dentro de una transacción la fila del contador queda bloqueada hasta el commit.
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.documentos_secuencias AS s (condominio_id, anio, prefijo, ultimo)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (condominio_id, anio, prefijo)
+            DO UPDATE SET ultimo = s.ultimo + EXCLUDED.ultimo
+            RETURNING ultimo
+            """,
+            [condominio_id, anio, prefijo, cantidad],
+        )
+        return cur.fetchone()[0]
+
+
+# Rangos reservados por este proceso: (condominio, anio, prefijo) -> [siguiente, ultimo]
+_bloques = {}
+_bloques_lock = threading.Lock()
+
+
+def numeracion_por_bloques() -> bool:
+    return int(getattr(settings, "FINANZAS_NUMERO_BLOQUE", 1) or 1) > 1
+
+
+def siguiente_numero_documento(condominio_id, prefijo="R", anio=None) -> str:
+    """
+    Próximo número de documento '<prefijo>-<año>-<seq 6 dígitos>'.
+    Con FINANZAS_NUMERO_BLOQUE <= 1 (default) el número sale del contador en la
+    transacción actual: sin huecos, los cajeros concurrentes solo esperan el commit
+    del contador. Con bloque > 1 cada proceso reserva rangos en autocommit y los
+    reparte en memoria; un rango no usado al reiniciar deja huecos.
+    """
+    anio = anio or timezone.localdate().year
+    bloque = int(getattr(settings, "FINANZAS_NUMERO_BLOQUE", 1) or 1)
+
+    # un rango reservado dentro de una transacción que luego se revierte se repetiría
+    if not numeracion_por_bloques() or connection.in_atomic_block:
+        seq = reservar_numeros(condominio_id, anio, prefijo, 1)
+    else:
+        clave = (condominio_id, anio, prefijo)
+        with _bloques_lock:
+            rango = _bloques.get(clave)
+            if not rango or rango[0] > rango[1]:
+                ultimo = reservar_numeros(condominio_id, anio, prefijo, bloque)
+                rango = _bloques[clave] = [ultimo - bloque + 1, ultimo]
+            seq = rango[0]
+            rango[0] += 1
+    return formato_numero(prefijo, anio, seq)
+
+
+def formato_numero(prefijo, anio, seq) -> str:
+    return f"{prefijo}-{anio}-{seq:06d}"
+
+
+ESTADOS_INTENTO_ACTIVOS = ("CREADO", "EN_PROCESO")
+
+
+def vencimiento_qr_bnb():
+    """
+    (fecha para expirationDate del BNB, expires_at local). El banco caduca por
+    día: el QR vale hasta el fin de esa fecha y el intento vence recién al
+    empezar el día siguiente, para no dar por expirado un QR aún pagable.
+    """
+    dias = int(getattr(settings, "FINANZAS_QR_BNB_VIGENCIA_DIAS", 1) or 1)
+    fecha = timezone.localdate() + timedelta(days=dias)
+    vence = timezone.make_aware(datetime.combine(fecha + timedelta(days=1), dt_time.min))
+    return fecha, vence
+
+
+def expirar_intentos(lote=1000, ahora=None, dry_run=False) -> int:
+    """
+    Pasa a EXPIRO los intentos CREADO/EN_PROCESO con expires_at vencido, en
+    UPDATEs de 'lote' filas (cada uno confirma solo, en autocommit) que
+    recorren el índice parcial ix_intento_activo_expira. Salta filas
+    bloqueadas por otra transacción (las toma el próximo barrido).
+    Devuelve cuántos intentos expiró (o expiraría, con dry_run).
+    """
+    ahora = ahora or timezone.now()
+    with connection.cursor() as cur:
+        if dry_run:
+            cur.execute(
+                "SELECT count(*) FROM public.pagos_intentos WHERE estado = ANY(%s) AND expires_at < %s",
+                [list(ESTADOS_INTENTO_ACTIVOS), ahora],
+            )
+            return cur.fetchone()[0]
+
+        total = 0
+        while True:
+            cur.execute(
+                """
+                UPDATE public.pagos_intentos i
+                   SET estado = 'EXPIRO', actualizado_en = now()
+                 WHERE i.id IN (
+                        SELECT id FROM public.pagos_intentos
+                         WHERE estado = ANY(%s) AND expires_at < %s
+                         ORDER BY expires_at
+                         LIMIT %s
+                         FOR UPDATE SKIP LOCKED)
+                """,
+                [list(ESTADOS_INTENTO_ACTIVOS), ahora, lote],
+            )
+            total += cur.rowcount
+            if cur.rowcount < lote:
+                return total
@@ -1,3 +1,349 @@
-from django.test import TestCase
+import threading
+from collections import Counter
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import transiciones, webhooks
+from .bnb_poller import aplicar_resultados
+from .management.bench import crear_datos_bench
+from .models import Cargo, Documento, Pago, PagoDetalle, PagoIntento, WebhookEvento
+from .reportes import resumen
+from .views import PagoViewSet
+from .webhooks import procesar_pago, registrar_evento
+
+# Las pruebas necesitan PostgreSQL: triggers, funciones y tablas de las migraciones RunSQL.
+
+# Envuelve recalc_estado_cargos para anotar cada cargo que recibe (DDL dentro
+# de la transacción del TestCase: se revierte al terminar)
+SQL_ESPIAR_RECALC = r"""
+CREATE TEMP TABLE recalc_log (cargo_id bigint) ON COMMIT DROP;
+ALTER FUNCTION public.recalc_estado_cargos(bigint[]) RENAME TO recalc_estado_cargos_real;
+CREATE FUNCTION public.recalc_estado_cargos(_cargo_ids bigint[])
+RETURNS integer LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO recalc_log SELECT unnest(_cargo_ids);
+  RETURN public.recalc_estado_cargos_real(_cargo_ids);
+END;
+$$;
+"""
+
+
+def en_hilos(n, funcion):
+    """Corre funcion(i) para i en range(n), todos a la vez, cada hilo con su conexión. Devuelve las excepciones."""
+    barrera = threading.Barrier(n)
+    errores = []
+
+    def correr(i):
+        try:
+            barrera.wait(timeout=30)
+            funcion(i)
+        except Exception as e:
+            errores.append(e)
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return errores
+
+
+class ConcurrenciaTestCase(TransactionTestCase):
+    """
+    Base para pruebas con varios hilos (cada uno confirma en su conexión).
+    estado_cuenta referencia a cargos y el flush de Django no la conoce
+    (managed=False): se vacía antes, junto con el rollup.
+    """
+
+    def tearDown(self):
+        with connection.cursor() as cur:
+            cur.execute(
+                "TRUNCATE public.estado_cuenta, public.resumen_finanzas, public.resumen_finanzas_pendientes"
+            )
+        super().tearDown()
+
+
+@override_settings(FINANZAS_PDF_PRERENDER=False)
+class AnulacionLoteTests(TestCase):
+    """transicionar_pagos(..., "ANULADO"): un UPDATE de detalles y un recálculo por cargo distinto."""
+
+    def setUp(self):
+        datos = crear_datos_bench(n_unidades=4, n_periodos=3)
+        self.cargos = list(
+            Cargo.objects.filter(unidad__condominio=datos["condominio"]).order_by("id").values_list("id", flat=True)
+        )
+        # Seis pagos de tres cargos cada uno, solapados: pago i -> cargos i, i+1, i+2
+        self.lista = Pago.objects.bulk_create([
+            Pago(monto=Decimal("3.00"), medio="EFECTIVO", estado="APROBADO") for _ in range(6)
+        ])
+        PagoDetalle.objects.bulk_create([
+            PagoDetalle(pago=p, cargo_id=self.cargos[i + k], monto_aplicado=Decimal("1.00"))
+            for i, p in enumerate(self.lista) for k in range(3)
+        ])
+
+    def test_un_update_y_un_recalculo_por_cargo(self):
+        anular = [p.id for p in self.lista[:4]]
+        distintos = set(self.cargos[:6])
+        with connection.cursor() as cur:
+            cur.execute(SQL_ESPIAR_RECALC)
+
+        conteo = Counter()
+        with CaptureQueriesContext(connection) as q:
+            cambiados = transiciones.transicionar_pagos(anular, "ANULADO", conteo=conteo)
+
+        self.assertEqual(sorted(p[0] for p in cambiados), anular)
+        sqls = [c["sql"].lstrip().upper() for c in q.captured_queries]
+        self.assertEqual(sum(1 for s in sqls if s.startswith("UPDATE PUBLIC.PAGOS_DETALLE")), 1)
+        # el recálculo lo hace el trigger por sentencia, no una llamada desde Python
+        self.assertFalse([s for s in sqls if "RECALC_ESTADO_CARGOS" in s])
+        with connection.cursor() as cur:
+            cur.execute("SELECT cargo_id, count(*) FROM recalc_log GROUP BY cargo_id")
+            recalculados = dict(cur.fetchall())
+        self.assertEqual(recalculados, {c: 1 for c in distintos})
+        self.assertEqual(conteo, Counter(pagos=4, detalles_anulados=12, cargos_recalculados=len(distintos)))
+
+        # cargos 0-3 solo los pagaban pagos anulados; 4 y 5 siguen con pagos vigentes
+        estados = dict(Cargo.objects.filter(id__in=distintos).values_list("id", "estado"))
+        self.assertEqual([estados[c] for c in self.cargos[:6]], ["PENDIENTE"] * 4 + ["PARCIAL"] * 2)
+
+        # repetir la anulación no toca nada
+        with CaptureQueriesContext(connection) as q:
+            self.assertEqual(transiciones.transicionar_pagos(anular, "ANULADO"), [])
+        self.assertFalse([c for c in q.captured_queries if "pagos_detalle" in c["sql"]])
+
+
+@override_settings(FINANZAS_PDF_PRERENDER=False)
+class RegistrarConcurrenteTests(ConcurrenciaTestCase):
+    """Muchos cajeros a la vez en pagos/registrar/: ningún número de recibo se repite."""
+
+    hilos = 8
+    por_hilo = 10
+
+    def registrar_en_hilos(self):
+        total = self.hilos * self.por_hilo
+        datos = crear_datos_bench(n_unidades=total)
+        cargo_ids = list(
+            Cargo.objects.filter(unidad__condominio=datos["condominio"]).order_by("id").values_list("id", flat=True)
+        )
+        vista = PagoViewSet.as_view({"post": "registrar"})
+        factory, usuario = APIRequestFactory(), User(username="test")
+        respuestas, lock = Counter(), threading.Lock()
+
+        def trabajar(n):
+            for cid in cargo_ids[n * self.por_hilo:(n + 1) * self.por_hilo]:
+                req = factory.post("/api/finanzas/pagos/registrar/", {
+                    "unidad_id": 0, "medio": "EFECTIVO", "detalles": [{"cargo": cid, "monto_aplicado": "1.00"}],
+                }, format="json")
+                force_authenticate(req, user=usuario)
+                resp = vista(req)
+                with lock:
+                    respuestas[resp.status_code] += 1
+
+        self.assertEqual(en_hilos(self.hilos, trabajar), [])
+        self.assertEqual(respuestas, Counter({201: total}))
+        numeros = list(Documento.objects.filter(condominio=datos["condominio"]).values_list("numero", flat=True))
+        self.assertEqual(len(numeros), total)
+        self.assertEqual([n for n, c in Counter(numeros).items() if c > 1], [])
+        return numeros
+
+    def test_numeros_sin_duplicados_ni_huecos(self):
+        secuencias = sorted(int(n.rsplit("-", 1)[-1]) for n in self.registrar_en_hilos())
+        self.assertEqual(secuencias, list(range(secuencias[0], secuencias[0] + len(secuencias))))
+
+    @override_settings(FINANZAS_NUMERO_BLOQUE=7)
+    def test_numeros_por_bloques_sin_duplicados(self):
+        self.registrar_en_hilos()
+
+
+@override_settings(FINANZAS_PDF_PRERENDER=False, FINANZAS_WEBHOOKS_EN_PROCESO=False)
+class TransicionesCarreraTests(ConcurrenciaTestCase):
+    """
+    Por cada pago PENDIENTE compiten a la vez el webhook, el poller BNB y el
+    cajero (y en una variante una anulación): una sola transición efectiva,
+    con un recibo y un recálculo de cargos como máximo.
+    """
+
+    pagos = 20
+
+    def setUp(self):
+        datos = crear_datos_bench(n_unidades=self.pagos)
+        condominio = datos["condominio"]
+        cargos = list(Cargo.objects.filter(unidad__condominio=condominio).order_by("id"))
+        documentos = Documento.objects.bulk_create([
+            Documento(numero=f"RACE-{i:06d}", total=Decimal("1.00"), tipo="RECIBO", condominio=condominio)
+            for i in range(self.pagos)
+        ])
+        self.lista = Pago.objects.bulk_create([
+            Pago(documento=d, monto=Decimal("1.00"), medio="QR", estado="PENDIENTE", pasarela="BNB")
+            for d in documentos
+        ])
+        PagoDetalle.objects.bulk_create([
+            PagoDetalle(pago=p, cargo=c, monto_aplicado=Decimal("1.00")) for p, c in zip(self.lista, cargos)
+        ])
+        self.intentos = [i.id for i in PagoIntento.objects.bulk_create([
+            PagoIntento(pago=p, unidad_id=c.unidad_id, total=Decimal("1.00"), medio="QR", pasarela="BNB",
+                        estado="EN_PROCESO", bnb_qr_id=f"race-{p.id}")
+            for p, c in zip(self.lista, cargos)
+        ])]
+        self.cargo_de = {p.id: c.id for p, c in zip(self.lista, cargos)}
+        self.factory, self.usuario = APIRequestFactory(), User(username="test")
+
+    def webhook(self, pago, intento_id):
+        registrar_evento("fake", f"race:{intento_id}", {"intento_id": intento_id, "status": "approved"},
+                         pago_id=pago.id, intento_id=intento_id)
+        procesar_pago(pago.id)
+
+    def poller(self, pago, intento_id):
+        intento = PagoIntento.objects.only("id", "pago_id", "estado", "bnb_status_code").get(pk=intento_id)
+        aplicar_resultados([(intento, {"statusQRCode": 2})])
+
+    def cajero(self, pago, intento_id, accion="asentar"):
+        req = self.factory.patch(f"/api/finanzas/pagos/{pago.id}/{accion}/", {}, format="json")
+        force_authenticate(req, user=self.usuario)
+        resp = PagoViewSet.as_view({"patch": accion})(req, pk=pago.id)
+        self.assertLess(resp.status_code, 500)
+
+    def anulador(self, pago, intento_id):
+        self.cajero(pago, intento_id, accion="anular")
+
+    def carrera(self, roles):
+        """Corre los roles en hilos sobre cada pago; devuelve (recibos, recálculos por cargo)."""
+        recibos, recalculos, lock = Counter(), Counter(), threading.Lock()
+        recalc_cargos = transiciones.recalc_cargos
+
+        def contar_recibo(documento_id):
+            with lock:
+                recibos[documento_id] += 1
+
+        def contar_recalculo(cargo_ids):
+            ids = list(cargo_ids)
+            with lock:
+                recalculos.update(ids)
+            return recalc_cargos(ids)
+
+        with mock.patch.object(transiciones, "programar_recibo", contar_recibo), \
+                mock.patch.object(transiciones, "recalc_cargos", contar_recalculo):
+            for pago, intento_id in zip(self.lista, self.intentos):
+                errores = en_hilos(len(roles), lambda i: roles[i](pago, intento_id))
+                self.assertEqual(errores, [], f"pago {pago.id}")
+        return recibos, recalculos
+
+    def test_webhook_poller_y_cajero_aprueban_una_vez(self):
+        recibos, recalculos = self.carrera([self.webhook, self.poller, self.cajero])
+
+        ids = [p.id for p in self.lista]
+        self.assertEqual(
+            Counter(Pago.objects.filter(id__in=ids).values_list("estado", flat=True)), Counter({"APROBADO": self.pagos})
+        )
+        self.assertEqual(recibos, Counter({p.documento_id: 1 for p in self.lista}))
+        self.assertEqual(recalculos, Counter(self.cargo_de.values()))
+        self.assertEqual(
+            set(PagoIntento.objects.filter(id__in=self.intentos).values_list("estado", flat=True)), {"APROBADO"}
+        )
+
+    def test_anulacion_en_carrera(self):
+        recibos, recalculos = self.carrera([self.webhook, self.poller, self.cajero, self.anulador])
+
+        estados = dict(Pago.objects.filter(id__in=self.cargo_de).values_list("id", "estado"))
+        self.assertEqual(set(estados.values()) - {"APROBADO", "ANULADO"}, set())
+        self.assertEqual([d for d, n in recibos.items() if n > 1], [])
+        self.assertEqual([c for c, n in recalculos.items() if n > 1], [])
+        cargos = dict(Cargo.objects.filter(id__in=self.cargo_de.values()).values_list("id", "estado"))
+        pagados = dict(PagoDetalle.objects.filter(pago_id__in=estados).values_list("pago_id", "monto_aplicado"))
+        for pago in self.lista:
+            if estados[pago.id] == "ANULADO":
+                # detalle en cero y el trigger de pagos_detalle devolvió el cargo a PENDIENTE
+                self.assertEqual(pagados[pago.id], Decimal("0.00"))
+                self.assertEqual(cargos[self.cargo_de[pago.id]], "PENDIENTE")
+            else:
+                self.assertEqual(recibos[pago.documento_id], 1)
+                self.assertEqual(cargos[self.cargo_de[pago.id]], "PARCIAL")
+
+
+@override_settings(FINANZAS_WEBHOOKS_EN_PROCESO=False)
+class WebhooksPorPagoTests(ConcurrenciaTestCase):
+    """Un evento que llega mientras otro procesador tiene el pago no queda esperando al barrido."""
+
+    def test_evento_llegado_durante_la_tanda(self):
+        pago = Pago.objects.create(monto=Decimal("1.00"), medio="QR", estado="PENDIENTE")
+        dentro, soltar = threading.Event(), threading.Event()
+
+        def lento(evento):
+            if evento.evento_id == "e1":
+                dentro.set()
+                soltar.wait(timeout=30)
+            return "PROCESADO"
+
+        resultado = {}
+
+        def primero():
+            try:
+                resultado["e1"] = procesar_pago(pago.id)
+            finally:
+                connection.close()
+
+        with mock.patch.dict(webhooks.PROCESADORES, {"lento": lento}):
+            registrar_evento("lento", "e1", {}, pago_id=pago.id)
+            hilo = threading.Thread(target=primero)
+            hilo.start()
+            self.assertTrue(dentro.wait(timeout=30))
+            # e2 se confirma con e1 en curso: su procesador no toma el lock...
+            registrar_evento("lento", "e2", {}, pago_id=pago.id)
+            self.assertEqual(procesar_pago(pago.id), (0, 0))
+            soltar.set()
+            hilo.join()
+
+        # ...y lo atiende el que lo tenía, al releer antes de soltarlo
+        self.assertEqual(resultado["e1"], (2, 0))
+        self.assertEqual(
+            dict(WebhookEvento.objects.filter(pago=pago).values_list("evento_id", "estado")),
+            {"e1": "PROCESADO", "e2": "PROCESADO"},
+        )
+
+
+class ResumenLecturaTests(ConcurrenciaTestCase):
+    """reportes/resumen/ no hace fila detrás de otro refresco del rollup."""
+
+    def pendientes(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT count(*) FROM public.resumen_finanzas_pendientes")
+            return cur.fetchone()[0]
+
+    def test_no_espera_al_refresco_en_curso(self):
+        condominio_id = crear_datos_bench(n_unidades=3, n_periodos=2)["condominio"].id
+        self.assertGreater(self.pendientes(), 0)
+        tomado, soltar = threading.Event(), threading.Event()
+
+        def refresco_en_curso():
+            try:
+                with transaction.atomic(), connection.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext('public.resumen_finanzas'))")
+                    tomado.set()
+                    soltar.wait(timeout=30)
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=refresco_en_curso)
+        hilo.start()
+        try:
+            self.assertTrue(tomado.wait(timeout=30))
+            with transaction.atomic():
+                with connection.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = '5s'")
+                resumen(condominio_id=condominio_id)
+            self.assertGreater(self.pendientes(), 0)
+        finally:
+            soltar.set()
+            hilo.join()
+
+        res = resumen(condominio_id=condominio_id)
+        self.assertEqual(self.pendientes(), 0)
+        self.assertEqual(res["totales"]["cargos"], 6)
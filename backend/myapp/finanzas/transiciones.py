@@ -0,0 +1,132 @@
+# myapp/finanzas/transiciones.py
+"""
+Transiciones de estado de Pago y PagoIntento con UPDATE condicional.
+
+Cada transición es un UPDATE ... WHERE estado = ANY(<orígenes válidos>)
+RETURNING, sin leer antes el estado en Python. Si cajero, webhook y poller
+compiten por el mismo pago, el FOR UPDATE (en orden de id) hace esperar a
+los demás hasta el commit del primero y, al re-evaluar el WHERE, solo el
+primero vio la fila devuelta: ese es el único que ejecuta los efectos
+(detalles en cero, recálculo de cargos, recibo). Los demás ven 0 filas y
+siguen, sin repetir trabajo. Ver TransicionesCarreraTests en tests.py.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+
+from .models import PagoDetalle
+from .recibos import programar_recibo
+from .services import recalc_cargos
+
+# destino -> estados desde los que se puede llegar
+ORIGENES_PAGO = {
+    "APROBADO": ("PENDIENTE", "RECHAZADO"),
+    "RECHAZADO": ("PENDIENTE",),
+    "ANULADO": ("PENDIENTE", "APROBADO", "RECHAZADO"),
+}
+ORIGENES_INTENTO = {
+    "EN_PROCESO": ("CREADO",),
+    # EXPIRO -> APROBADO: el banco cobró un QR que el barrido ya había vencido
+    "APROBADO": ("CREADO", "EN_PROCESO", "EXPIRO"),
+    "RECHAZADO": ("CREADO", "EN_PROCESO"),
+    "FALLIDO": ("CREADO", "EN_PROCESO"),
+    "EXPIRO": ("CREADO", "EN_PROCESO"),
+}
+
+
+def _ids(valores):
+    return sorted({int(v) for v in valores if v})
+
+
+def transicionar_pagos(pago_ids, destino, conteo=None, recibos=True):
+    """
+    Pasa a 'destino' los pagos que estén en un estado de origen válido y
+    aplica los efectos solo a esos:
+    - ANULADO: un UPDATE de sus detalles a cero; el trigger por sentencia de
+      pagos_detalle (0007) recalcula una vez los cargos distintos afectados;
+    - APROBADO: un recalc_cargos de sus cargos y el recibo programado al commit.
+    Las filas se bloquean en orden de id, así dos lotes que se solapan no se
+    bloquean mutuamente. 'conteo' (Counter opcional) suma pagos, detalles
+    anulados y cargos recalculados. Con recibos=False no se programa el
+    render (importaciones masivas: el recibo se genera al descargarlo).
+    Devuelve [(pago_id, documento_id)] de los pagos que cambiaron.
+    """
+    if destino not in ORIGENES_PAGO:
+        raise ValueError(f"Estado de pago inválido: {destino}")
+    ids = _ids(pago_ids)
+    if not ids:
+        return []
+    conteo = Counter() if conteo is None else conteo
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                WITH objetivo AS (
+                    SELECT id FROM public.pagos
+                     WHERE id = ANY(%s) AND estado = ANY(%s)
+                     ORDER BY id
+                       FOR UPDATE
+                )
+                UPDATE public.pagos p SET estado = %s
+                  FROM objetivo o
+                 WHERE p.id = o.id
+                RETURNING p.id, p.documento_id
+                """,
+                [ids, list(ORIGENES_PAGO[destino]), destino],
+            )
+            cambiados = cur.fetchall()
+            if not cambiados:
+                return []
+            cambiados_ids = [p[0] for p in cambiados]
+            conteo["pagos"] += len(cambiados)
+
+            if destino == "ANULADO":
+                cur.execute(
+                    """
+                    UPDATE public.pagos_detalle SET monto_aplicado = 0
+                     WHERE pago_id = ANY(%s) AND monto_aplicado <> 0
+                    RETURNING cargo_id
+                    """,
+                    [cambiados_ids],
+                )
+                cargos = {r[0] for r in cur.fetchall()}
+                conteo["detalles_anulados"] += cur.rowcount
+                # el trigger recalcula una vez cada cargo cuyo detalle cambió: justo estos
+                # (AnulacionLoteTests lo verifica espiando recalc_estado_cargos)
+                conteo["cargos_recalculados"] += len(cargos)
+
+        if destino == "APROBADO":
+            cargos = set(PagoDetalle.objects.filter(pago_id__in=cambiados_ids).values_list("cargo_id", flat=True))
+            conteo["cargos_recalculados"] += len(cargos)
+            recalc_cargos(cargos)
+            for _, documento_id in cambiados if recibos else ():
+                programar_recibo(documento_id)
+    return cambiados
+
+
+def transicionar_pago(pago, destino):
+    """Una transición sobre una instancia; True si la ganó (y refleja el estado en 'pago')."""
+    if transicionar_pagos([pago.pk], destino):
+        pago.estado = destino
+        return True
+    pago.refresh_from_db(fields=["estado"])
+    return False
+
+
+def transicionar_intentos(intento_ids, destino):
+    """Pasa a 'destino' los intentos en un estado de origen válido; devuelve los ids que cambiaron."""
+    if destino not in ORIGENES_INTENTO:
+        raise ValueError(f"Estado de intento inválido: {destino}")
+    ids = _ids(intento_ids)
+    if not ids:
+        return []
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.pagos_intentos SET estado = %s, actualizado_en = now()
+             WHERE id = ANY(%s) AND estado = ANY(%s)
+            RETURNING id
+            """,
+            [destino, ids, list(ORIGENES_INTENTO[destino])],
+        )
+        return [r[0] for r in cur.fetchall()]
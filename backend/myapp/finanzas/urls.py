@@ -3,8 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ConceptoViewSet, CargoViewSet, DocumentoViewSet, PagoViewSet,
     PagoDetalleViewSet, DocumentoArchivoViewSet, PagoIntentoViewSet,
-    ReembolsoViewSet, EstadoCuentaUnidadViewSet,
-    fake_checkout, fake_webhook,
+    ReembolsoViewSet, EstadoCuentaUnidadViewSet, ReportesViewSet,
+    fake_checkout, fake_webhook, intento_eventos, intento_esperar,
 )
 
 router = DefaultRouter()
@@ -18,6 +18,7 @@ router.register(r"documentos-archivos", DocumentoArchivoViewSet,   basename="doc
 router.register(r"pagointentos",        PagoIntentoViewSet,        basename="pagointentos")
 router.register(r"reembolsos",          ReembolsoViewSet,          basename="reembolsos")
 router.register(r"estados",             EstadoCuentaUnidadViewSet, basename="estados")
+router.register(r"reportes",            ReportesViewSet,           basename="reportes")
 
 urlpatterns = [
     # Todas las rutas generadas por el router
@@ -38,6 +39,10 @@ urlpatterns = [
         name="estado-cuenta-unidad",
     ),
 
+    # Estado del intento sin polling (SSE / long-poll; servir con ASGI)
+    path("pagointentos/<int:intento_id>/eventos/", intento_eventos, name="pagointento-eventos"),
+    path("pagointentos/<int:intento_id>/esperar/", intento_esperar, name="pagointento-esperar"),
+
     # Pasarela FAKE de demo
     path("pasarelas/fake/checkout/<int:intento_id>/", fake_checkout),
     path("pasarelas/fake/webhook/", fake_webhook),
@@ -1,28 +1,33 @@
 # myapp/finanzas/views.py
 import base64
+import csv
 from decimal import Decimal
-from io import BytesIO
-import os
 import json
 import hmac
 import hashlib
+from collections import Counter
 from datetime import timedelta
 
 from django.conf import settings
-from django.db import transaction, connection, IntegrityError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction, IntegrityError
+from django.db.models import CharField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils.dateparse import parse_date
 from django.utils import timezone
-from django.http import FileResponse, Http404, HttpResponse
-from django.template.loader import render_to_string
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.safestring import mark_safe
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 
 from rest_framework import status
 import logging
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, ViewSet
 
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -33,9 +38,29 @@ from .models import (
 from .serializers import (
     ConceptoSerializer, CargoSerializer, DocumentoSerializer,
     PagoSerializer, PagoDetalleSerializer, DocumentoArchivoSerializer,
-    PagoIntentoSerializer, ReembolsoSerializer, EstadoCuentaUnidadSerializer,
-    PagoRegistrarSerializer
+    PagoIntentoSerializer, PagoIntentoListaSerializer, ReembolsoSerializer, EstadoCuentaUnidadSerializer,
+    PagoRegistrarSerializer, PagoAsignarSerializer, PagoAnularLoteSerializer, PagoConciliarSerializer, CargoGenerarPeriodoSerializer,
+    ReporteResumenSerializer, ReporteMorosidadSerializer,
 )
+from .asignacion import AsignacionError, asignar_pagos
+from .bnb import BNBClient, BNBClientError
+from .bnb_poller import aplicar_resultados
+from .conciliacion import Conciliador, leer_extracto
+from .descargas import servir_archivo, servir_local, servir_remoto
+from .eventos import Espera, es_final, esperar_cambio, flujo_sse
+from . import intento_blobs
+from .qr import (
+    FORMATOS as QR_FORMATOS, cache_control_hasta, expiracion_intento,
+    imagen_desde_b64, imagen_desde_texto, texto_qr_intento,
+)
+from .recibos import filtro_recibo, obtener_recibo, programar_recibo, render_recibo_pdf_bytes  # noqa: F401
+from .reportes import COLUMNAS_MOROSIDAD, morosidad, morosidad_unidades, resumen as resumen_finanzas
+from .services import (
+    generar_cargos_periodo,
+    siguiente_numero_documento, numeracion_por_bloques, vencimiento_qr_bnb,
+)
+from .transiciones import transicionar_intentos, transicionar_pago, transicionar_pagos
+from .webhooks import programar_procesamiento, registrar_evento
 
 # PNG QR
 try:
@@ -71,80 +96,6 @@ def _qr_text_for_pago(pago, intento_id: int, expires_at):
     return f"SCONDO://PAY?d={s}&sig={sig}"
 
 
-# -------------------------------
-# Helpers PDF
-# -------------------------------
-def get_weasyprint_HTML():
-    """Importa HTML de WeasyPrint justo cuando se necesita."""
-    try:
-        from weasyprint import HTML  # noqa
-        return HTML
-    except Exception as e:
-        # No está disponible (Windows sin GTK) -> lo reportamos hacia el fallback
-        raise RuntimeError(f"WeasyPrint no disponible: {e}")
-
-
-def render_recibo_pdf_bytes(request, contexto):
-    """
-    Intenta generar PDF con WeasyPrint. Si falla, usa ReportLab. Retorna bytes.
-    """
-    # 1) WeasyPrint (si está instalado correctamente)
-    try:
-        HTML = get_weasyprint_HTML()  # noqa: N806
-        html_str = render_to_string("finanzas/recibo.html", contexto)
-        base_url = request.build_absolute_uri("/")
-        return HTML(string=html_str, base_url=base_url).write_pdf()
-    except Exception:
-        # 2) Fallback con ReportLab (puro Python)
-        try:
-            import importlib
-            pagesizes = importlib.import_module("reportlab.lib.pagesizes")
-            canvas_module = importlib.import_module("reportlab.pdfgen.canvas")
-            units = importlib.import_module("reportlab.lib.units")
-            A4 = getattr(pagesizes, "A4")
-            canvas = canvas_module
-            mm = getattr(units, "mm")
-        except Exception as e:
-            raise RuntimeError(f"No se pudo generar PDF (WeasyPrint/ReportLab): {e}")
-        buff = BytesIO()
-        c = canvas.Canvas(buff, pagesize=A4)
-        w, h = A4
-
-        # Encabezado simple
-        c.setFont("Helvetica-Bold", 14)
-        numero = contexto["documento"].numero or f"ID {contexto['documento'].id}"
-        c.drawString(20*mm, (h-20*mm), f"RECIBO {numero}")
-
-        c.setFont("Helvetica", 10)
-        c.drawString(20*mm, (h-28*mm), f"Fecha: {timezone.localtime(contexto['hoy']).strftime('%Y-%m-%d %H:%M')}")
-        c.drawString(20*mm, (h-34*mm), f"Moneda: {contexto['documento'].moneda}")
-        if contexto.get("unidad"):
-            c.drawString(20*mm, (h-40*mm), f"Unidad: {contexto['unidad']}")
-
-        y = h - 55*mm
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Detalle")
-        y -= 6*mm
-        c.setFont("Helvetica", 10)
-
-        for d in contexto["detalles"]:
-            linea = f"- {d.cargo.concepto} ({getattr(d.cargo, 'periodo', '')}): {d.monto_aplicado}"
-            c.drawString(20*mm, y, linea)
-            y -= 6*mm
-            if y < 25*mm:
-                c.showPage()
-                y = h - 20*mm
-                c.setFont("Helvetica", 10)
-
-        y -= 4*mm
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(20*mm, y, f"TOTAL: {contexto['documento'].total}")
-
-        c.showPage()
-        c.save()
-        return buff.getvalue()
-
-
 # -------------------------------
 # ViewSets
 # -------------------------------
@@ -199,6 +150,33 @@ class CargoViewSet(ModelViewSet):
                 pass
             return Response({"errors": {"non_field_errors": ["Ya existe un cargo para la misma unidad/concepto/periodo (constraint)."] , "detail": msg}}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=["post"], url_path="generar_periodo")
+    def generar_periodo(self, request):
+        """
+        Crea los cargos de un periodo para todas las unidades de un condominio en un solo INSERT.
+        Body: { condominio, concepto, periodo, monto, regla?: 'fija'|'area_m2', vencimiento? }
+        Respuesta: { unidades, creados, omitidos, sin_monto }
+        """
+        serializer = CargoGenerarPeriodoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        with transaction.atomic():
+            resultado = generar_cargos_periodo(
+                condominio_id=data["condominio"].id,
+                concepto_id=data["concepto"].id,
+                periodo=data["periodo"],
+                monto=data["monto"],
+                regla=data["regla"],
+                vencimiento=data.get("vencimiento"),
+            )
+        self._logger.info(
+            "Cargos generados condominio=%s concepto=%s periodo=%s: %s",
+            data["condominio"].id, data["concepto"].id, data["periodo"], resultado,
+        )
+        code = status.HTTP_201_CREATED if resultado["creados"] else status.HTTP_200_OK
+        return Response(resultado, status=code)
+
 
 class DocumentoViewSet(ModelViewSet):
     queryset = Documento.objects.all()
@@ -206,84 +184,80 @@ class DocumentoViewSet(ModelViewSet):
 
     @action(detail=True, methods=["get"], url_path="descargar")
     def descargar(self, request, pk=None):
-        """Devuelve el PDF del documento. Si no existe en base, lo genera y lo guarda."""
+        """
+        Devuelve el archivo cargado para el documento o, si no hay, el PDF del
+        recibo desde la caché por contenido (lo genera si falta).
+        ETag = huella del contenido; responde 304 con If-None-Match/If-Modified-Since,
+        206 con Range y, según FINANZAS_DESCARGA_OFFLOAD, delega el envío al servidor web.
+        """
         try:
-            doc = self.get_queryset().get(pk=pk)
+            doc = self.get_queryset().select_related("condominio").get(pk=pk)
         except Documento.DoesNotExist:
             raise Http404("Documento no existe")
 
-        # Si ya hay archivo, devolverlo (FileField o url en DB)
-        existente = DocumentoArchivo.objects.filter(documento=doc).first()
-        if existente:
-            archivo_field = getattr(existente, "archivo", None)
-            if archivo_field:
-                return FileResponse(
-                    archivo_field.open("rb"),
-                    as_attachment=True,
-                    filename=archivo_field.name.rsplit("/", 1)[-1],
-                )
-            if existente.url:
-                url = existente.url
-                if url.startswith("http://") or url.startswith("https://"):
-                    try:
-                        import requests
-                        r = requests.get(url); r.raise_for_status()
-                        return FileResponse(BytesIO(r.content), as_attachment=True, filename=url.rsplit("/", 1)[-1])
-                    except Exception as e:
-                        return Response({"detail": f"No se pudo descargar recurso remoto: {e}"}, status=500)
-                fullpath = os.path.join(getattr(settings, "MEDIA_ROOT", ""), url)
-                if os.path.exists(fullpath):
-                    return FileResponse(open(fullpath, "rb"), as_attachment=True, filename=os.path.basename(fullpath))
-                # si no existe el archivo local, continuamos a regenerar
-
-        detalles = (
-            PagoDetalle.objects
-            .select_related("pago", "cargo__unidad", "cargo__concepto")
-            .filter(pago__documento=doc)
-            .order_by("cargo_id")
+        # Archivo cargado a mano (no el recibo cacheado): remoto por proxy con copia
+        # local, local tal cual; si el local ya no está en disco se sirve el recibo
+        existente = (
+            DocumentoArchivo.objects.filter(documento=doc).exclude(filtro_recibo()).order_by("id").first()
         )
-        unidad = detalles[0].cargo.unidad if detalles else None
-
-        contexto = {
-            "documento": doc,
-            "detalles": list(detalles),
-            "unidad": unidad,
-            "hoy": timezone.now(),
-            "SITE_NAME": getattr(settings, "SITE_NAME", "Condominio"),
-        }
+        if existente and existente.url.startswith("http"):
+            url = existente.url
+            try:
+                return servir_remoto(request, url, url.rsplit("/", 1)[-1].split("?", 1)[0] or f"documento_{doc.id}")
+            except Exception as e:
+                return Response({"detail": f"No se pudo descargar recurso remoto: {e}"}, status=500)
+        if existente:
+            resp = servir_local(request, existente.url)
+            if resp is not None:
+                return resp
 
-        pdf_bytes = render_recibo_pdf_bytes(request, contexto)
+        filepath, huella = obtener_recibo(doc, request)
+        return servir_archivo(request, filepath, f"recibo_{doc.numero or doc.id}.pdf", etag=quote_etag(huella))
 
-        media_root = getattr(settings, "MEDIA_ROOT", None)
-        if not media_root:
-            raise RuntimeError("MEDIA_ROOT no está configurado en settings; no se puede guardar el PDF")
-        documentos_dir = os.path.join(media_root, "documentos")
-        os.makedirs(documentos_dir, exist_ok=True)
-        filename = f"recibo_{doc.id}.pdf"
-        filepath = os.path.join(documentos_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(pdf_bytes)
 
-        with transaction.atomic():
-            DocumentoArchivo.objects.create(documento=doc, url=os.path.join("documentos", filename), tipo="PDF")
-
-        return FileResponse(open(filepath, "rb"), as_attachment=True, filename=filename)
+class PagoCursorPagination(CursorPagination):
+    """Paginación keyset por (-fecha, -id): las páginas profundas no pagan OFFSET."""
+    ordering = ("-fecha", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 200
 
 
 class PagoViewSet(ModelViewSet):
     """
-    Lista y gestiona pagos. Prefetch de detalles->cargo->unidad para
-    que el serializer/JSON pueda mostrar 'unidad' sin N+1 queries.
+    Lista y gestiona pagos. La etiqueta de 'unidad' sale de una subconsulta
+    anotada (primer detalle -> cargo -> unidad), que Postgres evalúa solo
+    sobre las filas de la página ya ordenada y limitada.
+    Con ?paginacion=cursor (o ?cursor=...) usa paginación keyset.
     """
     serializer_class = PagoSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = {"estado": ["exact"], "medio": ["exact"]}
 
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            params = getattr(self.request, "query_params", {})
+            if params.get("paginacion") == "cursor" or params.get("cursor"):
+                self._paginator = PagoCursorPagination()
+        return super().paginator
+
     def get_queryset(self):
+        primera_unidad = (
+            PagoDetalle.objects
+            .filter(pago_id=OuterRef("pk"))
+            .order_by("id")
+            # Mismo criterio que get_unidad/registrar: codigo (si no está vacío), si no el id
+            .annotate(label=Coalesce(
+                NullIf("cargo__unidad__codigo", Value("")),
+                Cast("cargo__unidad_id", CharField()),
+            ))
+            .values("label")[:1]
+        )
         qs = (
             Pago.objects.all()
+            .annotate(unidad_label=Subquery(primera_unidad))
             .order_by("-fecha", "-id")
-            .prefetch_related("pagodetalle_set__cargo__unidad")
         )
         params = self.request.query_params
         condominio = params.get("condominio")
@@ -291,10 +265,13 @@ class PagoViewSet(ModelViewSet):
         desde = params.get("desde")
         hasta = params.get("hasta")
 
+        # Filtros por detalle como semi-join (sin JOIN que duplique pagos)
         if condominio:
-            qs = qs.filter(pagodetalle__cargo__unidad__condominio_id=condominio)
+            qs = qs.filter(id__in=PagoDetalle.objects.filter(
+                cargo__unidad__condominio_id=condominio).values("pago_id"))
         if unidad:
-            qs = qs.filter(pagodetalle__cargo__unidad_id=unidad)
+            qs = qs.filter(id__in=PagoDetalle.objects.filter(
+                cargo__unidad_id=unidad).values("pago_id"))
         if desde:
             d = parse_date(desde)
             if d:
@@ -303,11 +280,6 @@ class PagoViewSet(ModelViewSet):
             h = parse_date(hasta)
             if h:
                 qs = qs.filter(fecha__date__lte=h)
-
-        # Adjuntamos primer_detalle (ya prefetcheado) para mostrar unidad en el front
-        for p in qs:
-            dets = list(p.pagodetalle_set.all())
-            p.primer_detalle = dets[0] if dets else None
         return qs
 
     def get_serializer_class(self):
@@ -322,20 +294,31 @@ class PagoViewSet(ModelViewSet):
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
+        detalles = data["detalles"]
+        # Totales en memoria: pago y documento se insertan ya con su monto final
+        total = sum((det["monto_aplicado"] for det in detalles), Decimal("0.00"))
+        # validate() trajo los cargos con unidad__condominio en una sola consulta
+        unidad = detalles[0]["cargo"].unidad
+
+        condominio = None
+        numero = data.get("numero_documento") or None
+        if data.get("generar_documento", True):
+            condominio = unidad.condominio
+            if not numero and numeracion_por_bloques():
+                # por bloques el rango se reserva fuera de la transacción del pago
+                numero = self._siguiente_numero_documento(condominio_id=condominio.id, prefijo="R")
+
         with transaction.atomic():
             # Documento (opcional)
             documento = None
-            if data.get("generar_documento", True):
-                first_cargo = Cargo.objects.select_related("unidad__condominio").get(
-                    id=data["detalles"][0]["cargo"].id
-                )
-                condominio = first_cargo.unidad.condominio
-                numero = data.get("numero_documento") or self._siguiente_numero_documento(
+            if condominio is not None:
+                # contador por condominio/año/prefijo: sin huecos, bloqueado hasta el commit
+                numero = numero or self._siguiente_numero_documento(
                     condominio_id=condominio.id, prefijo="R"
                 )
                 documento = Documento.objects.create(
                     numero=numero,
-                    total=Decimal("0.00"),
+                    total=total,
                     tipo=data.get("tipo_documento", "RECIBO"),
                     moneda=data.get("moneda", "BOB"),
                     condominio=condominio,
@@ -347,84 +330,128 @@ class PagoViewSet(ModelViewSet):
             estado_inicial = "APROBADO" if medio == "EFECTIVO" else "PENDIENTE"
             pago = Pago.objects.create(
                 documento=documento,
-                monto=Decimal("0.00"),
+                monto=total,
                 medio=medio,
                 estado=estado_inicial,
             )
 
-            total = Decimal("0.00")
-            for det in data["detalles"]:
-                cargo = det["cargo"]
-                monto = det["monto_aplicado"]
-                PagoDetalle.objects.create(pago=pago, cargo=cargo, monto_aplicado=monto)
-                total += Decimal(monto)
-
-            # actualizar totales
-            pago.monto = total
-            pago.save(update_fields=["monto"])
-            if documento:
-                documento.total = total
-                documento.save(update_fields=["total"])
-
-            # si fue EFECTIVO, recalcular cargos de inmediato
+            # Un solo INSERT: el trigger por sentencia de pagos_detalle (0007)
+            # recalcula una vez los cargos distintos, no hace falta recalc aparte
+            PagoDetalle.objects.bulk_create([
+                PagoDetalle(pago=pago, cargo=det["cargo"], monto_aplicado=det["monto_aplicado"])
+                for det in detalles
+            ])
+
             if estado_inicial == "APROBADO":
-                cargo_ids = list(pago.pagodetalle_set.values_list("cargo_id", flat=True))
-                self._recalc_cargos(cargo_ids)
+                programar_recibo(pago.documento_id)
 
+            # Lo que PagoSerializer.get_unidad buscaría en el primer detalle
+            pago.unidad_label = getattr(unidad, "codigo", None) or getattr(unidad, "nombre", None) or unidad.id
             return Response(PagoSerializer(pago).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=["post"])
+    def asignar(self, request):
+        """
+        Crea pagos repartiendo cada monto FIFO entre los cargos con saldo de
+        la unidad (el más antiguo primero), sin que el cliente arme los detalles.
+        Body: { unidad_id, monto, medio } o { medio, pagos: [{unidad_id, monto, medio?}, ...] }
+        (+ moneda, generar_documento, tipo_documento; simular=true solo devuelve el reparto).
+        Respuesta: { pagos: [{pago, documento, unidad_id, unidad, monto, medio, estado, detalles}] }
+        """
+        serializer = PagoAsignarSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            pagos = asignar_pagos(
+                data["pagos"], data["medio"],
+                generar_documento=data["generar_documento"], tipo_documento=data["tipo_documento"],
+                moneda=data["moneda"], simular=data["simular"],
+            )
+        except AsignacionError as e:
+            return Response({"pagos": e.errores}, status=400)
+        return Response({"pagos": pagos}, status=status.HTTP_200_OK if data["simular"] else status.HTTP_201_CREATED)
+
     def _siguiente_numero_documento(self, condominio_id: int, prefijo: str = "R"):
-        from datetime import datetime
-        year = datetime.now().year
-        base = f"{prefijo}-{year}-"
-        last = (
-            Documento.objects.filter(condominio_id=condominio_id, numero__startswith=base)
-            .order_by("-numero")
-            .values_list("numero", flat=True)
-            .first()
-        )
-        if last:
-            try:
-                seq = int(last.split("-")[-1]) + 1
-            except Exception:
-                seq = 1
-        else:
-            seq = 1
-        return f"{base}{seq:06d}"
+        return siguiente_numero_documento(condominio_id, prefijo=prefijo)
 
     @action(detail=True, methods=["patch"])
     def asentar(self, request, pk=None):
         pago = self.get_object()
-        if pago.estado == "APROBADO":
-            return Response({"detail": "El pago ya está APROBADO."}, status=200)
-        pago.estado = "APROBADO"
-        pago.save(update_fields=["estado"])
-        cargo_ids = list(pago.pagodetalle_set.values_list("cargo_id", flat=True))
-        self._recalc_cargos(cargo_ids)
+        if not transicionar_pago(pago, "APROBADO"):
+            if pago.estado == "APROBADO":
+                return Response({"detail": "El pago ya está APROBADO."}, status=200)
+            return Response({"detail": f"No se puede aprobar un pago {pago.estado}."}, status=409)
         return Response(PagoSerializer(pago).data)
 
     @action(detail=True, methods=["patch"])
     def anular(self, request, pk=None):
         pago = self.get_object()
-        if pago.estado == "ANULADO":
+        if not transicionar_pago(pago, "ANULADO"):
             return Response({"detail": "El pago ya está ANULADO."}, status=200)
-        with transaction.atomic():
-            for pd in pago.pagodetalle_set.all():
-                if pd.monto_aplicado != 0:
-                    pd.monto_aplicado = Decimal("0.00")
-                    pd.save(update_fields=["monto_aplicado"])
-            pago.estado = "ANULADO"
-            pago.save(update_fields=["estado"])
-            cargo_ids = list(pago.pagodetalle_set.values_list("cargo_id", flat=True))
-            self._recalc_cargos(cargo_ids)
         return Response(PagoSerializer(pago).data)
 
-    def _recalc_cargos(self, cargo_ids):
-        if not cargo_ids:
-            return
-        with connection.cursor() as cur:
-            for cid in cargo_ids:
-                cur.execute("SELECT public.recalc_estado_cargo(%s)", [cid])
+    @action(detail=False, methods=["post"], url_path="anular_lote")
+    def anular_lote(self, request):
+        """
+        Anula muchos pagos en una transacción: un UPDATE de pagos, uno de sus
+        detalles y un recálculo por cargo distinto (trigger por sentencia).
+        Body: { pago_ids?: [...], ref_externas?: [...] }
+        Respuesta: { anulados, ya_anulados, no_encontrados, detalles_anulados, cargos_recalculados }
+        """
+        serializer = PagoAnularLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        filtro = Q(id__in=data.get("pago_ids") or [])
+        if data.get("ref_externas"):
+            filtro |= Q(ref_externa__in=data["ref_externas"])
+        encontrados = dict(self.get_queryset().filter(filtro).values_list("id", "estado"))
+
+        conteo = Counter()
+        with transaction.atomic():
+            anulados = transicionar_pagos(encontrados, "ANULADO", conteo=conteo)
+        anulados_ids = {p[0] for p in anulados}
+        return Response({
+            "anulados": sorted(anulados_ids),
+            "ya_anulados": sorted(i for i in encontrados if i not in anulados_ids),
+            "no_encontrados": sorted(set(data.get("pago_ids") or []) - set(encontrados)),
+            "detalles_anulados": conteo["detalles_anulados"],
+            "cargos_recalculados": conteo["cargos_recalculados"],
+        })
+
+    MAX_SIN_MATCH = 1000
+
+    @action(detail=False, methods=["post"], url_path="conciliar")
+    def conciliar(self, request):
+        """
+        Concilia un extracto bancario (multipart: archivo, condominio?,
+        ventana_dias?, aplicar?, formato?). El archivo se lee en streaming y
+        se aplica por lotes; con aplicar=false solo informa.
+        Respuesta: { stats, sin_match: [primeras líneas no conciliadas], truncado }
+        """
+        serializer = PagoConciliarSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        sin_match = []
+
+        def anotar(fila):
+            if len(sin_match) < self.MAX_SIN_MATCH:
+                sin_match.append(fila)
+
+        conciliador = Conciliador(
+            condominio_id=data.get("condominio"), ventana_dias=data["ventana_dias"],
+            aplicar=data["aplicar"], sin_match=anotar,
+        )
+        try:
+            stats = conciliador.procesar(leer_extracto(data["archivo"], data.get("formato")))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+        return Response({
+            "stats": stats,
+            "sin_match": sin_match,
+            "truncado": stats.get("sin_match", 0) > len(sin_match),
+        })
 
     # --------- QR ----------
     # --------- QR ----------
@@ -486,14 +513,8 @@ class PagoViewSet(ModelViewSet):
             except Exception:
                 intento.save()
         else:
-            # raw_request suele existir en el modelo como JSONField; lo usamos para persistir el qr_text
-            if hasattr(intento, "raw_request"):
-                try:
-                    intento.raw_request = {**(intento.raw_request or {}), "qr_text": qr_text}
-                    intento.save(update_fields=["raw_request"])
-                except Exception:
-                    intento.raw_request = {"qr_text": qr_text}
-                    intento.save()
+            # Sin 'payload' el qr_text va en raw_request, que vive en el side store de blobs
+            intento_blobs.guardar(intento, raw_request={"qr_text": qr_text})
 
         return Response(
             {"ok": True, "intento_id": intento.id, "qr_text": qr_text},
@@ -514,28 +535,13 @@ class PagoViewSet(ModelViewSet):
         pago = self.get_object()
         intento = None
         try:
-            intento = PagoIntento.objects.get(id=intento_id, pago__id=pago.id)
+            intento = PagoIntento.objects.defer(*PagoIntento.CAMPOS_BLOB).get(id=intento_id, pago__id=pago.id)
         except PagoIntento.DoesNotExist:
             return Response({"detail": "Intento no encontrado para este pago."}, status=404)
 
         with transaction.atomic():
-            # Marcar intento
-            if hasattr(intento, "estado"):
-                intento.estado = "APROBADO"
-                intento.save(update_fields=["estado"]) if intento.pk else intento.save()
-
-            # Marcar pago
-            if pago.estado != "APROBADO":
-                pago.estado = "APROBADO"
-                pago.save(update_fields=["estado"]) if pago.pk else pago.save()
-
-            # Recalcular cargos asociados
-            cargo_ids = list(pago.pagodetalle_set.values_list("cargo_id", flat=True))
-            try:
-                self._recalc_cargos(cargo_ids)
-            except Exception:
-                # no fallar si la función de la DB no existe en entorno de pruebas
-                pass
+            transicionar_intentos([intento.id], "APROBADO")
+            transicionar_pago(pago, "APROBADO")
 
         documento_id = pago.documento.id if pago.documento else None
         return Response({"ok": True, "documento_id": documento_id, "pago": PagoSerializer(pago).data})
@@ -579,7 +585,8 @@ class PagoViewSet(ModelViewSet):
         )
         unidad = det.cargo.unidad if det and det.cargo and det.cargo.unidad_id else None
 
-        # Crear intento para BNB
+        # Crear intento para BNB (vence junto con el QR en el banco)
+        vence_banco, expires_at = vencimiento_qr_bnb()
         intento = PagoIntento.objects.create(
             pago=pago,
             medio="QR",
@@ -587,6 +594,7 @@ class PagoViewSet(ModelViewSet):
             estado="CREADO",
             total=pago.monto,
             unidad=unidad if hasattr(PagoIntento, "unidad") else None,
+            expires_at=expires_at,
         )
 
         # Llamar a BNB – QR Simple
@@ -600,12 +608,12 @@ class PagoViewSet(ModelViewSet):
                 gloss=gloss,
                 amount=amount,
                 single_use=True,
-                expiration_date=None,  # setea YYYY-MM-DD si quieres caducar
+                expiration_date=vence_banco.isoformat(),
             )
         except BNBClientError as e:
-            intento.raw_response = {"error": str(e)}
             intento.estado = "RECHAZADO"
-            intento.save(update_fields=["raw_response", "estado"])
+            intento.save(update_fields=["estado"])
+            intento_blobs.guardar(intento, raw_response={"error": str(e)})
             return Response({"detail": str(e)}, status=502)
 
         qr_id = str(data.get("id") or data.get("qrId") or data.get("qr_id") or "")
@@ -616,12 +624,17 @@ class PagoViewSet(ModelViewSet):
                 img_b64 = base64.b64encode(bytes(qr_bytes)).decode("utf-8")
             except Exception:
                 img_b64 = ""
+        elif isinstance(qr_bytes, str):
+            img_b64 = qr_bytes  # ya viene en base64
 
         intento.bnb_qr_id = qr_id or intento.bnb_qr_id
-        intento.bnb_qr_image_b64 = img_b64 or intento.bnb_qr_image_b64
-        intento.bnb_payload = data
         intento.estado = "EN_PROCESO"
-        intento.save(update_fields=["bnb_qr_id","bnb_qr_image_b64","bnb_payload","estado"])
+        intento.save(update_fields=["bnb_qr_id","estado"])
+        # La imagen se guarda una vez: el payload no repite 'qr'
+        blobs = {"bnb_payload": {k: v for k, v in data.items() if k != "qr"}}
+        if img_b64:
+            blobs["bnb_qr_image_b64"] = img_b64
+        intento_blobs.guardar(intento, **blobs)
 
         qr_png_url = request.build_absolute_uri(f"/api/pagointentos/{intento.id}/qr.png")
 
@@ -629,56 +642,41 @@ class PagoViewSet(ModelViewSet):
             "ok": True,
             "intento_id": intento.id,
             "bnb_qr_id": intento.bnb_qr_id,
-            "qr_png_url": qr_png_url if intento.bnb_qr_image_b64 else None,
+            "qr_png_url": qr_png_url if img_b64 else None,
         }, status=200)
 
 
     @action(detail=True, methods=["get"], url_path="estado_qr_bnb")
     def estado_qr_bnb(self, request, pk=None):
         """
-        Consulta estado del QR en BNB y, si está usado (=2), marca el Pago como APROBADO
-        y recalcula cargos. Devuelve estados para polling del front.
+        Estado del QR BNB para polling del front. Con FINANZAS_BNB_POLLER el
+        comando poll_bnb consulta al banco y esto solo lee la fila local (salvo
+        que el intento lleve más de FINANZAS_BNB_POLLER_ATRASO s sin revisarse);
+        sin poller consulta al banco aquí. Si el QR está usado (=2) el Pago
+        queda APROBADO y se recalculan sus cargos.
         """
         pago = self.get_object()
         intento = (
             PagoIntento.objects.filter(pago=pago, medio="QR", pasarela="BNB")
-            .order_by("-id").first()
+            .defer(*PagoIntento.CAMPOS_BLOB).order_by("-id").first()
         )
         if not intento or not intento.bnb_qr_id:
             return Response({"detail": "No existe intento BNB con QR para este pago."}, status=404)
 
-        client = BNBClient()
-        try:
-            status_data = client.qr_simple_status(intento.bnb_qr_id)
-        except BNBClientError as e:
-            return Response({"detail": str(e)}, status=502)
-
-        code = status_data.get("qrId") or status_data.get("status") or status_data.get("qrIdStatus")
-        code_int = int(code) if str(code).isdigit() else None
-
-        intento.bnb_status_code = code_int
-        intento.bnb_payload = status_data
-        intento.save(update_fields=["bnb_status_code", "bnb_payload"])
-
-        # 1=No usado, 2=Usado, 3=Expirado, 4=Con error
-        if code_int == 2 and pago.estado != "APROBADO":
-            with transaction.atomic():
-                pago.estado = "APROBADO"
-                pago.save(update_fields=["estado"])
-                cargo_ids = list(pago.pagodetalle_set.values_list("cargo_id", flat=True))
-                try:
-                    self._recalc_cargos(cargo_ids)
-                except Exception:
-                    pass
-            intento.estado = "APROBADO"
-            intento.save(update_fields=["estado"])
-        elif code_int == 3:
-            intento.estado = "EXPIRO"
-            intento.save(update_fields=["estado"])
-        elif code_int == 4:
-            intento.estado = "RECHAZADO"
-            intento.save(update_fields=["estado"])
+        atraso = (timezone.now() - intento.actualizado_en).total_seconds()
+        consultar = intento.estado == "EN_PROCESO" and (
+            not getattr(settings, "FINANZAS_BNB_POLLER", False)
+            or atraso > getattr(settings, "FINANZAS_BNB_POLLER_ATRASO", 30)
+        )
+        if consultar:
+            try:
+                status_data = BNBClient().qr_simple_status(intento.bnb_qr_id)
+            except BNBClientError as e:
+                return Response({"detail": str(e)}, status=502)
+            aplicar_resultados([(intento, status_data)])
+            pago.refresh_from_db(fields=["estado"])
 
+        code_int = intento.bnb_status_code
         doc_id = pago.documento_id if getattr(pago, "documento_id", None) else None
         return Response({
             "intento_id": intento.id,
@@ -704,41 +702,65 @@ class DocumentoArchivoViewSet(ModelViewSet):
 class PagoIntentoViewSet(ModelViewSet):
     queryset = PagoIntento.objects.all()
     serializer_class = PagoIntentoSerializer
+    # Acciones que no devuelven los payloads pesados: no los traen de la base
+    ACCIONES_LIVIANAS = {"list", "qr_png", "qr_svg", "estado"}
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action in self.ACCIONES_LIVIANAS:
+            qs = qs.defer(*PagoIntento.CAMPOS_BLOB)
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return PagoIntentoListaSerializer
+        return super().get_serializer_class()
 
     @action(detail=True, methods=["get"], url_path="qr.png")
     def qr_png(self, request, pk=None):
-        """Devuelve el PNG del QR para el intento."""
-        b64img = getattr(intento, "bnb_qr_image_b64", None)
-        if b64img:
-            try:
-                data = base64.b64decode(b64img)
-                return HttpResponse(data, content_type="image/png")
-            except Exception:
-                pass  # sigue al fallback local
+        """Devuelve el PNG del QR para el intento (?formato=svg para SVG)."""
+        formato = "svg" if request.query_params.get("formato") == "svg" else "png"
+        return self._servir_qr(request, formato)
 
-        if qrcode is None:
-            return Response({"detail": "Servidor sin 'qrcode'."}, status=500)
+    @action(detail=True, methods=["get"], url_path="qr.svg")
+    def qr_svg(self, request, pk=None):
+        """Devuelve el QR del intento como SVG (escalable, sin PIL)."""
+        return self._servir_qr(request, "svg")
+
+    def _servir_qr(self, request, formato):
+        """
+        Imagen cacheada por huella del contenido (LRU en memoria + disco).
+        ETag fuerte = huella; el cliente que hace polling recibe 304 y la
+        cachea hasta que vence el intento.
+        """
         intento = self.get_object()
-        # Intentamos obtener el texto QR desde diferentes campos según cómo se guardó
-        payload = getattr(intento, "payload", None)
-        if not payload:
-            raw = getattr(intento, "raw_request", None)
-            if raw and isinstance(raw, dict) and raw.get("qr_text"):
-                payload = raw.get("qr_text")
-            elif raw and isinstance(raw, str):
-                try:
-                    parsed = json.loads(raw)
-                    payload = parsed.get("qr_text")
-                except Exception:
-                    payload = None
-        if not payload:
-            return Response({"detail": "Intento sin payload QR."}, status=404)
-        text = payload if isinstance(payload, str) else json.dumps(payload, separators=(",", ":"))
-        img = qrcode.make(text)
-        buff = BytesIO()
-        img.save(buff, format="PNG")
-        buff.seek(0)
-        return HttpResponse(buff.read(), content_type="image/png")
+        intento_blobs.cargar([intento], ["raw_request", "bnb_qr_image_b64"])
+        texto = texto_qr_intento(intento)
+        b64img = intento_blobs.leer(intento, "bnb_qr_image_b64")
+        try:
+            if b64img and (formato == "png" or not texto):
+                if formato == "svg":
+                    return Response({"detail": "El QR del banco solo está disponible en PNG."}, status=404)
+                data, huella = imagen_desde_b64(b64img)
+            elif texto:
+                data, huella = imagen_desde_texto(texto, formato)
+            else:
+                return Response({"detail": "Intento sin payload QR."}, status=404)
+        except RuntimeError as e:
+            return Response({"detail": str(e)}, status=500)
+        except ValueError:
+            return Response({"detail": "Imagen QR del banco inválida."}, status=502)
+
+        etag = quote_etag(huella)
+        cache_control = cache_control_hasta(expiracion_intento(intento, texto))
+        no_modificado = get_conditional_response(request, etag=etag)
+        if no_modificado is None:
+            resp = HttpResponse(data, content_type=QR_FORMATOS[formato])
+        else:
+            resp = no_modificado
+        resp["ETag"] = etag
+        resp["Cache-Control"] = cache_control
+        return resp
 
     @action(detail=True, methods=["get"])
     def estado(self, request, pk=None):
@@ -764,6 +786,7 @@ class EstadoCuentaUnidadViewSet(ReadOnlyModelViewSet):
 
     @action(detail=False, methods=["get"], url_path="unidad/(?P<unidad_id>[^/.]+)")
     def list_por_unidad(self, request, unidad_id=None):
+        """Lee la tabla estado_cuenta; (unidad_id, periodo, cargo_id) permite index-only scan."""
         qs = self.queryset.filter(unidad_id=unidad_id)
         d = request.query_params.get("desde")
         h = request.query_params.get("hasta")
@@ -773,8 +796,14 @@ class EstadoCuentaUnidadViewSet(ReadOnlyModelViewSet):
         if h:
             ph = parse_date(h);  qs = qs.filter(periodo__lte=ph) if ph else qs
         if e:
-            from django.db import models as djm
-            qs = qs.filter(djm.Q(estado_calculado=e) | djm.Q(estado_registrado=e))
+            # estado_calculado a hoy (EstadoCuentaUnidad.estado_al), no el guardado en la fila
+            hoy = timezone.localdate()
+            calculado = {
+                "PAGADO": Q(saldo__lte=0),
+                "VENCIDO": Q(saldo__gt=0, vencimiento__lt=hoy),
+                "PENDIENTE": Q(saldo__gt=0) & ~Q(vencimiento__lt=hoy),
+            }
+            qs = qs.filter(calculado.get(e, Q(pk__in=[])) | Q(estado_registrado=e))
         page = self.paginate_queryset(qs)
         if page is not None:
             ser = EstadoCuentaUnidadSerializer(page, many=True)
@@ -783,6 +812,61 @@ class EstadoCuentaUnidadViewSet(ReadOnlyModelViewSet):
         return Response(ser.data)
 
 
+# -------------------------------
+# Reportes
+# -------------------------------
+class ReportesViewSet(ViewSet):
+    """Reportes agregados (sin modelo propio): finanzas/reportes/<acción>/."""
+
+    @action(detail=False, methods=["get"])
+    def resumen(self, request):
+        """
+        Facturado, recargos, recaudado, pendiente y morosos desde el rollup
+        resumen_finanzas. Query: condominio?, concepto?, desde?, hasta?
+        (periodos), agrupar=periodo|anio|concepto|condominio (lista con comas).
+        """
+        params = ReporteResumenSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        return Response(resumen_finanzas(
+            agrupar=data["agrupar"], condominio_id=data.get("condominio"), concepto_id=data.get("concepto"),
+            desde=data.get("desde"), hasta=data.get("hasta"),
+        ))
+
+    @action(detail=False, methods=["get"])
+    def morosidad(self, request):
+        """
+        Saldos vencidos por tramos de antigüedad (1-30, 31-60, 61-90, +90
+        días) a la fecha de corte. Query: condominio?, fecha?, top? (unidades
+        que más deben), formato=json|csv (csv: todas las unidades).
+        """
+        params = ReporteMorosidadSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        fecha = data.get("fecha") or timezone.localdate()
+        if data["formato"] == "csv":
+            resp = StreamingHttpResponse(
+                _csv_morosidad(morosidad_unidades(fecha, data.get("condominio"))),
+                content_type="text/csv; charset=utf-8",
+            )
+            resp["Content-Disposition"] = f'attachment; filename="morosidad-{fecha:%Y%m%d}.csv"'
+            return resp
+        return Response(morosidad(fecha, condominio_id=data.get("condominio"), top=data["top"]))
+
+
+class _Eco:
+    """Archivo de mentira para csv.writer: devuelve la línea en vez de guardarla."""
+    def write(self, valor):
+        return valor
+
+
+def _csv_morosidad(filas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(("condominio_id", "unidad_id", "unidad") + COLUMNAS_MOROSIDAD)
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
 # -------------------------------
 # Pasarela FAKE (demo)
 # -------------------------------
@@ -790,7 +874,7 @@ def fake_checkout(request, intento_id: int):
     """
     Pantalla mínima para simular APROBAR/FALLAR desde el navegador.
     """
-    intento = get_object_or_404(PagoIntento, id=intento_id)
+    intento = get_object_or_404(PagoIntento.objects.defer(*PagoIntento.CAMPOS_BLOB), id=intento_id)
     html = f"""
     <html><body style="font-family:sans-serif">
       <h3>Pasarela FAKE</h3>
@@ -808,7 +892,9 @@ def fake_checkout(request, intento_id: int):
 @csrf_exempt
 def fake_webhook(request):
     """
-    Webhook de demo: marca el Pago/PagoIntento según 'status' (approved/failed).
+    Webhook de demo: guarda el callback en la bandeja (deduplicado por
+    event_id; sin él, por intento+status) y responde de inmediato. El
+    Pago/PagoIntento se actualiza en segundo plano (ver webhooks.py).
     """
     if request.method != "POST":
         return HttpResponse("Only POST", status=405)
@@ -817,21 +903,107 @@ def fake_webhook(request):
     if not intento_id or status_flag not in ("approved", "failed"):
         return HttpResponse("Bad payload", status=400)
 
-    intento = get_object_or_404(PagoIntento, id=intento_id)
-    pago = intento.pago
+    intento = PagoIntento.objects.filter(id=intento_id).values("id", "pago_id").first()
+    if intento is None:
+        raise Http404("Intento no existe")
+
+    evento_id = request.POST.get("event_id") or f"{intento['id']}:{status_flag}"
+    nuevo = registrar_evento(
+        "fake", evento_id, {"intento_id": intento["id"], "status": status_flag},
+        pago_id=intento["pago_id"], intento_id=intento["id"],
+    )
+    if nuevo:
+        programar_procesamiento(intento["pago_id"])
+    return HttpResponse("ok")
 
-    with transaction.atomic():
-        if hasattr(intento, "estado"):
-            intento.estado = "APROBADO" if status_flag == "approved" else "FALLIDO"
-            intento.save(update_fields=["estado"])
 
-        if status_flag == "approved" and pago.estado != "APROBADO":
-            pago.estado = "APROBADO"
-            pago.save(update_fields=["estado"])
-            cargo_ids = list(pago.pagodetalle_set.values_list("cargo_id", flat=True))
-            try:
-                PagoViewSet._recalc_cargos(PagoViewSet, cargo_ids)
-            except Exception:
-                pass
+# -------------------------------
+# Espera de estado sin polling (ASGI)
+# -------------------------------
+def _access_token(request):
+    """
+    Valida el access JWT (header Bearer o ?access=, porque EventSource no
+    permite headers) solo con la firma: no toca la base.
+    """
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
 
-    return HttpResponse("ok")
+    auth = request.headers.get("Authorization", "")
+    raw = auth[7:] if auth.startswith("Bearer ") else request.GET.get("access")
+    if not raw:
+        return None
+    try:
+        return AccessToken(raw)
+    except TokenError:
+        return None
+
+
+def _sin_asgi(request):
+    """
+    501 si la vista async llegó por WSGI (gunicorn mysite.wsgi): ahí Django
+    corre cada request en un event loop propio (async_to_sync), con su Hub y
+    su conexión LISTEN, y el stream retiene un worker síncrono toda la espera.
+    Estas rutas se sirven desde mysite.asgi; por WSGI se usa el polling de
+    pagointentos/<id>/estado/.
+    """
+    if isinstance(request, ASGIRequest):
+        return None
+    return JsonResponse(
+        {"detail": "Disponible solo con servidor ASGI (mysite.asgi); use pagointentos/<id>/estado/."},
+        status=501,
+    )
+
+
+async def intento_eventos(request, intento_id: int):
+    """
+    SSE con el estado del intento/pago: un evento al conectar y otro por
+    cada cambio (NOTIFY de Postgres); se cierra al llegar a un estado final.
+    Solo ASGI: cada cliente es una corrutina, no un worker.
+    """
+    rechazo = _sin_asgi(request)
+    if rechazo is not None:
+        return rechazo
+    if _access_token(request) is None:
+        return JsonResponse({"detail": "No autenticado."}, status=401)
+    espera = Espera(intento_id)
+    if await espera.abrir() is None:
+        espera.cerrar()
+        return JsonResponse({"detail": "Intento no existe."}, status=404)
+    resp = StreamingHttpResponse(
+        flujo_sse(
+            espera,
+            duracion=getattr(settings, "FINANZAS_EVENTOS_DURACION", 600),
+            latido=getattr(settings, "FINANZAS_EVENTOS_LATIDO", 15),
+        ),
+        content_type="text/event-stream",
+    )
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: no acumular el stream
+    return resp
+
+
+async def intento_esperar(request, intento_id: int):
+    """
+    Long-poll: con ?estado_intento=&estado_pago= (lo que el cliente ya
+    conoce) responde apenas cambie o tras ?timeout= s (máx. 55) con el
+    estado actual. Alternativa a SSE para clientes que no lo soportan (solo ASGI).
+    """
+    rechazo = _sin_asgi(request)
+    if rechazo is not None:
+        return rechazo
+    if _access_token(request) is None:
+        return JsonResponse({"detail": "No autenticado."}, status=401)
+    espera = Espera(intento_id)
+    snapshot = await espera.abrir()
+    if snapshot is None:
+        espera.cerrar()
+        return JsonResponse({"detail": "Intento no existe."}, status=404)
+    conocido = (request.GET.get("estado_intento"), request.GET.get("estado_pago"))
+    if conocido != (snapshot["estado_intento"], snapshot["estado_pago"]) or es_final(snapshot):
+        espera.cerrar()
+        return JsonResponse(snapshot)
+    try:
+        timeout = min(max(float(request.GET.get("timeout", 25)), 1.0), 55.0)
+    except ValueError:
+        timeout = 25.0
+    return JsonResponse(await esperar_cambio(espera, timeout))
@@ -0,0 +1,249 @@
+# myapp/finanzas/webhooks.py
+"""
+Bandeja de webhooks de pasarelas.
+
+La vista solo guarda el evento crudo (INSERT ... ON CONFLICT DO NOTHING
+sobre (proveedor, evento_id): un reintento de la pasarela no entra dos
+veces) y responde; el efecto (aprobar pago, recalcular cargos, recibo) se
+aplica después, en orden de llegada por pago:
+- en un hilo de fondo de este proceso (FINANZAS_WEBHOOKS_EN_PROCESO); lo que
+  quede PENDIENTE (un evento que falló, o la cola en memoria de un proceso
+  que cayó) lo retoma iniciar_reintentos cada FINANZAS_WEBHOOKS_REINTENTO s
+  desde el primer webhook que recibe el proceso. Tras un reinicio sin
+  webhooks nuevos nadie barre: para eso, `procesar_webhooks --una_vez`
+  (p. ej. en el release del deploy), o
+- en el comando procesar_webhooks, que despierta con NOTIFY finanzas_webhooks.
+Un advisory lock por pago evita que dos procesadores tomen el mismo pago
+(quien lo tiene relee hasta vaciar los pendientes del pago); pagos distintos
+se procesan en paralelo.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import PagoIntento, WebhookEvento
+from .transiciones import transicionar_intentos, transicionar_pagos
+
+logger = logging.getLogger(__name__)
+
+CANAL = "finanzas_webhooks"
+# Primera clave de pg_advisory_xact_lock(int, int) para locks de webhooks por pago
+LOCK_WEBHOOKS = 7301
+MAX_INTENTOS = 5
+
+
+# -------------------------------
+# Ingreso
+# -------------------------------
+def registrar_evento(proveedor, evento_id, payload, pago_id=None, intento_id=None):
+    """Guarda el evento; devuelve su id, o None si ya existía (duplicado)."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.webhooks_eventos
+                   (proveedor, evento_id, pago_id, intento_id, payload, estado, intentos, recibido_en)
+            VALUES (%s, %s, %s, %s, %s::jsonb, 'PENDIENTE', 0, now())
+            ON CONFLICT (proveedor, evento_id) DO NOTHING
+            RETURNING id
+            """,
+            [proveedor, str(evento_id), pago_id, intento_id, json.dumps(payload)],
+        )
+        fila = cur.fetchone()
+        if fila:
+            cur.execute("SELECT pg_notify(%s, %s)", [CANAL, str(pago_id or 0)])
+    return fila[0] if fila else None
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(getattr(settings, "FINANZAS_WEBHOOKS_HILOS", 2) or 1),
+            thread_name_prefix="webhooks",
+        )
+    return _executor
+
+
+def _procesar_en_fondo(pago_id):
+    close_old_connections()
+    try:
+        procesar_pago(pago_id, esperar=True)
+    except Exception:
+        logger.exception("No se pudieron procesar los webhooks del pago %s", pago_id)
+    finally:
+        close_old_connections()
+
+
+def programar_procesamiento(pago_id):
+    """Tras el commit, procesa en segundo plano los pendientes del pago (si no hay worker aparte)."""
+    if not getattr(settings, "FINANZAS_WEBHOOKS_EN_PROCESO", True):
+        return
+    iniciar_reintentos()
+    transaction.on_commit(lambda: _get_executor().submit(_procesar_en_fondo, pago_id))
+
+
+_reintentos_pid = None
+_reintentos_lock = threading.Lock()
+
+
+def iniciar_reintentos():
+    """
+    Arranca (una vez por proceso, al programar el primer webhook) el hilo que
+    cada FINANZAS_WEBHOOKS_REINTENTO s procesa los pagos con eventos
+    PENDIENTE de más de ese tiempo. Solo con FINANZAS_WEBHOOKS_EN_PROCESO:
+    si no, el comando procesar_webhooks ya recorre la bandeja.
+    """
+    global _reintentos_pid
+    intervalo = float(getattr(settings, "FINANZAS_WEBHOOKS_REINTENTO", 60) or 0)
+    if not getattr(settings, "FINANZAS_WEBHOOKS_EN_PROCESO", True) or intervalo <= 0:
+        return
+    with _reintentos_lock:
+        # por pid: un hilo arrancado antes de un fork no existe en el hijo
+        if _reintentos_pid == os.getpid():
+            return
+        _reintentos_pid = os.getpid()
+    threading.Thread(target=_reintentar, args=(intervalo,), name="webhooks-reintentos", daemon=True).start()
+
+
+def _reintentar(intervalo):
+    while True:
+        time.sleep(intervalo)
+        close_old_connections()
+        try:
+            procesados, fallidos = procesar_pendientes(antiguedad=intervalo)
+            if procesados or fallidos:
+                logger.info("Webhooks retomados: %s procesados, %s fallidos", procesados, fallidos)
+        except Exception:
+            logger.exception("No se pudieron retomar los webhooks pendientes")
+        finally:
+            close_old_connections()
+
+
+# -------------------------------
+# Procesadores por proveedor
+# -------------------------------
+PROCESADORES = {}
+
+
+def procesador(proveedor):
+    def registrar(fn):
+        PROCESADORES[proveedor] = fn
+        return fn
+    return registrar
+
+
+@procesador("fake")
+def _procesar_fake(evento):
+    """Pasarela de demo: {'intento_id', 'status': approved|failed}."""
+    aprobado = evento.payload.get("status") == "approved"
+    intento = PagoIntento.objects.filter(id=evento.payload.get("intento_id")).values("id", "pago_id").first()
+    if intento is None:
+        return "IGNORADO"
+    transicionar_intentos([intento["id"]], "APROBADO" if aprobado else "FALLIDO")
+    if aprobado and intento["pago_id"]:
+        transicionar_pagos([intento["pago_id"]], "APROBADO")
+    return "PROCESADO"
+
+
+# -------------------------------
+# Procesamiento ordenado
+# -------------------------------
+def procesar_pago(pago_id, esperar=False):
+    """
+    Procesa en orden de id los pendientes de un pago (pago_id None = eventos
+    sin pago). Si otro procesador tiene el pago, no hace nada; con 'esperar'
+    (tarea de fondo de este proceso) espera a que lo suelte, para no dejar un
+    evento recién llegado a cargo del barrido. Con el lock tomado vuelve a
+    leer hasta que no quedan pendientes: lo que entra mientras se procesa
+    también se atiende aquí. Un evento que falla queda PENDIENTE (con el
+    error) y corta la tanda para no adelantar los siguientes; tras
+    MAX_INTENTOS pasa a ERROR y se sigue.
+    Devuelve (procesados, fallidos).
+    """
+    procesados = fallidos = 0
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            if esperar:
+                cur.execute(
+                    "SELECT pg_advisory_xact_lock(%s, (%s %% 2147483647)::int)",
+                    [LOCK_WEBHOOKS, pago_id or 0],
+                )
+            else:
+                cur.execute(
+                    "SELECT pg_try_advisory_xact_lock(%s, (%s %% 2147483647)::int)",
+                    [LOCK_WEBHOOKS, pago_id or 0],
+                )
+                if not cur.fetchone()[0]:
+                    return 0, 0
+
+        pendientes = WebhookEvento.objects.filter(estado="PENDIENTE").order_by("id")
+        pendientes = pendientes.filter(pago_id=pago_id) if pago_id else pendientes.filter(pago__isnull=True)
+        ultimo = 0
+        while True:
+            # READ COMMITTED: cada lectura ve los eventos confirmados mientras tanto
+            eventos = list(pendientes.filter(id__gt=ultimo))
+            if not eventos:
+                break
+            for ev in eventos:
+                ultimo = ev.id
+                fn = PROCESADORES.get(ev.proveedor)
+                try:
+                    if fn is None:
+                        raise ValueError(f"Proveedor sin procesador: {ev.proveedor}")
+                    with transaction.atomic():
+                        ev.estado = fn(ev) or "PROCESADO"
+                    ev.procesado_en = timezone.now()
+                    ev.error = None
+                    procesados += 1
+                except Exception as e:
+                    fallidos += 1
+                    ev.intentos += 1
+                    ev.error = str(e)[:2000]
+                    if ev.intentos >= MAX_INTENTOS:
+                        ev.estado = "ERROR"
+                        logger.error("Webhook %s/%s descartado tras %s intentos: %s",
+                                     ev.proveedor, ev.evento_id, ev.intentos, e)
+                ev.save(update_fields=["estado", "intentos", "error", "procesado_en"])
+                if ev.estado == "PENDIENTE":
+                    return procesados, fallidos
+    return procesados, fallidos
+
+
+def pagos_con_pendientes(limite=100, antiguedad=None):
+    """
+    Pagos con eventos pendientes, el de evento más antiguo primero. Con
+    'antiguedad' (segundos) solo los que tienen un pendiente recibido antes.
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT pago_id FROM public.webhooks_eventos
+             WHERE estado = 'PENDIENTE'
+             GROUP BY pago_id
+            HAVING %s::float IS NULL OR min(recibido_en) < now() - make_interval(secs => %s::float)
+             ORDER BY min(id)
+             LIMIT %s
+            """,
+            [antiguedad, antiguedad, limite],
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def procesar_pendientes(limite_pagos=100, antiguedad=None):
+    """Una pasada sobre los pagos con pendientes; devuelve (procesados, fallidos)."""
+    procesados = fallidos = 0
+    for pago_id in pagos_con_pendientes(limite_pagos, antiguedad):
+        p, f = procesar_pago(pago_id)
+        procesados += p
+        fallidos += f
+    return procesados, fallidos
@@ -5,6 +5,15 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Las vistas de espera de pagos (api/pagointentos/<id>/eventos/ y .../esperar/)
+son async y mantienen la conexión abierta: solo se sirven desde aquí, con un
+servidor ASGI (p. ej. uvicorn/daphne), donde cada cliente es una corrutina.
+Por mysite.wsgi (gunicorn, Procfile) responden 501 y el cliente usa el
+polling de pagointentos/<id>/estado/. Para habilitarlas sin mover todo el
+sitio, levantar aparte p. ej.
+    uvicorn mysite.asgi:application --port 8001
+y enrutar en el proxy esas dos rutas a ese puerto.
 """
 
 import os
@@ -263,6 +263,43 @@ PAYMENT_MERCHANT = {
     "merchant_id": os.getenv("PAY_MERCHANT_ID", ""),  # si luego te lo asigna el banco
 }
 
+# ======================================
+# Finanzas
+# ======================================
+# Números de recibo reservados por proceso (1 = sin huecos, numerado dentro de la transacción)
+FINANZAS_NUMERO_BLOQUE = int(os.getenv("FINANZAS_NUMERO_BLOQUE", "1"))
+# Recibos PDF: pre-generar al aprobar un pago, con N hilos en segundo plano
+FINANZAS_PDF_PRERENDER = os.getenv("FINANZAS_PDF_PRERENDER", "true").lower() == "true"
+FINANZAS_PDF_WORKERS = int(os.getenv("FINANZAS_PDF_WORKERS", "2"))
+# >0: los PDF se generan en un pool de procesos con el renderizador precargado
+FINANZAS_PDF_PROCESOS = int(os.getenv("FINANZAS_PDF_PROCESOS", "0"))
+# Descargas: "" (Django envía el archivo), "x-accel" (nginx) o "x-sendfile" (Apache/lighttpd)
+FINANZAS_DESCARGA_OFFLOAD = os.getenv("FINANZAS_DESCARGA_OFFLOAD", "")
+FINANZAS_DESCARGA_ACCEL_PREFIJO = os.getenv("FINANZAS_DESCARGA_ACCEL_PREFIJO", "/protected-media/")
+# Copia local de documentos remotos (tope en MB, revalidación en segundos) y pool HTTP
+FINANZAS_REMOTOS_CACHE_MB = int(os.getenv("FINANZAS_REMOTOS_CACHE_MB", "512"))
+FINANZAS_REMOTOS_TTL = int(os.getenv("FINANZAS_REMOTOS_TTL", "86400"))
+FINANZAS_HTTP_POOL = int(os.getenv("FINANZAS_HTTP_POOL", "10"))
+FINANZAS_HTTP_TIMEOUT = float(os.getenv("FINANZAS_HTTP_TIMEOUT", "15"))
+# Imágenes QR cacheadas en memoria por proceso (además de MEDIA_ROOT/qr)
+FINANZAS_QR_CACHE_ITEMS = int(os.getenv("FINANZAS_QR_CACHE_ITEMS", "512"))
+# true = el comando poll_bnb consulta los QR BNB pendientes y estado_qr_bnb solo lee la base
+# (vuelve a consultar al banco si un intento lleva más de ..._ATRASO segundos sin revisarse)
+FINANZAS_BNB_POLLER = os.getenv("FINANZAS_BNB_POLLER", "false").lower() == "true"
+FINANZAS_BNB_POLLER_ATRASO = int(os.getenv("FINANZAS_BNB_POLLER_ATRASO", "30"))
+# Días de validez del QR en el BNB (el intento vence al terminar ese día; ver expirar_intentos)
+FINANZAS_QR_BNB_VIGENCIA_DIAS = int(os.getenv("FINANZAS_QR_BNB_VIGENCIA_DIAS", "1"))
+# SSE/long-poll de estado de intentos (LISTEN finanzas_pagos; solo ASGI, por WSGI responden 501: ver mysite/asgi.py)
+FINANZAS_EVENTOS_LISTEN = os.getenv("FINANZAS_EVENTOS_LISTEN", "true").lower() == "true"
+FINANZAS_EVENTOS_DURACION = int(os.getenv("FINANZAS_EVENTOS_DURACION", "600"))
+FINANZAS_EVENTOS_LATIDO = int(os.getenv("FINANZAS_EVENTOS_LATIDO", "15"))
+# Webhooks de pasarelas: true = se procesan en hilos de este proceso tras guardarlos;
+# false = los procesa el comando procesar_webhooks (worker aparte)
+FINANZAS_WEBHOOKS_EN_PROCESO = os.getenv("FINANZAS_WEBHOOKS_EN_PROCESO", "true").lower() == "true"
+FINANZAS_WEBHOOKS_HILOS = int(os.getenv("FINANZAS_WEBHOOKS_HILOS", "2"))
+# En proceso: cada cuántos segundos se retoman los pendientes más viejos que eso (0 = nunca)
+FINANZAS_WEBHOOKS_REINTENTO = int(os.getenv("FINANZAS_WEBHOOKS_REINTENTO", "60"))
+
 # ======================================
 BNB_CFG = {
     "ACCOUNT_ID": os.getenv("BNB_ACCOUNT_ID"),
@@ -272,6 +309,13 @@ BNB_CFG = {
     "ACCOUNT_BASE": os.getenv("BNB_ACCOUNT_BASE"),
     "ENTERPRISE_BASE": os.getenv("BNB_ENTERPRISE_BASE"),
     "TIMEOUT": int(os.getenv("BNB_TIMEOUT", "15")),
+    # Cliente finanzas/bnb.py: conexión, pool keep-alive, reintentos y circuit breaker
+    "CONNECT_TIMEOUT": float(os.getenv("BNB_CONNECT_TIMEOUT", "3")),
+    "POOL": int(os.getenv("BNB_POOL", "20")),
+    "RETRIES": int(os.getenv("BNB_RETRIES", "2")),
+    "BACKOFF": float(os.getenv("BNB_BACKOFF", "0.2")),
+    "BREAKER_FALLAS": int(os.getenv("BNB_BREAKER_FALLAS", "5")),
+    "BREAKER_ENFRIAMIENTO": float(os.getenv("BNB_BREAKER_ENFRIAMIENTO", "30")),
 }
 # ======================================
 